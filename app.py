@@ -3,12 +3,10 @@
 FAX注文書画像をアップロードして、店舗ごとの出荷ラベルPDFを生成
 """
 import streamlit as st
-import google.generativeai as genai
 from PIL import Image
 import pandas as pd
 from pdf_generator import LabelPDFGenerator
-import tempfile
-import os
+import io
 import json
 from datetime import datetime, timedelta
 from collections import defaultdict
@@ -17,20 +15,22 @@ import traceback
 
 # 設定管理モジュールのインポート
 from config_manager import (
-    load_stores, save_stores, add_store, remove_store,
+    load_stores, save_stores, add_store,
     load_items, save_items, add_item_variant, add_new_item, remove_item,
     auto_learn_store, auto_learn_item,
-    load_units, lookup_unit, add_unit_if_new, set_unit, initialize_default_units,
-    load_item_settings, save_item_settings, get_item_setting, set_item_setting, set_item_receive_as_boxes, remove_item_setting,
-    load_item_spec_master, save_item_spec_master,
+    load_units, lookup_unit, add_unit_if_new, set_units_bulk, initialize_default_units,
+    load_item_settings, save_item_settings, migrate_item_settings, get_item_setting, set_item_setting, set_item_receive_as_boxes, remove_item_setting,
+    load_item_spec_master, save_item_spec_master, sheets_txn,
     DEFAULT_ITEM_SETTINGS, get_box_count_items,
-    get_effective_unit_size, get_min_shipping_unit, get_known_specs_for_item, is_spec_in_master, get_default_spec_for_item,
+    get_default_spec_for_item,
+    get_min_shipping_unit_cached, get_known_specs_for_item_cached, is_spec_in_master_cached, invalidate_caches,
     extract_unit_size_from_spec,
+    ITEMS_FILE, ITEM_SPEC_MASTER_FILE, ITEM_SETTINGS_FILE,
 )
 from email_config_manager import load_email_config, save_email_config, detect_imap_server, load_sender_rules, save_sender_rules
 from email_reader import check_email_for_orders
-from delivery_converter import v2_result_to_delivery_rows, v2_result_to_ledger_rows, ledger_rows_to_v2_format_with_units
-from delivery_sheet_writer import append_delivery_rows, append_ledger_rows, fetch_ledger_rows, update_ledger_row_by_id, update_ledger_rows_unit_price_bulk, set_ledger_rows_confirmed, is_sheet_configured
+from delivery_converter import v2_result_to_delivery_rows, v2_result_to_ledger_rows, ledger_rows_to_v2_format_with_units, delivery_rows_to_csv_bytes, reissue_delivery_ids
+from delivery_sheet_writer import append_delivery_rows, append_ledger_rows, fetch_ledger_rows, batch_update_ledger_rows, update_ledger_rows_unit_price_bulk, set_ledger_rows_confirmed, is_sheet_configured
 from error_display_util import format_error_display
 try:
     from delivery_sheet_writer import fetch_ledger_confirmed_dates
@@ -39,7 +39,7 @@ except ImportError:
 from order_processing import (
     safe_int,
     parse_order_image, parse_order_text, validate_and_fix_order_data,
-    normalize_item_name, validate_store_name
+    normalize_item_name_cached, validate_store_name
 )
 from box_remainder_calc import total_to_boxes_remainder
 import sheets_config
@@ -217,18 +217,171 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# セッション状態の初期化
-if 'api_key' not in st.session_state:
+# Secrets は再実行ごとに TOML を読まないよう、プレーンな dict に展開して 5 分間使い回す（差し替えた値もその後に反映される）
+@st.cache_data(ttl=300, show_spinner=False)
+def _load_secrets() -> dict:
+    """st.secrets から必要な値だけを取り出したスナップショット。読み込みに失敗したら例外のまま（キャッシュしない）。"""
+    s = st.secrets if hasattr(st, 'secrets') else None
+    return {
+        'GEMINI_API_KEY': s.get('GEMINI_API_KEY', '') if s else '',
+        'DELIVERY_SPREADSHEET_ID': s.get('DELIVERY_SPREADSHEET_ID', '') if s else '',
+        'email': dict(s.get('email', {})) if s else {},
+        'gcp': dict(s.get('gcp', {})) if s else {},
+    }
+
+
+def _secrets() -> dict:
+    """Secrets のスナップショット（未設定・読み込み失敗時は空値。失敗は次回の呼び出しで読み直す）。"""
     try:
-        if hasattr(st, 'secrets'):
-            try:
-                st.session_state.api_key = st.secrets.get('GEMINI_API_KEY', '')
-            except Exception:
-                st.session_state.api_key = ''
-        else:
-            st.session_state.api_key = ''
+        return _load_secrets()
     except Exception:
-        st.session_state.api_key = ''
+        return {'GEMINI_API_KEY': '', 'DELIVERY_SPREADSHEET_ID': '', 'email': {}, 'gcp': {}}
+
+
+# 台帳の読み取りは同じ条件なら 60 秒キャッシュし、再実行のたびに Sheets へ問い合わせない。
+# 書き込み後は _clear_ledger_cache() で破棄して最新の内容を読み直す。
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_fetch_ledger_rows(sid, sheet_name, only_unconfirmed=True, only_confirmed=False, only_zero_unit_price=False, delivery_date_from=None, delivery_date_to=None):
+    return fetch_ledger_rows(
+        sid,
+        sheet_name=sheet_name,
+        only_unconfirmed=only_unconfirmed,
+        only_confirmed=only_confirmed,
+        only_zero_unit_price=only_zero_unit_price,
+        delivery_date_from=delivery_date_from,
+        delivery_date_to=delivery_date_to,
+        st_secrets=_secrets(),
+    )
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_fetch_ledger_confirmed_dates(sid, sheet_name):
+    return fetch_ledger_confirmed_dates(sid, sheet_name=sheet_name, st_secrets=_secrets())
+
+
+def _clear_ledger_cache():
+    """台帳読み取りキャッシュを破棄する（台帳への書き込み・取得失敗の後に呼ぶ）。"""
+    _cached_fetch_ledger_rows.clear()
+    _cached_fetch_ledger_confirmed_dates.clear()
+
+
+def _fetch_ledger_rows(sid, sheet_name, **filters):
+    """キャッシュ経由で台帳行を取得する。失敗結果はキャッシュに残さない。"""
+    ok, msg, rows = _cached_fetch_ledger_rows(sid, sheet_name, **filters)
+    if not ok:
+        _clear_ledger_cache()
+    return ok, msg, rows
+
+
+# マスタ類（店舗・品目・規格・送信者ルール）は再実行のたびにファイルや Sheets を読み直さないようキャッシュする。
+# 書き込み後は _clear_master_cache() で破棄する（Sheets 側のキャッシュに合わせて最長 120 秒で読み直す）。
+@st.cache_data(ttl=120, show_spinner=False)
+def _cached_load_stores():
+    return load_stores()
+
+
+@st.cache_data(ttl=120, show_spinner=False)
+def _cached_load_items():
+    return load_items()
+
+
+@st.cache_data(ttl=120, show_spinner=False)
+def _cached_load_item_settings():
+    return load_item_settings()
+
+
+@st.cache_data(ttl=120, show_spinner=False)
+def _cached_load_item_spec_master():
+    return load_item_spec_master()
+
+
+@st.cache_data(ttl=120, show_spinner=False)
+def _cached_load_sender_rules():
+    return load_sender_rules()
+
+
+def _clear_master_cache():
+    """マスタ読み込みキャッシュを破棄する（マスタ・店舗・送信者ルールを書き換えた後に呼ぶ）。"""
+    _cached_load_stores.clear()
+    _cached_load_items.clear()
+    _cached_load_item_settings.clear()
+    _cached_load_item_spec_master.clear()
+    _cached_load_sender_rules.clear()
+    invalidate_caches()
+
+
+def _master_version():
+    """品目・規格マスタ・品目設定の更新を検知するキー（JSON の更新時刻と Sheets キャッシュの取得時刻）。"""
+    def _mtime(path):
+        try:
+            return path.stat().st_mtime_ns
+        except OSError:
+            return 0
+    return (_mtime(ITEMS_FILE), _mtime(ITEM_SPEC_MASTER_FILE), _mtime(ITEM_SETTINGS_FILE), sheets_config.cache_timestamp())
+
+
+def _parse_ymd(s):
+    """YYYY-MM-DD 文字列を date に変換する（空・不正なら None）。"""
+    try:
+        return datetime.strptime(s, "%Y-%m-%d").date() if s else None
+    except (ValueError, TypeError):
+        return None
+
+
+def _page_window(total, key, sizes=(50, 100, 200, 500), default_index=1):
+    """表示件数・ページ番号の入力欄を出し、表示する行範囲 (start, end) を返す。大きな表を一度に描画しないため。"""
+    col_size, col_page = st.columns(2)
+    with col_size:
+        page_size = st.selectbox("表示件数", list(sizes), index=default_index, key=f"{key}_page_size")
+    max_pages = max(1, -(-total // page_size))
+    # 件数が減ってページ数を超えた場合は先頭ページに戻す（ウィジェット生成前のみ変更可）
+    if st.session_state.get(f"{key}_page", 1) > max_pages:
+        st.session_state[f"{key}_page"] = 1
+    with col_page:
+        page = st.number_input("ページ", min_value=1, max_value=max_pages, value=1, step=1, key=f"{key}_page")
+    start = (int(page) - 1) * page_size
+    end = min(start + page_size, total)
+    if total > page_size:
+        st.caption(f"全{total}件中 {start + 1}〜{end}件を表示（{int(page)}/{max_pages}ページ）")
+    return start, end
+
+
+# 台帳編集で保存対象にする列（チェックも台帳に書き戻す）
+LEDGER_EDITABLE_COLUMNS = ["数量", "確定フラグ", "農家", "チェック"]
+
+
+def _normalize_ledger_for_diff(frame):
+    """納品IDを index とし、編集対象列を比較しやすい型に揃えたフレームを返す（納品ID なし・重複は除外）。"""
+    frame = frame[frame["納品ID"].fillna("").astype(str) != ""].drop_duplicates("納品ID").set_index("納品ID")
+    out = pd.DataFrame(index=frame.index)
+    for c in LEDGER_EDITABLE_COLUMNS:
+        if c not in frame.columns:
+            continue
+        if c == "数量":
+            out[c] = pd.to_numeric(frame[c], errors="coerce").fillna(0).astype(int)
+        elif c == "チェック":
+            out[c] = frame[c].astype(str)
+        else:
+            out[c] = frame[c].fillna("").astype(str)
+    return out
+
+
+def _ledger_row_hashes(frame):
+    """納品IDごとの編集対象列のハッシュ。保存時に変更のない行を列比較の前に除外するために使う。"""
+    return pd.util.hash_pandas_object(_normalize_ledger_for_diff(frame), index=False)
+
+
+def _fetch_ledger_confirmed_dates(sid, sheet_name):
+    """キャッシュ経由で確定済みの納品日一覧を取得する。失敗結果はキャッシュに残さない。"""
+    ok, msg, dates = _cached_fetch_ledger_confirmed_dates(sid, sheet_name)
+    if not ok:
+        _clear_ledger_cache()
+    return ok, msg, dates
+
+
+# セッション状態の初期化
+if 'api_key' not in st.session_state:
+    st.session_state.api_key = _secrets()['GEMINI_API_KEY']
 if 'parsed_data' not in st.session_state:
     st.session_state.parsed_data = None
 if 'labels' not in st.session_state:
@@ -238,11 +391,7 @@ if 'shipment_date' not in st.session_state:
 if 'image_uploaded' not in st.session_state:
     st.session_state.image_uploaded = None
 if 'email_config' not in st.session_state:
-    try:
-        secrets_obj = st.secrets if hasattr(st, 'secrets') else None
-    except Exception:
-        secrets_obj = None
-    st.session_state.email_config = load_email_config(secrets_obj)
+    st.session_state.email_config = load_email_config(_secrets())
 if 'email_password' not in st.session_state:
     st.session_state.email_password = st.session_state.get("email_config", {}).get("email_password", "")
 if 'email_check_results' not in st.session_state:
@@ -251,16 +400,10 @@ if 'email_check_results' not in st.session_state:
 # 品目マスタ Google Sheets 接続の初期化
 if 'sheets_config_initialized' not in st.session_state:
     try:
-        _secrets = st.secrets if hasattr(st, 'secrets') else None
-        _sid_init = ""
-        if _secrets:
-            try:
-                _sid_init = _secrets.get("DELIVERY_SPREADSHEET_ID", "") or getattr(_secrets, "DELIVERY_SPREADSHEET_ID", "")
-            except Exception:
-                pass
+        _sec = _secrets()
         sheets_config.init(
-            spreadsheet_id=_sid_init or DEFAULT_LEDGER_SPREADSHEET_ID,
-            st_secrets=_secrets,
+            spreadsheet_id=_sec['DELIVERY_SPREADSHEET_ID'] or DEFAULT_LEDGER_SPREADSHEET_ID,
+            st_secrets=_sec,
         )
         st.session_state.sheets_config_initialized = True
     except Exception as e:
@@ -269,13 +412,18 @@ if 'sheets_config_initialized' not in st.session_state:
 
 if 'default_units_initialized' not in st.session_state:
     initialize_default_units()
-    item_settings = load_item_settings()
-    for key in ["長ネギ", "長ねぎバラ", "長ネギバラ"]:
-        if key in item_settings:
-            if item_settings[key].get("default_unit") != 50 or item_settings[key].get("unit_type") != "本":
-                set_item_setting(key, 50, "本")
-    if not item_settings:
-        save_item_settings(DEFAULT_ITEM_SETTINGS)
+    migrate_item_settings()
+    with sheets_txn() as txn:
+        item_settings = load_item_settings()
+        for key in ["長ネギ", "長ねぎバラ", "長ネギバラ"]:
+            if key in item_settings:
+                if item_settings[key].get("default_unit") != 50 or item_settings[key].get("unit_type") != "本":
+                    set_item_setting(key, 50, "本")
+        if not item_settings:
+            save_item_settings(DEFAULT_ITEM_SETTINGS)
+    if not txn["ok"]:
+        st.warning(f"品目設定の初期化を Google Sheets に保存できませんでした: {txn['msg']}")
+    _clear_master_cache()
     st.session_state.default_units_initialized = True
 
 
@@ -386,17 +534,10 @@ with st.sidebar:
     nav_role = st.radio("業務", [NAV_FIELD, NAV_OFFICE], key="nav_role", label_visibility="collapsed")
     st.markdown("---")
     st.header("⚙️ 設定")
-    try:
-        if hasattr(st, 'secrets'):
-            try:
-                secrets_api_key = st.secrets.get('GEMINI_API_KEY', '')
-                if secrets_api_key and not st.session_state.api_key:
-                    st.session_state.api_key = secrets_api_key
-                    st.info("✅ APIキーはSecretsから読み込まれました")
-            except Exception:
-                pass
-    except Exception:
-        pass
+    secrets_api_key = _secrets()['GEMINI_API_KEY']
+    if secrets_api_key and not st.session_state.api_key:
+        st.session_state.api_key = secrets_api_key
+        st.info("✅ APIキーはSecretsから読み込まれました")
     api_key = st.text_input("Gemini APIキー", value=st.session_state.api_key, type="password")
     st.session_state.api_key = api_key
     st.markdown("---")
@@ -412,21 +553,13 @@ if nav_role == NAV_OFFICE:
     st.title("🌱 小島農園 請求管理システム")
     st.markdown("**台帳データの単価一括入力・編集が、3つのステップで簡単にできます。**")
     
-    try:
-        secrets_obj_office = getattr(st, "secrets", None)
-    except Exception:
-        secrets_obj_office = None
+    secrets_obj_office = _secrets()
     if not is_sheet_configured(secrets_obj_office):
         st.warning("💡 台帳を読むには .streamlit/secrets.toml に [gcp] を設定するか、GOOGLE_APPLICATION_CREDENTIALS を設定してください。")
         st.stop()
     
     # スプレッドシート設定（共通）
-    _sid = ""
-    try:
-        if secrets_obj_office and hasattr(secrets_obj_office, "get"):
-            _sid = secrets_obj_office.get("DELIVERY_SPREADSHEET_ID", "") or getattr(secrets_obj_office, "DELIVERY_SPREADSHEET_ID", "")
-    except Exception:
-        pass
+    _sid = secrets_obj_office['DELIVERY_SPREADSHEET_ID']
     
     with st.expander("⚙️ スプレッドシート設定", expanded=False):
         ledger_id_office = st.text_input("台帳のスプレッドシートID", value=_sid or DEFAULT_LEDGER_SPREADSHEET_ID, key="office_ledger_id")
@@ -471,13 +604,12 @@ if nav_role == NAV_OFFICE:
                 else:
                     with st.status("データを取得中...", expanded=True) as status:
                         st.write("台帳に接続しています...")
-                        ok, msg, rows = fetch_ledger_rows(
+                        ok, msg, rows = _fetch_ledger_rows(
                             sid, 
-                            sheet_name=(ledger_sheet_office or "台帳データ").strip() or "台帳データ", 
+                            (ledger_sheet_office or "台帳データ").strip() or "台帳データ", 
                             only_unconfirmed=False, 
                             only_confirmed=False, 
-                            only_zero_unit_price=True, 
-                            st_secrets=secrets_obj_office
+                            only_zero_unit_price=True
                         )
                         if ok:
                             st.session_state.office_zero_unit_rows = rows
@@ -498,15 +630,14 @@ if nav_role == NAV_OFFICE:
                         st.write(f"{office_date_from.strftime('%Y/%m/%d')} ～ {office_date_to.strftime('%Y/%m/%d')} のデータを取得中...")
                         date_f_s = office_date_from.strftime("%Y/%m/%d")
                         date_t_s = office_date_to.strftime("%Y/%m/%d")
-                        ok, msg, rows = fetch_ledger_rows(
+                        ok, msg, rows = _fetch_ledger_rows(
                             sid, 
-                            sheet_name=(ledger_sheet_office or "台帳データ").strip() or "台帳データ", 
+                            (ledger_sheet_office or "台帳データ").strip() or "台帳データ", 
                             only_unconfirmed=False, 
                             only_confirmed=False, 
                             only_zero_unit_price=False, 
                             delivery_date_from=date_f_s, 
-                            delivery_date_to=date_t_s, 
-                            st_secrets=secrets_obj_office
+                            delivery_date_to=date_t_s
                         )
                         if ok:
                             st.session_state.office_zero_unit_rows = rows
@@ -524,11 +655,21 @@ if nav_role == NAV_OFFICE:
             st.subheader("🎯 絞り込み条件")
             st.info(f"📊 現在 **{len(rows_raw)}件** のデータが読み込まれています。")
             
-            stores_master = load_stores()
-            spec_master = load_item_spec_master()
-            items_master = sorted(set((r.get("品目") or "").strip() for r in spec_master if (r.get("品目") or "").strip()))
-            stores_options = ["（すべて）"] + stores_master
-            items_options = ["（すべて）"] + items_master
+            stores_master = _cached_load_stores()
+            spec_master = _cached_load_item_spec_master()
+            # 選択肢はマスタが変わったときだけ作り直す（絞り込み操作のたびのソートを避ける）
+            # マスタの更新時刻で判定し、再実行のたびにマスタ全行をたどらない（店舗一覧は数十件なのでそのまま比べる）
+            _opt_sig = (_master_version(), len(spec_master), tuple(stores_master))
+            _opt_cache = st.session_state.setdefault("_office_opt_cache", {})
+            if _opt_cache.get("sig") != _opt_sig:
+                items_master = sorted(set((r.get("品目") or "").strip() for r in spec_master if (r.get("品目") or "").strip()))
+                _opt_cache.update({
+                    "sig": _opt_sig,
+                    "stores_options": ["（すべて）"] + stores_master,
+                    "items_options": ["（すべて）"] + items_master,
+                })
+            stores_options = _opt_cache["stores_options"]
+            items_options = _opt_cache["items_options"]
             
             # 品目名「胡瓜バラ」等は台帳では 品目=胡瓜・規格=バラ と分けて保存されていることがあるため、その組み合わせでもマッチさせる
             def _item_spec_for_composite(selected_item: str):
@@ -780,7 +921,8 @@ if nav_role == NAV_OFFICE:
                                 st.balloons()
                                 
                                 # データを再取得
-                                ok2, _, new_rows = fetch_ledger_rows(sid, sheet_name=sheet_s, only_unconfirmed=False, only_confirmed=False, only_zero_unit_price=True, st_secrets=secrets_obj_office)
+                                _clear_ledger_cache()
+                                ok2, _, new_rows = _fetch_ledger_rows(sid, sheet_s, only_unconfirmed=False, only_confirmed=False, only_zero_unit_price=True)
                                 if ok2:
                                     st.session_state.office_zero_unit_rows = new_rows
                                 st.rerun()
@@ -818,6 +960,7 @@ with tab1:
                     order_data = parse_order_image(image, api_key)
                     if order_data:
                         validated_data = validate_and_fix_order_data(order_data)
+                        _clear_master_cache()  # 自動学習で店舗・品目が追加されうる
                         st.session_state.parsed_data = validated_data
                         st.session_state.labels = []
                         st.success(f"✅ {len(validated_data)}件を読み取りました。下の表で内容を確認・編集し、「📋 ラベルを生成」でPDFを作成できます。")
@@ -888,7 +1031,7 @@ with tab2:
         st.info(f"💾 使用中のメール: **{saved_config.get('email_address')}**")
     if st.session_state.get("email_check_results"):
         results = st.session_state.email_check_results
-        sender_rules = load_sender_rules()
+        sender_rules = _cached_load_sender_rules()
         for idx, result in enumerate(results):
             sender_addr = result.get("from", "")
             subject_display = f"{result.get('subject', '')} ({result.get('date', '')})"
@@ -915,6 +1058,7 @@ with tab2:
                                     parsed = parse_order_text(body_text, sender_addr, result.get("subject", ""), api_key)
                                 if parsed:
                                     validated_data = validate_and_fix_order_data(parsed)
+                                    _clear_master_cache()  # 自動学習で店舗・品目が追加されうる
                                     st.session_state.parsed_data = validated_data
                                     st.session_state.labels = []
                                     st.session_state.email_check_results = None
@@ -928,23 +1072,15 @@ with tab3:
     st.caption("台帳スプレッドシートから「確定フラグ」が空または「未確定」の行を表示します。取りこぼし・誤解析の確認に使えます。")
     if st.session_state.get("parsed_data"):
         st.info("📌 メール・画像で解析したデータは**このタブではなく**、ページ下の「📊 解析結果の確認・編集」で編集し、「📋 ラベルを生成」でPDFを作成してください。")
-    try:
-        secrets_obj = getattr(st, "secrets", None)
-    except Exception:
-        secrets_obj = None
+    secrets_obj = _secrets()
     if is_sheet_configured(secrets_obj):
-        _sid_ledger = ""
-        try:
-            if secrets_obj is not None and hasattr(secrets_obj, "get"):
-                _sid_ledger = secrets_obj.get("DELIVERY_SPREADSHEET_ID", "") or getattr(secrets_obj, "DELIVERY_SPREADSHEET_ID", "")
-        except Exception:
-            pass
+        _sid_ledger = secrets_obj['DELIVERY_SPREADSHEET_ID']
         ledger_id = st.text_input("台帳のスプレッドシートID", value=_sid_ledger or DEFAULT_LEDGER_SPREADSHEET_ID, placeholder="URLの /d/ と /edit の間の文字列", key="ledger_fetch_id")
         ledger_sheet_fetch = st.text_input("シート名", value="台帳データ", key="ledger_fetch_sheet")
         if st.button("未確定一覧を取得", key="fetch_unconfirmed_btn"):
             sid_stripped = (ledger_id or "").strip()
             if sid_stripped:
-                ok, msg, rows = fetch_ledger_rows(sid_stripped, sheet_name=(ledger_sheet_fetch or "台帳データ").strip() or "台帳データ", only_unconfirmed=True, st_secrets=secrets_obj)
+                ok, msg, rows = _fetch_ledger_rows(sid_stripped, (ledger_sheet_fetch or "台帳データ").strip() or "台帳データ", only_unconfirmed=True)
                 if ok:
                     st.success(msg)
                     st.session_state.ledger_unconfirmed_rows = rows
@@ -957,11 +1093,18 @@ with tab3:
         # 未確定行の表示と編集
         if st.session_state.get("ledger_unconfirmed_rows"):
             rows = st.session_state.ledger_unconfirmed_rows
-            df_unconf = pd.DataFrame(rows)
+            # 全件のフレームは取得し直したときだけ作り、各ページの編集内容をここへ書き戻す
+            if st.session_state.get("ledger_full_src") is not rows:
+                st.session_state.ledger_full_df = pd.DataFrame(rows)
+                st.session_state.ledger_full_src = rows
+                st.session_state.ledger_full_gen = st.session_state.get("ledger_full_gen", 0) + 1
+                st.session_state.ledger_row_hashes = _ledger_row_hashes(st.session_state.ledger_full_df) if "納品ID" in st.session_state.ledger_full_df.columns else None
+            df_unconf = st.session_state.ledger_full_df
+            page_start, page_end = _page_window(len(df_unconf), "ledger")
             
-            # 編集用設定
-            edited_df = st.data_editor(
-                df_unconf,
+            # 編集用設定（表示中のページ分だけ描画する）
+            edited_page = st.data_editor(
+                df_unconf.iloc[page_start:page_end],
                 width="stretch",
                 hide_index=True,
                 column_config={
@@ -976,8 +1119,10 @@ with tab3:
                     "チェック": st.column_config.CheckboxColumn("チェック", help="一括確定の対象にしたい行にチェック"),
                     "納品ID": st.column_config.TextColumn("納品ID", disabled=True),
                 },
-                key="ledger_editor"
+                key=f"ledger_editor_{st.session_state.ledger_full_gen}_{page_start}_{page_end}"
             )
+            edited_df = pd.concat([df_unconf.iloc[:page_start], edited_page, df_unconf.iloc[page_end:]])
+            st.session_state.ledger_full_df = edited_df
 
             # 一括確定
             sid_stripped = (ledger_id or "").strip()
@@ -985,19 +1130,22 @@ with tab3:
             if "confirm_bulk_all_ledger" not in st.session_state:
                 st.session_state.confirm_bulk_all_ledger = False
 
+            # 「表示中のすべて」は表示しているページの行だけ（他のページはユーザーが見ていないため対象外）
+            page_ids = []
+            if "納品ID" in df_unconf.columns:
+                page_ids = [i for i in df_unconf.iloc[page_start:page_end]["納品ID"].fillna("").astype(str).str.strip() if i]
             if st.session_state.confirm_bulk_all_ledger:
-                n_all = len(rows)
-                st.warning(f"**{n_all}件**を確定します。よろしいですか？")
+                st.warning(f"表示中の **{len(page_ids)}件**を確定します。よろしいですか？")
                 col_yes, col_no = st.columns(2)
                 with col_yes:
                     if st.button("はい、確定する", type="primary", key="bulk_confirm_yes_btn"):
                         if sid_stripped:
-                            all_ids = [str(r.get("納品ID", "")).strip() for r in rows if r.get("納品ID")]
-                            ok, msg = set_ledger_rows_confirmed(sid_stripped, sheet_name_s, all_ids, st_secrets=secrets_obj)
+                            ok, msg = set_ledger_rows_confirmed(sid_stripped, sheet_name_s, page_ids, st_secrets=secrets_obj)
                             st.session_state.confirm_bulk_all_ledger = False
                             if ok:
                                 st.success(msg)
-                                ok2, _, rows_new = fetch_ledger_rows(sid_stripped, sheet_name=sheet_name_s, only_unconfirmed=True, st_secrets=secrets_obj)
+                                _clear_ledger_cache()
+                                ok2, _, rows_new = _fetch_ledger_rows(sid_stripped, sheet_name_s, only_unconfirmed=True)
                                 if ok2:
                                     st.session_state.ledger_unconfirmed_rows = rows_new
                                 st.rerun()
@@ -1013,27 +1161,27 @@ with tab3:
                 st.caption("**一括確定**: チェックした行だけ確定するか、表示中のすべてを確定できます。")
                 col_check, col_all = st.columns(2)
                 with col_check:
-                    ids_checked = []
-                    for _, row in edited_df.iterrows():
-                        did = row.get("納品ID")
-                        if not did:
-                            continue
-                        ch = row.get("チェック")
-                        if ch is True or (isinstance(ch, str) and ch.strip().lower() in ("true", "1", "yes")) or ch == 1:
-                            ids_checked.append(str(did).strip())
-                    if st.button("✅ チェックした行を確定", key="bulk_confirm_checked_btn", disabled=len(ids_checked) == 0):
-                        if sid_stripped and ids_checked:
+                    if st.button("✅ チェックした行を確定", key="bulk_confirm_checked_btn"):
+                        # チェック列は bool / 1 / "true" 等が混在しうるので列単位でまとめて判定する
+                        ids_checked = []
+                        if "チェック" in edited_df.columns and "納品ID" in edited_df.columns:
+                            ch = edited_df["チェック"]
+                            mask = ch.eq(True) | ch.eq(1) | ch.astype(str).str.strip().str.lower().isin(["true", "1", "yes"])
+                            mask &= edited_df["納品ID"].fillna("").astype(str).str.strip().ne("")
+                            ids_checked = edited_df.loc[mask, "納品ID"].astype(str).str.strip().tolist()
+                        if not ids_checked:
+                            st.caption("チェックを入れた行がありません")
+                        elif sid_stripped:
                             ok, msg = set_ledger_rows_confirmed(sid_stripped, sheet_name_s, ids_checked, st_secrets=secrets_obj)
                             if ok:
                                 st.success(msg)
-                                ok2, _, rows_new = fetch_ledger_rows(sid_stripped, sheet_name=sheet_name_s, only_unconfirmed=True, st_secrets=secrets_obj)
+                                _clear_ledger_cache()
+                                ok2, _, rows_new = _fetch_ledger_rows(sid_stripped, sheet_name_s, only_unconfirmed=True)
                                 if ok2:
                                     st.session_state.ledger_unconfirmed_rows = rows_new
                                 st.rerun()
                             else:
                                 st.error(msg)
-                    elif len(ids_checked) == 0:
-                        st.caption("チェックを入れた行がありません")
                 with col_all:
                     if st.button("✅ 表示中のすべてを確定", key="bulk_confirm_all_btn"):
                         st.session_state.confirm_bulk_all_ledger = True
@@ -1048,63 +1196,48 @@ with tab3:
                 else:
                     updated_count = 0
                     errors = []
+                    diffs = []
                     
-                    # Original rows for comparison (keyed by delivery ID)
-                    original_map = {r.get("納品ID"): r for r in rows}
-                    
-                    for index, row in edited_df.iterrows():
-                        did = row.get("納品ID")
-                        if not did:
-                            continue
-                        
-                        orig = original_map.get(did)
-                        if not orig:
-                            continue
-                        
-                        updates = {}
-                        # Check for changes in specific columns
-                        # Quantity
-                        try:
-                            new_qty = int(row.get("数量", 0))
-                            old_qty = int(orig.get("数量", 0)) if orig.get("数量") else 0
-                            if new_qty != old_qty:
-                                updates["数量"] = new_qty
-                        except (ValueError, TypeError):
-                            pass
-                            
-                        # Confirmed Flag
-                        new_flag = row.get("確定フラグ")
-                        old_flag = orig.get("確定フラグ")
-                        if new_flag != old_flag:
-                            updates["確定フラグ"] = new_flag
-                            # Auto-set confirmed date if becoming confirmed
-                            if new_flag == "確定":
-                                updates["確定日時"] = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-                        
-                        # Farmer
-                        new_farmer = row.get("農家")
-                        old_farmer = orig.get("農家")
-                        if new_farmer != old_farmer:
-                            updates["農家"] = new_farmer
-
-                        # Check
-                        new_check = row.get("チェック") # Boolean or string depending on input
-                        old_check = orig.get("チェック")
-                        # Normalize check to boolean-like comparison if needed, or just string
-                        if str(new_check) != str(old_check):
-                            updates["チェック"] = new_check
-
-                        if updates:
-                            ok, msg = update_ledger_row_by_id(sid_stripped, sheet_name_s, did, updates, st_secrets=secrets_obj)
-                            if ok:
-                                updated_count += 1
-                            else:
-                                errors.append(f"ID {did}: {msg}")
-                    
+                    # 行ハッシュを取得時のものと比べ、変わった行だけを列単位のベクトル比較にかける
+                    orig_hashes = st.session_state.get("ledger_row_hashes")
+                    if orig_hashes is not None and "納品ID" in edited_df.columns:
+                        cur_hashes = _ledger_row_hashes(edited_df)
+                        common_ids = orig_hashes.index.intersection(cur_hashes.index)
+                        changed_ids = common_ids[orig_hashes.loc[common_ids].to_numpy() != cur_hashes.loc[common_ids].to_numpy()]
+                        if len(changed_ids) > 0:
+                            orig_n = _normalize_ledger_for_diff(pd.DataFrame(rows)).loc[changed_ids]
+                            cur_n = _normalize_ledger_for_diff(edited_df).loc[changed_ids]
+                            cur_df = edited_df.drop_duplicates("納品ID").set_index("納品ID").loc[changed_ids]
+                            _diff_cols = [c for c in LEDGER_EDITABLE_COLUMNS if c in orig_n.columns and c in cur_n.columns]
+                            mask = cur_n[_diff_cols].ne(orig_n[_diff_cols])
+                            changed = mask.stack()
+                            changed_pairs = set(changed[changed].index)
+                            for did in changed_ids[mask.any(axis=1).to_numpy()]:
+                                updates = {}
+                                for c in _diff_cols:
+                                    if (did, c) not in changed_pairs:
+                                        continue
+                                    if c == "数量":
+                                        updates[c] = int(cur_n.at[did, c])
+                                    else:
+                                        updates[c] = cur_df.at[did, c]
+                                    # 確定に変わった行だけ確定日時を自動設定
+                                    if c == "確定フラグ" and updates[c] == "確定":
+                                        updates["確定日時"] = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+                                if updates:
+                                    diffs.append((did, updates))
+
+                    # 変更行はまとめて 1 回の batchUpdate で書き込む（行ごとの API 呼び出しを避ける）
+                    if diffs:
+                        ok, msg, updated_count = batch_update_ledger_rows(sid_stripped, sheet_name_s, diffs, st_secrets=secrets_obj)
+                        if not ok:
+                            errors.append(msg)
+
                     if updated_count > 0:
-                        st.success(f"✅ {updated_count}件の行を更新しました。")
+                        st.success(f"✅ {msg}")
                         # Auto-refresh
-                        ok, msg, rows = fetch_ledger_rows(sid_stripped, sheet_name=sheet_name_s, only_unconfirmed=True, st_secrets=secrets_obj)
+                        _clear_ledger_cache()
+                        ok, msg, rows = _fetch_ledger_rows(sid_stripped, sheet_name_s, only_unconfirmed=True)
                         if ok:
                             st.session_state.ledger_unconfirmed_rows = rows
                             st.rerun()
@@ -1121,21 +1254,19 @@ with tab3:
 with tab4:
     st.subheader("📄 台帳からPDF")
     st.caption("台帳の「確定済み」データを納品日で取得し、差し札PDFを生成します。" + ("まず台帳から日付一覧を取得し、新しい順で選べます。" if fetch_ledger_confirmed_dates else "納品日付を選択して取得します。"))
-    try:
-        secrets_obj_pdf = getattr(st, "secrets", None)
-    except Exception:
-        secrets_obj_pdf = None
+    secrets_obj_pdf = _secrets()
     if is_sheet_configured(secrets_obj_pdf):
-        _sid_pdf = ""
-        try:
-            if secrets_obj_pdf and hasattr(secrets_obj_pdf, "get"):
-                _sid_pdf = secrets_obj_pdf.get("DELIVERY_SPREADSHEET_ID", "") or getattr(secrets_obj_pdf, "DELIVERY_SPREADSHEET_ID", "")
-        except Exception:
-            pass
+        _sid_pdf = secrets_obj_pdf['DELIVERY_SPREADSHEET_ID']
         ledger_id_pdf = st.text_input("台帳のスプレッドシートID", value=_sid_pdf or DEFAULT_LEDGER_SPREADSHEET_ID, key="ledger_pdf_id")
         ledger_sheet_pdf = st.text_input("シート名", value="台帳データ", key="ledger_pdf_sheet")
 
         pdf_delivery_date = ""
+        # 日付入力の既定値は出荷日（未設定・不正なら今日）。出荷日文字列が変わったときだけ解析し直す
+        _ship_s = st.session_state.get("shipment_date")
+        if "_pdf_default_date" not in st.session_state or st.session_state.get("_pdf_default_date_for") != _ship_s:
+            st.session_state._pdf_default_date_for = _ship_s
+            st.session_state._pdf_default_date = _parse_ymd(_ship_s)
+        default_date = st.session_state._pdf_default_date or datetime.now().date()
         if fetch_ledger_confirmed_dates:
             # 台帳のデータから納品日付一覧を取得（新しい順）
             if "ledger_pdf_available_dates" not in st.session_state:
@@ -1143,7 +1274,7 @@ with tab4:
             if st.button("📅 台帳の日付一覧を取得（確定データから・新しい順）", type="primary", key="fetch_ledger_dates_btn"):
                 sid = (ledger_id_pdf or "").strip()
                 if sid:
-                    ok, msg, dates = fetch_ledger_confirmed_dates(sid, sheet_name=(ledger_sheet_pdf or "台帳データ").strip() or "台帳データ", st_secrets=secrets_obj_pdf)
+                    ok, msg, dates = _fetch_ledger_confirmed_dates(sid, (ledger_sheet_pdf or "台帳データ").strip() or "台帳データ")
                     if ok:
                         st.session_state.ledger_pdf_available_dates = dates
                         st.success(msg)
@@ -1159,32 +1290,19 @@ with tab4:
                 pdf_delivery_date = (selected or "").replace("/", "-") if selected else ""
             else:
                 st.info("👆 「台帳の日付一覧を取得」を押すと、確定済みの納品日が新しい順で表示されます。")
-                default_date = datetime.now().date()
-                try:
-                    if st.session_state.get("shipment_date"):
-                        default_date = datetime.strptime(st.session_state.get("shipment_date"), "%Y-%m-%d").date()
-                except (ValueError, TypeError):
-                    pass
                 pdf_date_input = st.date_input("納品日付（手動で指定する場合）", value=default_date, key="pdf_ledger_date_picker")
                 pdf_delivery_date = pdf_date_input.strftime("%Y-%m-%d") if pdf_date_input else ""
         else:
-            default_date = datetime.now().date()
-            try:
-                if st.session_state.get("shipment_date"):
-                    default_date = datetime.strptime(st.session_state.get("shipment_date"), "%Y-%m-%d").date()
-            except (ValueError, TypeError):
-                pass
             pdf_date_input = st.date_input("納品日付（確定データの対象日）", value=default_date, key="pdf_ledger_date_picker")
             pdf_delivery_date = pdf_date_input.strftime("%Y-%m-%d") if pdf_date_input else ""
 
         if st.button("確定済みデータを取得", key="fetch_confirmed_btn"):
             sid = (ledger_id_pdf or "").strip()
             if sid and (pdf_delivery_date or "").strip():
-                ok, msg, rows = fetch_ledger_rows(sid, sheet_name=(ledger_sheet_pdf or "台帳データ").strip() or "台帳データ", only_unconfirmed=False, only_confirmed=True, delivery_date_from=(pdf_delivery_date or "").strip(), delivery_date_to=(pdf_delivery_date or "").strip(), st_secrets=secrets_obj_pdf)
+                ok, msg, rows = _fetch_ledger_rows(sid, (ledger_sheet_pdf or "台帳データ").strip() or "台帳データ", only_unconfirmed=False, only_confirmed=True, delivery_date_from=(pdf_delivery_date or "").strip(), delivery_date_to=(pdf_delivery_date or "").strip())
                 if ok:
                     st.success(msg)
                     if rows:
-                        st.dataframe(pd.DataFrame(rows), width="stretch", hide_index=True)
                         st.session_state.ledger_confirmed_for_pdf = rows
                     else:
                         st.info("該当する確定データがありません。")
@@ -1195,6 +1313,8 @@ with tab4:
                 st.warning("スプレッドシートIDと納品日付を入力してください。")
         if st.session_state.get("ledger_confirmed_for_pdf"):
             rows_for_pdf = st.session_state.ledger_confirmed_for_pdf
+            page_start, page_end = _page_window(len(rows_for_pdf), "ledger_pdf_preview")
+            st.dataframe(pd.DataFrame(rows_for_pdf[page_start:page_end]), width="stretch", hide_index=True)
             def _get_unit(item, spec, store):
                 u = lookup_unit(item, spec or "", store)
                 if u and u > 0:
@@ -1206,20 +1326,15 @@ with tab4:
                 if v2_data:
                     try:
                         final_data = validate_and_fix_order_data(v2_data)
+                        _clear_master_cache()  # 自動学習で店舗・品目が追加されうる
                         labels = generate_labels_from_data(final_data, pdf_delivery_date or st.session_state.shipment_date)
                         summary_data = generate_summary_table(final_data)
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                            pdf_path = tmp_file.name
-                            generator = LabelPDFGenerator()
-                            generator.generate_pdf(labels, summary_data, pdf_delivery_date or st.session_state.shipment_date, pdf_path)
-                            with open(pdf_path, "rb") as f:
-                                pdf_bytes = f.read()
-                            safe_date_fn = (pdf_delivery_date or "").replace("/", "").replace("-", "")[:8]
-                            st.download_button(label="📥 差し札PDFをダウンロード", data=pdf_bytes, file_name=f"出荷ラベル_台帳_{safe_date_fn}.pdf", mime="application/pdf", key="dl_pdf_ledger")
-                            try:
-                                os.unlink(pdf_path)
-                            except (PermissionError, OSError):
-                                pass
+                        # 一時ファイルを介さずメモリ上に PDF を生成してそのままダウンロードに渡す
+                        pdf_buf = io.BytesIO()
+                        generator = LabelPDFGenerator()
+                        generator.generate_pdf(labels, summary_data, pdf_delivery_date or st.session_state.shipment_date, pdf_buf)
+                        safe_date_fn = (pdf_delivery_date or "").replace("/", "").replace("-", "")[:8]
+                        st.download_button(label="📥 差し札PDFをダウンロード", data=pdf_buf.getvalue(), file_name=f"出荷ラベル_台帳_{safe_date_fn}.pdf", mime="application/pdf", key="dl_pdf_ledger")
                         st.success("✅ PDFを生成しました。上のボタンからダウンロードしてください。")
                     except Exception as e:
                         st.error(format_error_display(e, "PDF生成"))
@@ -1237,7 +1352,7 @@ with tab5:
     st.subheader("📩 取引先メール解析設定")
     st.caption("送信者（メールアドレス）ごとに、画像解析するかテキスト解析するかを指定できます。")
     
-    sender_rules = load_sender_rules()
+    sender_rules = _cached_load_sender_rules()
     
     with st.expander("解析ルールを追加・編集", expanded=False):
         rule_sender = st.text_input("送信者メールアドレス", placeholder="example@farm.jp", key="rule_sender_input")
@@ -1247,6 +1362,7 @@ with tab5:
             if rule_sender and "@" in rule_sender:
                 sender_rules[rule_sender.strip()] = {"mode": rule_mode}
                 save_sender_rules(sender_rules)
+                _clear_master_cache()
                 st.success(f"✅ {rule_sender} のルールを保存しました")
                 st.rerun()
             else:
@@ -1254,20 +1370,29 @@ with tab5:
     
     if sender_rules:
         st.write("**登録済みルール:**")
-        rules_to_delete = []
-        for sender, rule in sender_rules.items():
-            if not isinstance(rule, dict): continue
-            col1, col2 = st.columns([4, 1])
-            with col1:
-                st.write(f"- **{sender}**: {rule.get('mode', 'image')}")
-            with col2:
-                if st.button("削除", key=f"del_rule_{sender}"):
-                    del sender_rules[sender]
+        # 削除はチェックしてまとめて送信（行ごとのボタンで毎回再実行・保存しない）
+        with st.form("del_rules_form"):
+            rules_to_delete = []
+            for sender, rule in sender_rules.items():
+                if not isinstance(rule, dict): continue
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    st.write(f"- **{sender}**: {rule.get('mode', 'image')}")
+                with col2:
+                    if st.checkbox("削除", key=f"del_chk_rule_{sender}"):
+                        rules_to_delete.append(sender)
+            if st.form_submit_button("選択したルールを削除"):
+                if rules_to_delete:
+                    for sender in rules_to_delete:
+                        sender_rules.pop(sender, None)
                     save_sender_rules(sender_rules)
+                    _clear_master_cache()
                     st.rerun()
+                else:
+                    st.warning("削除するルールにチェックを入れてください")
     st.divider()
 
-    stores = load_stores()
+    stores = _cached_load_stores()
     st.subheader("🏪 店舗名管理")
     col1, col2 = st.columns([3, 1])
     with col1:
@@ -1276,21 +1401,30 @@ with tab5:
         if st.button("追加", key="add_store"):
             if new_store and new_store.strip():
                 if add_store(new_store.strip()):
+                    _clear_master_cache()
                     st.success(f"✅ 「{new_store.strip()}」を追加しました")
                     st.rerun()
                 else:
                     st.warning("既に存在する店舗名です")
     if stores:
         st.write("**登録済み店舗名:**")
-        for store in stores:
-            col1, col2 = st.columns([4, 1])
-            with col1:
-                st.write(f"- {store}")
-            with col2:
-                if st.button("削除", key=f"del_store_{store}"):
-                    if remove_store(store):
-                        st.success(f"✅ 「{store}」を削除しました")
-                        st.rerun()
+        with st.form("del_stores_form"):
+            stores_to_delete = []
+            for store in stores:
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    st.write(f"- {store}")
+                with col2:
+                    if st.checkbox("削除", key=f"del_chk_store_{store}"):
+                        stores_to_delete.append(store)
+            if st.form_submit_button("選択した店舗を削除"):
+                if stores_to_delete:
+                    save_stores([s for s in load_stores() if s not in stores_to_delete])
+                    _clear_master_cache()
+                    st.success(f"✅ {len(stores_to_delete)}件の店舗を削除しました")
+                    st.rerun()
+                else:
+                    st.warning("削除する店舗にチェックを入れてください")
     st.divider()
     st.subheader("🥬 品目マスタ管理")
 
@@ -1302,8 +1436,8 @@ with tab5:
         st.info("ローカル JSON で管理中（Google Sheets 未接続）")
 
     # マスタデータの読み込みと表示用変換
-    spec_master = load_item_spec_master()
-    items = load_items()
+    spec_master = _cached_load_item_spec_master()
+    items = _cached_load_items()
     _draft_key = "item_spec_master_draft"
 
     def _to_display_rows(spec_list, items_dict):
@@ -1383,18 +1517,25 @@ with tab5:
                         # 別表記を items dict に反映
                         alt_list = [v.strip() for v in alt_text.split(",") if v.strip()] if alt_text else []
                         new_items_dict[name] = [name] + [v for v in alt_list if v != name]
-                    save_item_spec_master(out_rows)
-                    save_items(new_items_dict)
-                    if _draft_key in st.session_state:
-                        del st.session_state[_draft_key]
+                    with sheets_txn() as txn:
+                        save_item_spec_master(out_rows)
+                        save_items(new_items_dict)
+                    _clear_master_cache()
                     if _sheets_ok:
                         sheets_config.invalidate_cache()
-                    st.success("✅ マスターデータを保存しました。" + (" (Google Sheets)" if _sheets_ok else " (config/item_spec_master.json)"))
-                    st.rerun()
+                    if not txn["ok"]:
+                        # 編集内容（下書き）は残し、もう一度保存できるようにする
+                        st.error(f"❌ マスターデータを保存できませんでした: {txn['msg']}")
+                    else:
+                        if _draft_key in st.session_state:
+                            del st.session_state[_draft_key]
+                        st.success("✅ マスターデータを保存しました。" + (" (Google Sheets)" if _sheets_ok else " (config/item_spec_master.json)"))
+                        st.rerun()
             with col_reload:
                 if st.button("🔄 最新データに戻す", key="reload_master_btn", help="未保存の編集を破棄"):
                     if _draft_key in st.session_state:
                         del st.session_state[_draft_key]
+                    _clear_master_cache()
                     if _sheets_ok:
                         sheets_config.invalidate_cache()
                     st.rerun()
@@ -1413,23 +1554,28 @@ with tab5:
         if new_item and new_item.strip():
             item_name = new_item.strip()
             spec_name = (new_spec.strip() if new_spec and pd.notna(new_spec) else "")
-            add_new_item(item_name)
-            spec_master = load_item_spec_master()
-            spec_master.append({
-                "品目": item_name,
-                "規格": spec_name,
-                "default_unit": int(new_item_unit),
-                "unit_type": new_item_unit_type,
-                "receive_as_boxes": False,
-                "min_shipping_unit": 0,
-            })
-            save_item_spec_master(spec_master)
-            if _draft_key in st.session_state:
-                del st.session_state[_draft_key]
+            with sheets_txn() as txn:
+                add_new_item(item_name)
+                spec_master = load_item_spec_master()
+                spec_master.append({
+                    "品目": item_name,
+                    "規格": spec_name,
+                    "default_unit": int(new_item_unit),
+                    "unit_type": new_item_unit_type,
+                    "receive_as_boxes": False,
+                    "min_shipping_unit": 0,
+                })
+                save_item_spec_master(spec_master)
+            _clear_master_cache()
             if _sheets_ok:
                 sheets_config.invalidate_cache()
-            st.success(f"✅ 「{item_name}」" + (f"（規格: {spec_name}）" if spec_name else "") + " を追加しました")
-            st.rerun()
+            if not txn["ok"]:
+                st.error(f"❌ 「{item_name}」を追加できませんでした: {txn['msg']}")
+            else:
+                if _draft_key in st.session_state:
+                    del st.session_state[_draft_key]
+                st.success(f"✅ 「{item_name}」" + (f"（規格: {spec_name}）" if spec_name else "") + " を追加しました")
+                st.rerun()
         else:
             st.warning("品目名を入力してください")
 
@@ -1440,7 +1586,6 @@ with tab5:
             st.caption("ローカル JSON の品目マスタを Google Sheets に一括移行します。既存の Sheets データは上書きされます。")
             if st.button("JSON → Sheets に移行", key="migrate_json_to_sheets_btn", type="secondary"):
                 try:
-                    from config_manager import ITEM_SPEC_MASTER_FILE, ITEMS_FILE
                     import json as _json
                     _spec_rows = []
                     if ITEM_SPEC_MASTER_FILE.exists():
@@ -1454,6 +1599,7 @@ with tab5:
                         ok, msg = sheets_config.migrate_json_to_sheet(_spec_rows, _items_dict)
                         if ok:
                             sheets_config.invalidate_cache()
+                            _clear_master_cache()
                             st.success(f"✅ 移行完了: {msg}")
                             st.rerun()
                         else:
@@ -1463,10 +1609,67 @@ with tab5:
                 except Exception as e:
                     st.error(f"移行エラー: {e}")
 
-@st.cache_data(ttl=3)
 def _cached_editor_config():
-    """表編集ブロック用のマスタを短時間キャッシュし、セル編集のたびのファイル読みを避ける。"""
-    return load_item_spec_master(), load_item_settings(), load_stores()
+    """表編集ブロック用のマスタ（キャッシュ済み）を返し、セル編集のたびのファイル読みを避ける。"""
+    return _cached_load_item_spec_master(), _cached_load_item_settings(), _cached_load_stores()
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _compute_option_lists(master_version, df_items, df_specs, _items_dict, _spec_master):
+    """表編集用の品目・規格の選択肢（マスタ＋表の既存値）。マスタか表の値が変わったときだけ作り直す。"""
+    _item_names = set(_items_dict.keys()) | {v for variants in _items_dict.values() for v in (variants or [])}
+    _item_names |= {(r.get("品目") or "").strip() for r in _spec_master if (r.get("品目") or "").strip()}
+    _spec_names = {(r.get("規格") or "").strip() for r in _spec_master}
+    _item_names |= set(df_items)
+    _spec_names |= set(df_specs)
+    for _item in df_items:
+        _d = get_default_spec_for_item(_item)
+        if _d:
+            _spec_names.add(_d)
+    item_options = sorted(x for x in _item_names if x)
+    spec_options = [""] + sorted(x for x in _spec_names if x)
+    return item_options, spec_options
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _convert_delivery_rows(master_version, parsed_json, delivery_date, carry_date, farmer):
+    """解析結果 → 納品データ行。解析結果・日付・農家・マスタが同じなら前回の変換結果を返す（納品IDは呼び出し側で振り直す）。"""
+    return v2_result_to_delivery_rows(json.loads(parsed_json), delivery_date=delivery_date, carry_date=carry_date, farmer=farmer)
+
+def _build_delivery_rows_csv(master_version, parsed_json, delivery_date, carry_date, farmer):
+    """
+    納品データ行・プレビュー用 DataFrame・CSV。セッションごとに保持し、入力が同じ間は同じもの（同じ納品ID）を返す。
+    変換結果のキャッシュはセッション間で共有されるため、納品IDは入力が変わったときにこのセッション用に振り直す。
+    """
+    key = (master_version, parsed_json, delivery_date, carry_date, farmer)
+    hit = st.session_state.get("_delivery_rows_csv")
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    rows = reissue_delivery_ids(_convert_delivery_rows(master_version, parsed_json, delivery_date, carry_date, farmer))
+    result = (rows, pd.DataFrame(rows), delivery_rows_to_csv_bytes(rows))
+    st.session_state["_delivery_rows_csv"] = (key, result)
+    return result
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _compute_validation_messages(master_version, check_df):
+    """最小出荷単位・マスタ未登録規格の確認メッセージ。表の品目・規格・合計数量とマスタが同じなら前回の結果を返す。"""
+    validation_errors = []
+    for idx, row in check_df.iterrows():
+        item = (row.get('品目') or '').strip()
+        if not item:
+            continue
+        spec = row.get('規格')
+        spec = '' if pd.isna(spec) else str(spec).strip()
+        if spec.lower() in ('none', 'nan'):
+            spec = ''
+        total_q = safe_int(row.get('合計数量', 0)) if pd.notna(row.get('合計数量')) else 0
+        norm_item = normalize_item_name_cached(item) or item
+        min_q = get_min_shipping_unit_cached(norm_item, spec)
+        if min_q > 0 and total_q > 0 and total_q < min_q:
+            validation_errors.append(f"行{idx+1}（{item} {spec or '規格なし'}）: 合計数量 {total_q} は最小出荷単位（{min_q}）を下回っています。")
+        if not is_spec_in_master_cached(norm_item, spec):
+            known = get_known_specs_for_item_cached(norm_item)
+            if known:
+                validation_errors.append(f"行{idx+1}（{item}）: 規格「{spec or '(空)'}」はマスタに未登録です。登録済み: {', '.join(s or '（規格なし）' for s in known)}。PDFはそのまま生成できます。必要なら「設定管理」の品目名管理で追加してください。")
+    return validation_errors
 
 def _render_parsed_data_editor():
     """解析結果の表を描画・編集。fragment で囲むと表の編集時だけこの関数が再実行され高速になる。"""
@@ -1476,7 +1679,7 @@ def _render_parsed_data_editor():
     st.header("📊 解析結果の確認・編集")
     st.write("以下のテーブルでデータを確認・編集できます。規格を変更すると入数・合計数量が再計算されます。編集後は下の **「📋 ラベルを生成」** でPDFを作成してください。")
     st.caption("品目・規格は一覧から選択できます（マスタ＋表の既存値）。入数・箱数・端数は入力と同時に保存され、合計数量は自動計算されます。マスタ未登録の行も編集できます。")
-    # マスタを1回だけ読み込み（3秒キャッシュで編集時の再読み込みを削減）
+    # マスタを1回だけ読み込み（キャッシュ済みのため編集時の再読み込みは発生しない）
     _spec_master, _item_settings, _stores_list = _cached_editor_config()
     # (品目, 規格) -> 設定 のルックアップ（get_item_setting 相当をメモリ上で実行）
     _setting_lookup = {}
@@ -1514,63 +1717,75 @@ def _render_parsed_data_editor():
             return u
         return extract_unit_size_from_spec(spec)
 
-    df_data = []
-    for entry in st.session_state.parsed_data:
-        item_name = entry.get('item', '')
-        normalized_item = normalize_item_name(item_name)
-        spec_raw = entry.get('spec', '') or ''
-        spec_s = str(spec_raw).strip() if spec_raw is not None else ''
-        if spec_s.lower() in ('none', 'nan'):
-            spec_s = ''
-        # 規格が空のときの表示用デフォルト（entry は書き換えず表示用の spec_s だけ設定）
-        if not spec_s and (normalized_item or item_name):
-            item_key = (normalized_item or item_name).strip()
-            composite_spec = {"胡瓜バラ": "バラ", "胡瓜平箱": "平箱", "長ねぎバラ": "バラ", "長ネギバラ": "バラ"}.get(item_key, "")
-            if composite_spec:
-                spec_s = composite_spec
-            else:
-                known = [r.get("規格") or "" for r in _spec_master if (r.get("品目") or "").strip() == item_key]
-                known = [s for s in known if s and str(s).strip()]
-                if len(known) == 1:
-                    spec_s = str(known[0]).strip()
-        # 保存済みの入数・箱数・端数を優先（マスタ未登録・ユーザー編集を保持）。未設定時のみマスタで補う。
-        unit = safe_int(entry.get('unit', 0))
-        boxes = safe_int(entry.get('boxes', 0))
-        remainder = safe_int(entry.get('remainder', 0))
-        effective_unit = _effective_unit_from_lookup(normalized_item or item_name, spec_s)
-        item_setting_boxes = _get_setting_from_lookup(normalized_item or item_name, spec_s)
-        receive_as_boxes = bool(item_setting_boxes.get("receive_as_boxes", False))
-        if effective_unit > 0 and unit > 0 and unit < effective_unit and boxes == 0 and remainder == 0:
-            # unit に総数が入っていた場合: 箱数＝総数÷入数 の商、端数＝余りで再計算
-            total_as_count = safe_int(entry.get('unit', 0))
-            unit = effective_unit
-            boxes, remainder = total_to_boxes_remainder(total_as_count, unit)
-        elif receive_as_boxes and effective_unit > 0 and unit == effective_unit and boxes == 0 and 0 < remainder < effective_unit:
-            boxes = remainder
-            remainder = 0
-        if unit == 0 and effective_unit > 0:
-            unit = effective_unit
-        # ユーザーが入力した入数は上書きしない（マスタは未入力時のみ使用）
-        total_quantity = (unit * boxes) + remainder
-        df_data.append({'店舗名': entry.get('store', ''), '品目': entry.get('item', ''), '規格': spec_s, '入数(unit)': unit, '箱数(boxes)': boxes, '端数(remainder)': remainder, '合計数量': total_quantity})
-    df = pd.DataFrame(df_data)
+    # 解析結果は列単位でまとめて補正する（品目名の正規化・マスタ参照は一意な値ごとに 1 回だけ）
+    src = pd.DataFrame(st.session_state.parsed_data, dtype=object)
+    for col in ("store", "item", "spec", "unit", "boxes", "remainder"):
+        if col not in src.columns:
+            src[col] = None
+    store_col = src["store"].where(src["store"].notna(), "")
+    item_col = src["item"].where(src["item"].notna(), "")
+    item_str = item_col.astype(str)
+    norm_map = {name: normalize_item_name_cached(name) for name in item_str.unique()}
+    normalized = item_str.map(norm_map)
+    item_key = normalized.where(normalized != "", item_str)
+    spec_s = src["spec"].where(src["spec"].notna() & src["spec"].astype(bool), "").astype(str).str.strip()
+    spec_s = spec_s.mask(spec_s.str.lower().isin(["none", "nan"]), "")
+    # 規格が空のときの表示用デフォルト（parsed_data は書き換えず表示用の規格だけ設定）
+    known_specs = defaultdict(list)
+    for r in _spec_master:
+        sp = r.get("規格") or ""
+        if sp and str(sp).strip():
+            known_specs[(r.get("品目") or "").strip()].append(str(sp).strip())
+    composite_specs = {"胡瓜バラ": "バラ", "胡瓜平箱": "平箱", "長ねぎバラ": "バラ", "長ネギバラ": "バラ"}
+
+    def _display_default_spec(key: str) -> str:
+        if key in composite_specs:
+            return composite_specs[key]
+        known = known_specs.get(key, [])
+        return known[0] if len(known) == 1 else ""
+
+    need_default = (spec_s == "") & (item_key.str.strip() != "")
+    if need_default.any():
+        spec_s = spec_s.mask(need_default, item_key.str.strip().map(_display_default_spec))
+    # 入数・箱数・端数は保存済みの値を優先。マスタの入数・受信方法は (品目, 規格) の組ごとに 1 回だけ解決する
+    u = src["unit"].map(safe_int).astype(int)
+    b = src["boxes"].map(safe_int).astype(int)
+    rem = src["remainder"].map(safe_int).astype(int)
+    keys = pd.DataFrame({"item": item_key, "spec": spec_s})
+    uniq = keys.drop_duplicates().copy()
+    uniq["eff"] = [_effective_unit_from_lookup(i, sp) for i, sp in zip(uniq["item"], uniq["spec"])]
+    uniq["rab"] = [bool(_get_setting_from_lookup(i, sp).get("receive_as_boxes", False)) for i, sp in zip(uniq["item"], uniq["spec"])]
+    resolved = keys.merge(uniq, on=["item", "spec"], how="left")
+    eff = pd.Series(resolved["eff"].astype(int).to_numpy(), index=src.index)
+    rab = pd.Series(resolved["rab"].astype(bool).to_numpy(), index=src.index)
+    # unit に総数が入っていた場合: 箱数＝総数÷入数 の商、端数＝余りで再計算
+    total_in_unit = (eff > 0) & (u > 0) & (u < eff) & (b == 0) & (rem == 0)
+    if total_in_unit.any():
+        # 計算は box_remainder_calc に任せ、(総数, 入数) の組ごとに 1 回だけ呼ぶ
+        pairs = list(zip(u[total_in_unit], eff[total_in_unit]))
+        split = {p: total_to_boxes_remainder(*p) for p in set(pairs)}
+        b = b.copy()
+        rem = rem.copy()
+        b[total_in_unit] = [split[p][0] for p in pairs]
+        rem[total_in_unit] = [split[p][1] for p in pairs]
+        u = u.mask(total_in_unit, eff)
+    # 箱数受信の品目で箱数が端数に入っていた場合は箱数へ移す
+    boxes_in_rem = ~total_in_unit & rab & (eff > 0) & (u == eff) & (b == 0) & (rem > 0) & (rem < eff)
+    b = b.mask(boxes_in_rem, rem)
+    rem = rem.mask(boxes_in_rem, 0)
+    # ユーザーが入力した入数は上書きしない（マスタは未入力時のみ使用）
+    u = u.mask((u == 0) & (eff > 0), eff)
+    df = pd.DataFrame({
+        '店舗名': store_col, '品目': item_col, '規格': spec_s,
+        '入数(unit)': u, '箱数(boxes)': b, '端数(remainder)': rem, '合計数量': u * b + rem,
+    }).reset_index(drop=True)
     # 規格の NaN / "None" を空文字に統一（プルダウンで選択肢にないとエラーになるため）
     if not df.empty and "規格" in df.columns:
         df["規格"] = df["規格"].fillna("").astype(str).str.strip().replace("None", "").replace("nan", "")
     # 品目・規格は選択＋既存値のハイブリッド用に選択肢を組み立て（既読のマスタ＋表の値）
-    _items_dict = load_items()
-    _item_names = set(_items_dict.keys()) | {v for variants in _items_dict.values() for v in (variants or [])}
-    _item_names |= {(r.get("品目") or "").strip() for r in _spec_master if (r.get("品目") or "").strip()}
-    _spec_names = {(r.get("規格") or "").strip() for r in _spec_master}
-    if not df.empty:
-        _item_names |= set(df["品目"].dropna().astype(str).str.strip())
-        _spec_names |= set(df["規格"].dropna().astype(str).str.strip())
-        for _item in df["品目"].dropna().astype(str).str.strip().unique():
-            _d = get_default_spec_for_item(_item)
-            if _d:
-                _spec_names.add(_d)
-    item_options = sorted(x for x in _item_names if x)
-    spec_options = [""] + sorted(x for x in _spec_names if x)
+    df_items = tuple(df["品目"].dropna().astype(str).str.strip().unique()) if not df.empty else ()
+    df_specs = tuple(df["規格"].dropna().astype(str).str.strip().unique()) if not df.empty else ()
+    item_options, spec_options = _compute_option_lists(_master_version(), df_items, df_specs, _cached_load_items(), _spec_master)
     col_品目 = st.column_config.SelectboxColumn("品目", options=item_options, required=True) if item_options else st.column_config.TextColumn("品目", required=True)
     col_規格 = st.column_config.SelectboxColumn("規格", options=spec_options) if spec_options else st.column_config.TextColumn("規格")
     edited_df = st.data_editor(df, width="stretch", num_rows="dynamic", key="parsed_data_editor",
@@ -1583,71 +1798,55 @@ def _render_parsed_data_editor():
             "端数(remainder)": st.column_config.NumberColumn("端数(remainder)", min_value=0, step=1),
             "合計数量": st.column_config.NumberColumn("合計数量", disabled=True),
         })
-    # 規格変更時: 入数をマスタ／規格名から再設定し、合計数量を再計算（num_rows=dynamic で追加行がある場合は idx>=len(df) で orig_row は None）
-    for idx, row in edited_df.iterrows():
-        spec_val = row.get('規格')
-        if pd.isna(spec_val):
-            spec_val = ''
-        else:
-            spec_val = str(spec_val).strip()
-        orig_row = df.iloc[idx] if idx < len(df) else None
-        orig_spec = ''
-        if orig_row is not None:
-            ospec = orig_row.get('規格')
-            orig_spec = '' if pd.isna(ospec) else str(ospec).strip()
-        if spec_val != orig_spec:
-            eff = _effective_unit_from_lookup(normalize_item_name(row.get('品目', '')) or row.get('品目', ''), spec_val)
-            if eff > 0:
-                edited_df.at[idx, '入数(unit)'] = eff
+    # 規格変更時: 入数をマスタ／規格名から再設定し、合計数量を再計算（変わった行だけまとめて処理。追加行は元の規格を空として扱う）
+    spec_now = edited_df['規格'].where(edited_df['規格'].notna(), '').astype(str).str.strip()
+    spec_before = df['規格'].where(df['規格'].notna(), '').astype(str).str.strip().reindex(edited_df.index, fill_value='') if not df.empty else pd.Series('', index=edited_df.index)
+    spec_changed = spec_now != spec_before
+    if spec_changed.any():
+        eff_changed = pd.Series(
+            [_effective_unit_from_lookup(normalize_item_name_cached(it) or it, sp) for it, sp in zip(edited_df.loc[spec_changed, '品目'], spec_now[spec_changed])],
+            index=spec_now.index[spec_changed], dtype=int,
+        )
+        eff_changed = eff_changed[eff_changed > 0]
+        edited_df.loc[eff_changed.index, '入数(unit)'] = eff_changed
     u = edited_df['入数(unit)'].fillna(0)
     b = edited_df['箱数(boxes)'].fillna(0)
     r = edited_df['端数(remainder)'].fillna(0)
     edited_df['合計数量'] = (u * b + r).astype(int)
     # 入力された瞬間に session_state を更新（フォーカスが外れても値が戻らないようにする）。マスタ未登録行も編集を保持。
-    updated_data = []
-    for _, row in edited_df.iterrows():
-        normalized_item = normalize_item_name(row.get('品目', '') or '')
-        validated_store = validate_store_name(row.get('店舗名', '') or '') or (row.get('店舗名', '') or '')
-        try:
-            spec_value = row.get('規格')
-            if pd.isna(spec_value) or spec_value is None:
-                spec_value = ''
-            else:
-                spec_value = str(spec_value).strip()
-            if spec_value.lower() in ('none', 'nan'):
-                spec_value = ''
-        except (KeyError, TypeError):
-            spec_value = ''
-        unit_val = safe_int(row.get('入数(unit)', 0))
-        boxes_val = safe_int(row.get('箱数(boxes)', 0))
-        remainder_val = safe_int(row.get('端数(remainder)', 0))
-        if unit_val > 0:
-            set_unit(normalized_item or (row.get('品目') or ''), spec_value, validated_store, unit_val)
-        updated_data.append({'store': validated_store, 'item': normalized_item, 'spec': spec_value, 'unit': unit_val, 'boxes': boxes_val, 'remainder': remainder_val})
-    st.session_state.parsed_data = updated_data
+    # 表の内容ハッシュが前回の反映時と同じ（かつ parsed_data が外から差し替えられていない）なら再構築を省く
+    edit_hash = pd.util.hash_pandas_object(edited_df, index=True).to_numpy().tobytes()
+    if st.session_state.get("parsed_edit_hash") != edit_hash or st.session_state.get("parsed_edit_src") is not st.session_state.parsed_data:
+        # 品目名・店舗名の正規化は一意な値ごとに 1 回だけ行い、列単位で組み立てて records に変換する
+        item_raw = edited_df['品目'].where(edited_df['品目'].notna(), '').astype(str)
+        store_raw = edited_df['店舗名'].where(edited_df['店舗名'].notna(), '').astype(str)
+        item_norm = item_raw.map({v: normalize_item_name_cached(v) for v in item_raw.unique()})
+        store_v = store_raw.map({v: validate_store_name(v) or v for v in store_raw.unique()})
+        spec_v = edited_df['規格'].where(edited_df['規格'].notna(), '').astype(str).str.strip()
+        spec_v = spec_v.mask(spec_v.str.lower().isin(['none', 'nan']), '')
+        out = pd.DataFrame({
+            'store': store_v, 'item': item_norm, 'spec': spec_v,
+            'unit': pd.to_numeric(edited_df['入数(unit)'], errors='coerce').fillna(0).astype(int),
+            'boxes': pd.to_numeric(edited_df['箱数(boxes)'], errors='coerce').fillna(0).astype(int),
+            'remainder': pd.to_numeric(edited_df['端数(remainder)'], errors='coerce').fillna(0).astype(int),
+        }).reset_index(drop=True)
+        updated_data = out.to_dict('records')
+        # 入数の保存は (品目, 規格, 店舗, 入数) が前回から変わった行だけ、最後にまとめて 1 回書き込む
+        key_cols = ['unit', 'item', 'spec', 'store']
+        prev_df = pd.DataFrame(st.session_state.parsed_data, columns=key_cols, dtype=object).reindex(out.index)
+        save_mask = (out['unit'] > 0) & out[key_cols].ne(prev_df).any(axis=1)
+        unit_item = out['item'].where(out['item'] != '', item_raw.reset_index(drop=True))
+        unit_updates = list(zip(unit_item[save_mask], out.loc[save_mask, 'spec'], out.loc[save_mask, 'store'], out.loc[save_mask, 'unit'].astype(int).tolist()))
+        if unit_updates:
+            set_units_bulk(unit_updates)
+        st.session_state.parsed_data = updated_data
+        st.session_state.parsed_edit_hash = edit_hash
+        st.session_state.parsed_edit_src = updated_data
     # バリデーション: 最小出荷単位・規格マスタ不一致（品目が空の行はスキップ）
-    validation_errors = []
-    for idx, row in edited_df.iterrows():
-        item = (row.get('品目') or '').strip()
-        if not item:
-            continue
-        spec = row.get('規格')
-        spec = '' if pd.isna(spec) else str(spec).strip()
-        if spec.lower() in ('none', 'nan'):
-            spec = ''
-        total_q = safe_int(row.get('合計数量', 0)) if pd.notna(row.get('合計数量')) else 0
-        norm_item = normalize_item_name(item) or item
-        min_q = get_min_shipping_unit(norm_item, spec)
-        if min_q > 0 and total_q > 0 and total_q < min_q:
-            validation_errors.append(f"行{idx+1}（{item} {spec or '規格なし'}）: 合計数量 {total_q} は最小出荷単位（{min_q}）を下回っています。")
-        if not is_spec_in_master(norm_item, spec):
-            known = get_known_specs_for_item(norm_item)
-            if known:
-                validation_errors.append(f"行{idx+1}（{item}）: 規格「{spec or '(空)'}」はマスタに未登録です。登録済み: {', '.join(s or '（規格なし）' for s in known)}。PDFはそのまま生成できます。必要なら「設定管理」の品目名管理で追加してください。")
+    validation_errors = _compute_validation_messages(_master_version(), edited_df[["品目", "規格", "合計数量"]])
     if validation_errors:
         st.warning("⚠️ 以下の確認をお願いします（PDFはそのまま生成できます）：")
-        for msg in validation_errors:
-            st.markdown(f"- {msg}")
+        st.markdown("\n".join(f"- {msg}" for msg in validation_errors))
     st.divider()
     st.subheader("📋 納品データ形式（台帳用）")
     st.caption("持込入力と同一形式に変換してプレビュー・CSV出力・スプレッドシート追記ができます。")
@@ -1656,30 +1855,23 @@ def _render_parsed_data_editor():
     c_date = st.text_input("持込日付", value=d_date, key="carry_date_input")
     farmer_name = st.text_input("農家", value="", placeholder="メール読み取りの場合は任意", key="farmer_input")
     delivery_rows = []
+    df_delivery = None
+    csv_bytes = b""
     parsed = st.session_state.parsed_data
     if isinstance(parsed, list) and parsed:
         try:
-            delivery_rows = v2_result_to_delivery_rows(parsed, delivery_date=d_date or default_delivery, carry_date=(c_date or d_date or default_delivery), farmer=(farmer_name or "").strip())
+            parsed_json = json.dumps(parsed, ensure_ascii=False, sort_keys=True, default=str)
+            delivery_rows, df_delivery, csv_bytes = _build_delivery_rows_csv(_master_version(), parsed_json, d_date or default_delivery, (c_date or d_date or default_delivery), (farmer_name or "").strip())
         except Exception as e:
             st.warning(format_error_display(e, "変換"))
     if delivery_rows:
-        df_delivery = pd.DataFrame(delivery_rows)
         st.dataframe(df_delivery, width="stretch", hide_index=True)
-        csv_bytes = df_delivery.to_csv(index=False, encoding="utf-8-sig")
         safe_date = (d_date or "").replace("/", "-").replace("\\", "-").strip() or "export"
         st.download_button("📥 納品データをCSVでダウンロード", data=csv_bytes, file_name=f"納品データ_{safe_date}.csv", mime="text/csv", key="csv_delivery_btn")
-        try:
-            secrets_obj = getattr(st, "secrets", None)
-        except Exception:
-            secrets_obj = None
+        secrets_obj = _secrets()
         if is_sheet_configured(secrets_obj):
             st.caption("台帳にデータを保存すると、ステータス「未確定」で台帳データシートに追記されます（二重管理なし・台帳一元化）。")
-            _sid = ""
-            try:
-                if secrets_obj is not None and hasattr(secrets_obj, "get"):
-                    _sid = secrets_obj.get("DELIVERY_SPREADSHEET_ID", "") or getattr(secrets_obj, "DELIVERY_SPREADSHEET_ID", "")
-            except Exception:
-                pass
+            _sid = secrets_obj['DELIVERY_SPREADSHEET_ID']
             sheet_id = st.text_input("台帳のスプレッドシートID", value=_sid or DEFAULT_LEDGER_SPREADSHEET_ID, key="delivery_sheet_id")
             ledger_sheet_name = st.text_input("台帳シート名", value="台帳データ", key="ledger_sheet_name")
             if st.button("📤 台帳にデータを保存", type="primary", key="append_ledger_btn"):
@@ -1689,6 +1881,7 @@ def _render_parsed_data_editor():
                     if ledger_rows:
                         ok, msg = append_ledger_rows(sid_stripped, ledger_rows, sheet_name=(ledger_sheet_name or "台帳データ").strip() or "台帳データ", st_secrets=secrets_obj)
                         if ok:
+                            _clear_ledger_cache()
                             st.success(msg)
                         else:
                             st.error(msg)
@@ -1714,6 +1907,7 @@ if st.session_state.parsed_data:
     if st.button("📋 ラベルを生成", type="primary", use_container_width=True, key="pdf_gen_tab1"):
         try:
             final_data = validate_and_fix_order_data(st.session_state.parsed_data)
+            _clear_master_cache()  # 自動学習で店舗・品目が追加されうる
             labels = generate_labels_from_data(final_data, st.session_state.shipment_date)
             st.session_state.labels = labels
             if labels:
@@ -1730,19 +1924,14 @@ if st.session_state.labels and st.session_state.parsed_data:
     if st.button("🖨️ PDFを生成", type="primary", use_container_width=True, key="pdf_gen_main"):
         try:
             final_data = validate_and_fix_order_data(st.session_state.parsed_data)
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                pdf_path = tmp_file.name
-                summary_data = generate_summary_table(final_data)
-                generator = LabelPDFGenerator()
-                generator.generate_pdf(st.session_state.labels, summary_data, st.session_state.shipment_date, pdf_path)
-                with open(pdf_path, 'rb') as f:
-                    pdf_bytes = f.read()
-                st.download_button(label="📥 PDFをダウンロード (一覧表付き)", data=pdf_bytes, file_name=f"出荷ラベル_{st.session_state.shipment_date.replace('-', '')}.pdf", mime="application/pdf")
-                try:
-                    os.unlink(pdf_path)
-                except (PermissionError, OSError):
-                    pass
-                st.success("✅ PDFが生成されました！")
+            _clear_master_cache()  # 自動学習で店舗・品目が追加されうる
+            summary_data = generate_summary_table(final_data)
+            # 一時ファイルを介さずメモリ上に PDF を生成してそのままダウンロードに渡す
+            pdf_buf = io.BytesIO()
+            generator = LabelPDFGenerator()
+            generator.generate_pdf(st.session_state.labels, summary_data, st.session_state.shipment_date, pdf_buf)
+            st.download_button(label="📥 PDFをダウンロード (一覧表付き)", data=pdf_buf.getvalue(), file_name=f"出荷ラベル_{st.session_state.shipment_date.replace('-', '')}.pdf", mime="application/pdf")
+            st.success("✅ PDFが生成されました！")
             st.subheader("📋 LINE用集計（コピー用）")
             line_text = generate_line_summary(final_data)
             st.code(line_text, language="text")
@@ -70,9 +70,7 @@ def total_to_boxes_remainder(total: int, unit: int) -> Tuple[int, int]:
     unit = int(unit)
     if unit <= 0:
         return (0, total)
-    boxes = total // unit
-    remainder = total % unit
-    return (boxes, remainder)
+    return divmod(total, unit)
 
 
 def boxes_remainder_to_total(unit: int, boxes: int, remainder: int) -> int:
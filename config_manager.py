@@ -7,8 +7,12 @@
 import json
 import os
 import re
+import threading
+from contextlib import contextmanager
+from functools import lru_cache, wraps
 from pathlib import Path
-from typing import List, Dict, Optional, Any
+from types import MappingProxyType
+from typing import List, Dict, FrozenSet, Mapping, Optional, Any, Iterable, Tuple
 
 # Sheets 連携（利用可能な場合のみ）
 try:
@@ -16,15 +20,29 @@ try:
 except ImportError:
     _sc = None
 
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
 # 規格名に含まれる入数（本数・袋数）を抽出する正規表現パターン（優先順）
-SPEC_UNIT_SIZE_PATTERNS = [
-    re.compile(r"バラ\s*(\d+)", re.IGNORECASE),
-    re.compile(r"平箱\s*[（(]\s*(\d+)", re.IGNORECASE),
-    re.compile(r"[（(]\s*(\d+)\s*[本)）]", re.IGNORECASE),
-    re.compile(r"(\d+)\s*本入り", re.IGNORECASE),
-    re.compile(r"(\d+)\s*本\b", re.IGNORECASE),
-    re.compile(r"(\d+)\s*袋\b", re.IGNORECASE),
-]
+SPEC_UNIT_SIZE_PATTERNS = (
+    r"バラ\s*(\d+)",
+    r"平箱\s*[（(]\s*(\d+)",
+    r"[（(]\s*(\d+)\s*[本)）]",
+    r"(\d+)\s*本入り",
+    r"(\d+)\s*本\b",
+    r"(\d+)\s*袋\b",
+)
+
+
+@lru_cache(maxsize=1)
+def _spec_unit_size_re() -> "re.Pattern[str]":
+    """
+    上のパターンを 1 本にまとめた正規表現（初回呼び出し時にだけコンパイルする）。
+    各パターンはキャプチャを 1 つだけ持つので、一致したグループ番号（lastindex）がそのまま優先順位（1 が最優先）になる。
+    """
+    return re.compile("|".join(f"(?:{p})" for p in SPEC_UNIT_SIZE_PATTERNS), re.IGNORECASE)
 
 CONFIG_DIR = Path("config")
 STORES_FILE = CONFIG_DIR / "stores.json"
@@ -57,12 +75,15 @@ DEFAULT_ITEM_SETTINGS = {
     "青梗菜": {"default_unit": 20, "unit_type": "袋", "receive_as_boxes": False, "min_shipping_unit": 1},
 }
 
-# 品目+規格の複合名ルックアップ
+# 品目+規格の複合名ルックアップ: (品目, 規格) -> 参照するマスタ行の (品目, 規格)
 ITEM_SPEC_COMPOSITE_LOOKUP = {
-    ("胡瓜", "バラ"): "胡瓜バラ(100本)",
-    ("胡瓜", "平箱"): "胡瓜平箱",
-    ("長ネギ", "バラ"): "長ねぎバラ",
-    ("長ねぎ", "バラ"): "長ねぎバラ",
+    ("胡瓜", "バラ"): ("胡瓜バラ(100本)", "バラ"),
+    ("胡瓜", "平箱"): ("胡瓜平箱", "平箱"),
+    ("長ネギ", "バラ"): ("長ねぎバラ", "バラ"),
+    ("長ねぎ", "バラ"): ("長ねぎバラ", "バラ"),
+    # 胡瓜バラを「100本」「50本」と規格だけで受けた場合
+    ("胡瓜", "100本"): ("胡瓜バラ(100本)", "バラ"),
+    ("胡瓜", "50本"): ("胡瓜バラ(50本)", "バラ"),
 }
 
 
@@ -83,16 +104,183 @@ def ensure_config_dir():
     CONFIG_DIR.mkdir(exist_ok=True)
 
 
+# マスタ参照結果のメモ化（lookup_cache で登録し、マスタ保存時に invalidate_caches() 経由でまとめて破棄）
+_LOOKUP_CACHES = []
+# メモ化した時点の Sheets マスタの取得時刻。他のユーザーの編集を取り込んで時刻が変われば破棄する
+_lookup_sheets_ts: List[Optional[float]] = [None]
+
+
+def _sync_lookup_caches() -> None:
+    """Sheets マスタが取り直されていたらメモ化結果を破棄する（TTL 内なら取得時刻を見るだけ）。"""
+    ts = None
+    if _sheets_available():
+        _sc.load_master()
+        ts = _sc.cache_timestamp()
+    if ts != _lookup_sheets_ts[0]:
+        clear_lookup_caches()
+        _lookup_sheets_ts[0] = ts
+
+
+def lookup_cache(func):
+    """マスタから導出される値を引数ごとにメモ化するデコレータ。Sheets マスタが更新されたら自動で破棄する。"""
+    cached = lru_cache(maxsize=2048)(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        _sync_lookup_caches()
+        return cached(*args, **kwargs)
+
+    wrapper.cache_clear = cached.cache_clear
+    wrapper.cache_info = cached.cache_info
+    _LOOKUP_CACHES.append(cached)
+    return wrapper
+
+
+def clear_lookup_caches() -> None:
+    """lookup_cache で登録したメモ化結果をすべて破棄する。"""
+    for cached in _LOOKUP_CACHES:
+        cached.cache_clear()
+
+
+# マスタ読み込み結果のプロセス内キャッシュ: name -> (キー, 値)。
+# キーは JSON ファイルの更新時刻と Sheets キャッシュの取得時刻で、どちらかが変われば読み直す。
+_MASTER_CACHE: Dict[str, Tuple[tuple, Any]] = {}
+
+
+def _file_signature(path: Path) -> Tuple[int, int, int]:
+    """
+    (st_mtime_ns, st_size, st_ino)。存在しなければ (0, 0, 0)。
+    os.replace で置き換えると inode が変わるため、mtime の分解能より短い間隔の更新も検出できる。
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (0, 0, 0)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _master_cache_key(path: Path, sheets: bool = True) -> tuple:
+    sig = _file_signature(path)
+    if sheets and _sheets_available():
+        _sc.load_master()  # TTL 内ならキャッシュを返すだけ。期限切れならここで取り直して時刻が変わる
+        return (sig, True, _sc.cache_timestamp())
+    return (sig, False, 0.0)
+
+
+def _memoized_load(name: str, path: Path, loader, sheets: bool = True):
+    """
+    loader の結果をキャッシュし、ファイルまたは Sheets が更新されていなければ再利用する。
+    sheets=False はローカル JSON だけで管理するデータ用（Sheets の更新を見ない）。
+    """
+    hit = _MASTER_CACHE.get(name)
+    if hit is not None:
+        if hit[0] == _master_cache_key(path, sheets):
+            return hit[1]
+        # 別プロセスでのファイル更新なども含め、元データが変わったので導出済みの参照結果も捨てる
+        clear_lookup_caches()
+    value = loader()
+    # 読み込み時にファイルを書き直す loader もあるため、キーは読み込み後に取る
+    _MASTER_CACHE[name] = (_master_cache_key(path, sheets), value)
+    return value
+
+
+def invalidate_caches() -> None:
+    """マスタ読み込みキャッシュと参照結果のメモ化をすべて破棄する（保存後に呼ぶ）。"""
+    _MASTER_CACHE.clear()
+    clear_lookup_caches()
+
+
+# Sheets マスタの書き込みをまとめるトランザクション（スレッド＝セッションごと）
+_sheets_txn_state = threading.local()
+
+
+@contextmanager
+def sheets_txn():
+    """
+    ブロック内の Sheets マスタ保存（save_items / save_item_settings / save_item_spec_master / remove_item）を
+    1 回の読み込みと 1 回の書き込みにまとめる。途中の変更はキャッシュに反映されるのでブロック内の読み込みにも見える。
+    シートの読み込みは最初の書き換えまで遅らせ、何も書き換えなければ Sheets には問い合わせない。
+    Sheets 未接続時、または既にトランザクション中のときは何もしない。
+    結果の辞書 {"ok": bool, "msg": str} を返し、ブロックを抜けた後にまとめた保存の成否が入る
+    （入れ子のときは外側のトランザクションの結果）。
+    """
+    if getattr(_sheets_txn_state, "active", False):
+        yield _sheets_txn_state.result
+        return
+    result = {"ok": True, "msg": ""}
+    if not _sheets_available():
+        yield result
+        return
+    _sheets_txn_state.active = True
+    _sheets_txn_state.rows = None
+    _sheets_txn_state.dirty = False
+    _sheets_txn_state.result = result
+    try:
+        yield result
+        if _sheets_txn_state.dirty:
+            ok, msg = _sc.save_master(_sheets_txn_state.rows)
+            result["ok"], result["msg"] = ok, msg
+            if not ok:
+                print(f"[config_manager] {msg}")
+                _sc.invalidate_cache()
+    except Exception:
+        if _sheets_txn_state.dirty:
+            _sc.invalidate_cache()
+        raise
+    finally:
+        dirty = _sheets_txn_state.dirty
+        _sheets_txn_state.active = False
+        _sheets_txn_state.rows = None
+        _sheets_txn_state.dirty = False
+        _sheets_txn_state.result = None
+        if dirty:
+            invalidate_caches()
+
+
+def _master_rows_for_update() -> List[Dict[str, Any]]:
+    """書き換え用の Sheets マスタ全行（トランザクション中は初回だけシートから読み、以後はその途中状態）。"""
+    if getattr(_sheets_txn_state, "active", False):
+        if _sheets_txn_state.rows is None:
+            _sheets_txn_state.rows = _sc.load_master(force=True)
+        return _sheets_txn_state.rows
+    return _sc.load_master(force=True)
+
+
+def _write_master_rows(rows: List[Dict[str, Any]]) -> None:
+    """Sheets マスタを保存する（トランザクション中は終了時にまとめて保存）。"""
+    if getattr(_sheets_txn_state, "active", False):
+        _sheets_txn_state.rows = rows
+        _sheets_txn_state.dirty = True
+        _sc.stage_master(rows)
+    else:
+        _sc.save_master(rows)
+    invalidate_caches()
+
+
 # ================================================================
 # 店舗管理（JSON のまま）
 # ================================================================
 
 def load_stores() -> List[str]:
+    return list(_stores())
+
+
+def _stores() -> List[str]:
+    """キャッシュ済みの店舗一覧（読み取り専用。書き換える場合は load_stores() を使う）。"""
+    return _memoized_load("stores", STORES_FILE, _read_stores, sheets=False)
+
+
+def _stores_set() -> FrozenSet[str]:
+    """店舗名の集合（所属判定用）。_stores() と同じキャッシュ期間で使い回す。"""
+    return _memoized_load("stores_set", STORES_FILE, lambda: frozenset(_stores()), sheets=False)
+
+
+def _read_stores() -> List[str]:
     ensure_config_dir()
     if STORES_FILE.exists():
         try:
             with open(STORES_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+                data = _json_load(f)
                 return data.get('stores', DEFAULT_STORES)
         except Exception:
             return DEFAULT_STORES
@@ -101,37 +289,77 @@ def load_stores() -> List[str]:
         return DEFAULT_STORES
 
 
-def save_stores(stores: List[str]):
+def _json_load(f) -> Any:
+    """設定ファイルの JSON を読み込む。orjson があればそちらで解析する。"""
+    if _orjson is not None:
+        return _orjson.loads(f.read())
+    return json.load(f)
+
+
+def _json_bytes(obj: Any) -> bytes:
+    """設定ファイル用の JSON（UTF-8・インデント 2）をバイト列で返す。orjson があればそちらを使う。"""
+    if _orjson is not None:
+        return _orjson.dumps(obj, option=_orjson.OPT_INDENT_2 | _orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+# fdatasync はデータとサイズだけを書き出す（更新時刻などのメタデータは待たない）。Windows などでは fsync
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+
+def _atomic_write_json(path: Path, obj: Any, durable: bool = False) -> None:
+    """
+    一時ファイルに書いてから os.replace で置き換える（書き込み途中で落ちても元のファイルは壊れない）。
+    一時ファイル名はプロセス・スレッドごとに分け、同時に保存するセッションどうしで書きかけを潰し合わないようにする。
+    durable=True のときは置き換え前にディスクへの書き出しを待つ。
+    """
     ensure_config_dir()
-    with open(STORES_FILE, 'w', encoding='utf-8') as f:
-        json.dump({'stores': stores}, f, ensure_ascii=False, indent=2)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_json_bytes(obj))
+            if durable:
+                f.flush()
+                _fdatasync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def save_stores(stores: List[str]):
+    _atomic_write_json(STORES_FILE, {'stores': stores})
+    invalidate_caches()
 
 
 def add_store(store_name: str) -> bool:
+    if store_name in _stores_set():
+        return False
     stores = load_stores()
-    if store_name not in stores:
-        stores.append(store_name)
-        save_stores(stores)
-        return True
-    return False
+    stores.append(store_name)
+    save_stores(stores)
+    return True
 
 
 def remove_store(store_name: str) -> bool:
+    if store_name not in _stores_set():
+        return False
     stores = load_stores()
-    if store_name in stores:
-        stores.remove(store_name)
-        save_stores(stores)
-        return True
-    return False
+    stores.remove(store_name)
+    save_stores(stores)
+    return True
 
 
 def auto_learn_store(store_name: str) -> str:
-    stores = load_stores()
     store_name = store_name.strip()
-    for existing_store in stores:
+    # 一覧の先頭から部分一致を探す（完全一致より前にある部分一致を優先する従来の順序を保つ）
+    for existing_store in _stores():
         if existing_store in store_name or store_name in existing_store:
             return existing_store
-    if store_name and store_name not in stores:
+    if store_name:
         add_store(store_name)
     return store_name
 
@@ -142,6 +370,23 @@ def auto_learn_store(store_name: str) -> str:
 
 def load_item_spec_master() -> List[Dict[str, Any]]:
     """品目+規格ごとのマスタ行を返す。Sheets 接続時は Sheets から読み込む。"""
+    return [dict(r) for r in _spec_master_rows()]
+
+
+def _spec_master_rows() -> List[Dict[str, Any]]:
+    """キャッシュ済みのマスタ行（読み取り専用。書き換える場合は load_item_spec_master() を使う）。"""
+    return _memoized_load("item_spec_master", ITEM_SPEC_MASTER_FILE, _read_item_spec_master)
+
+
+def _spec_master_keys() -> List[Tuple[str, str]]:
+    """マスタ各行の (品目, 規格)（前後の空白を除いたもの）。_spec_master_rows() と同じ順で、索引作成時に使い回す。"""
+    return _memoized_load(
+        "item_spec_keys", ITEM_SPEC_MASTER_FILE,
+        lambda: [((r.get("品目") or "").strip(), (r.get("規格") or "").strip()) for r in _spec_master_rows()],
+    )
+
+
+def _read_item_spec_master() -> List[Dict[str, Any]]:
     if _sheets_available():
         rows = _sc.load_master()
         if rows:
@@ -151,7 +396,7 @@ def load_item_spec_master() -> List[Dict[str, Any]]:
     if ITEM_SPEC_MASTER_FILE.exists():
         try:
             with open(ITEM_SPEC_MASTER_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
+                data = _json_load(f)
                 if isinstance(data, list) and data:
                     return data
         except Exception:
@@ -168,7 +413,8 @@ def load_item_spec_master() -> List[Dict[str, Any]]:
             "receive_as_boxes": s.get("receive_as_boxes", False),
             "min_shipping_unit": s.get("min_shipping_unit", 0),
         })
-    _save_item_spec_master_json(rows)
+    # 品目設定から毎回作り直せる内容なので、書き出しの完了は待たない
+    _save_item_spec_master_json(rows, durable=False)
     return rows
 
 
@@ -176,7 +422,7 @@ def save_item_spec_master(rows: List[Dict[str, Any]]) -> None:
     """品目+規格マスタを保存。Sheets 接続時は Sheets に書き込む。"""
     if _sheets_available():
         # 現在の Sheets データから別表記を取得して保持
-        current_sheets = _sc.load_master(force=True)
+        current_sheets = _master_rows_for_update()
         alt_lookup = {}
         for r in current_sheets:
             item = (r.get("品目") or "").strip()
@@ -195,33 +441,38 @@ def save_item_spec_master(rows: List[Dict[str, Any]]) -> None:
                 "受信方法": "箱数" if r.get("receive_as_boxes") else "総数",
                 "最小出荷単位": int(r.get("min_shipping_unit", 0)) or 0,
             })
-        _sc.save_master(sheets_rows)
+        _write_master_rows(sheets_rows)
         return
     # JSON フォールバック
     _save_item_spec_master_json(rows)
 
 
-def _save_item_spec_master_json(rows: List[Dict[str, Any]]) -> None:
-    """JSON ファイルに品目+規格マスタを保存（フォールバック用）。"""
-    ensure_config_dir()
-    tmp_path = ITEM_SPEC_MASTER_FILE.with_suffix(".json.tmp")
-    with open(tmp_path, "w", encoding="utf-8") as f:
-        json.dump(rows, f, ensure_ascii=False, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp_path, ITEM_SPEC_MASTER_FILE)
-    settings = load_item_settings()
+def _save_item_spec_master_json(rows: List[Dict[str, Any]], durable: bool = True) -> None:
+    """
+    JSON ファイルに品目+規格マスタを保存（フォールバック用）。
+    durable=False のときはディスクへの書き出しを待たない（品目設定から作り直せる初期化時など）。
+    """
+    # 規格なし行から品目設定の差分を作り、キャッシュ済み設定と比べて変わったときだけ書き込む
+    delta = {}
     for row in rows:
         item = (row.get("品目") or "").strip()
         spec = (row.get("規格") or "").strip()
         if item and spec == "":
-            settings[item] = {
+            delta[item] = {
                 "default_unit": int(row.get("default_unit", 0)) or 30,
                 "unit_type": (row.get("unit_type") or "袋").strip() or "袋",
                 "receive_as_boxes": bool(row.get("receive_as_boxes", False)),
                 "min_shipping_unit": int(row.get("min_shipping_unit", 0)) or 0,
             }
-    save_item_settings(settings)
+    current = _item_settings()
+    changed = any(current.get(item) != s for item, s in delta.items())
+    _atomic_write_json(ITEM_SPEC_MASTER_FILE, rows, durable=durable)
+    if changed:
+        # 各エントリは差し替えのみで書き換えないため、トップレベルのコピーで足りる
+        settings = dict(current)
+        settings.update(delta)
+        _atomic_write_json(ITEM_SETTINGS_FILE, settings)
+    invalidate_caches()
 
 
 # ================================================================
@@ -230,6 +481,10 @@ def _save_item_spec_master_json(rows: List[Dict[str, Any]]) -> None:
 
 def load_items() -> Dict[str, List[str]]:
     """品目名 → バリアント一覧。Sheets 接続時は Sheets の別表記列から導出。"""
+    return {k: list(v) for k, v in _memoized_load("items", ITEMS_FILE, _read_items).items()}
+
+
+def _read_items() -> Dict[str, List[str]]:
     if _sheets_available():
         rows = _sc.load_master()
         if rows:
@@ -244,7 +499,7 @@ def load_items() -> Dict[str, List[str]]:
     if ITEMS_FILE.exists():
         try:
             with open(ITEMS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+                data = _json_load(f)
                 for k, v in DEFAULT_ITEMS.items():
                     if k not in data:
                         data[k] = v
@@ -259,7 +514,7 @@ def load_items() -> Dict[str, List[str]]:
 def save_items(items: Dict[str, List[str]]):
     """品目名バリアントを保存。Sheets 接続時は別表記列を更新。"""
     if _sheets_available():
-        current_sheets = _sc.load_master(force=True)
+        current_sheets = _master_rows_for_update()
         for row in current_sheets:
             item = (row.get("品目") or "").strip()
             if item in items:
@@ -280,21 +535,20 @@ def save_items(items: Dict[str, List[str]]):
                     "受信方法": "総数",
                     "最小出荷単位": 0,
                 })
-        _sc.save_master(current_sheets)
+        _write_master_rows(current_sheets)
         return
     # JSON フォールバック
-    ensure_config_dir()
-    with open(ITEMS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(items, f, ensure_ascii=False, indent=2)
+    _atomic_write_json(ITEMS_FILE, items)
+    invalidate_caches()
 
 
 def add_item_variant(normalized_name: str, variant: str):
     """品目の別表記を追加。"""
     items = load_items()
-    if normalized_name not in items:
-        items[normalized_name] = []
-    if variant not in items[normalized_name]:
-        items[normalized_name].append(variant)
+    variants = items.setdefault(normalized_name, [])
+    if variant in variants:
+        return
+    variants.append(variant)
     save_items(items)
 
 
@@ -311,10 +565,10 @@ def add_new_item(normalized_name: str, variants: Optional[List[str]] = None):
 def remove_item(normalized_name: str) -> bool:
     """品目を削除。Sheets 接続時は Sheets の行も削除する。"""
     if _sheets_available():
-        current_sheets = _sc.load_master(force=True)
+        current_sheets = _master_rows_for_update()
         new_rows = [r for r in current_sheets if (r.get("品目") or "").strip() != normalized_name]
         if len(new_rows) < len(current_sheets):
-            _sc.save_master(new_rows)
+            _write_master_rows(new_rows)
             return True
         return False
     # JSON フォールバック
@@ -326,13 +580,40 @@ def remove_item(normalized_name: str) -> bool:
     return False
 
 
+def _build_variant_index(items: Dict[str, List[str]]) -> Tuple[Dict[str, Tuple[int, str]], int]:
+    """表記ゆれ -> (品目の並び順, 正規名) の索引と、表記ゆれの最大長。同じ表記は先に出てくる品目を採用する。"""
+    index: Dict[str, Tuple[int, str]] = {}
+    for pos, (normalized, variants) in enumerate(items.items()):
+        for variant in variants or []:
+            if isinstance(variant, str) and variant not in index:
+                index[variant] = (pos, normalized)
+    return index, max((len(v) for v in index), default=0)
+
+
+def _variant_index() -> Tuple[Dict[str, Tuple[int, str]], int]:
+    return _memoized_load("item_variant_index", ITEMS_FILE, lambda: _build_variant_index(_read_items()))
+
+
+def _match_item_variant(item_name: str) -> Optional[str]:
+    """表記ゆれを部分文字列として含む品目のうち、マスタで最も先にあるものの正規名を返す。"""
+    index, max_len = _variant_index()
+    best = index.get("")
+    n = len(item_name)
+    # 品目名は短いので、部分文字列を列挙して索引を引く（品目数×表記ゆれ数の走査をしない）
+    for length in range(1, min(max_len, n) + 1):
+        for start in range(n - length + 1):
+            hit = index.get(item_name[start:start + length])
+            if hit is not None and (best is None or hit[0] < best[0]):
+                best = hit
+    return best[1] if best is not None else None
+
+
 def auto_learn_item(item_name: str) -> str:
     """AI解析結果の品目名をマスタと照合し、正規名を返す。未登録なら自動追加。"""
-    items = load_items()
     item_name = item_name.strip()
-    for normalized, variants in items.items():
-        if item_name in variants or any(variant in item_name for variant in variants):
-            return normalized
+    normalized = _match_item_variant(item_name)
+    if normalized is not None:
+        return normalized
     if item_name:
         add_new_item(item_name, [item_name])
     return item_name
@@ -344,6 +625,15 @@ def auto_learn_item(item_name: str) -> str:
 
 def load_item_settings() -> Dict[str, Dict[str, Any]]:
     """品目ごとの設定を返す。Sheets 接続時は Sheets から導出。"""
+    return {k: dict(v) for k, v in _item_settings().items()}
+
+
+def _item_settings() -> Dict[str, Dict[str, Any]]:
+    """キャッシュ済みの品目設定（読み取り専用。書き換える場合は load_item_settings() を使う）。"""
+    return _memoized_load("item_settings", ITEM_SETTINGS_FILE, _read_item_settings)
+
+
+def _read_item_settings() -> Dict[str, Dict[str, Any]]:
     if _sheets_available():
         rows = _sc.load_master()
         if rows:
@@ -363,37 +653,58 @@ def load_item_settings() -> Dict[str, Dict[str, Any]]:
                 if k not in settings:
                     settings[k] = v.copy()
             return settings
-    # JSON フォールバック
+    # JSON フォールバック（読み込みだけ。既定値の補完・補正をファイルへ書き戻すのは migrate_item_settings()）
     ensure_config_dir()
     if ITEM_SETTINGS_FILE.exists():
         try:
             with open(ITEM_SETTINGS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+                data = _json_load(f)
                 if isinstance(data, dict):
-                    merged = DEFAULT_ITEM_SETTINGS.copy()
-                    merged.update(data)
-                    for key in ["長ねぎバラ", "長ネギバラ"]:
-                        if key in merged:
-                            merged[key] = {**merged[key], "default_unit": 50, "unit_type": "本"}
-                    if "長ネギ" in merged:
-                        merged["長ネギ"] = {**merged["長ネギ"], "default_unit": 30, "unit_type": "本"}
-                    for key in list(merged.keys()):
-                        merged[key] = {**merged[key], "receive_as_boxes": merged[key].get("receive_as_boxes", DEFAULT_ITEM_SETTINGS.get(key, {}).get("receive_as_boxes", False))}
-                    save_item_settings(merged)
-                    return merged
-                return DEFAULT_ITEM_SETTINGS.copy()
+                    return _merge_item_settings(data)
         except Exception:
-            save_item_settings(DEFAULT_ITEM_SETTINGS)
-            return DEFAULT_ITEM_SETTINGS.copy()
-    else:
-        save_item_settings(DEFAULT_ITEM_SETTINGS)
-        return DEFAULT_ITEM_SETTINGS.copy()
+            pass
+    return {k: dict(v) for k, v in DEFAULT_ITEM_SETTINGS.items()}
+
+
+def _merge_item_settings(data: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """ファイルの品目設定に既定値を補完し、長ネギ系の入数・単位を補正する。"""
+    # 各品目の dict を 1 回だけ複製し、以降の補正はその場で書き換える（DEFAULT_ITEM_SETTINGS は変更しない）
+    merged = {k: dict(v) for k, v in DEFAULT_ITEM_SETTINGS.items()}
+    merged.update((k, dict(v)) for k, v in data.items())
+    for key in ["長ねぎバラ", "長ネギバラ"]:
+        if key in merged:
+            merged[key].update(default_unit=50, unit_type="本")
+    if "長ネギ" in merged:
+        merged["長ネギ"].update(default_unit=30, unit_type="本")
+    for key, setting in merged.items():
+        setting.setdefault("receive_as_boxes", DEFAULT_ITEM_SETTINGS.get(key, {}).get("receive_as_boxes", False))
+    return merged
+
+
+def migrate_item_settings() -> bool:
+    """
+    品目設定ファイルを、既定値の補完・補正を反映した内容で書き直す（アプリ起動時に 1 回呼ぶ）。
+    ファイルがない・読めない場合は既定値で作る。内容が変わらなければ書き込まない。Sheets 接続時は何もしない。
+    Returns: 書き込んだら True
+    """
+    if _sheets_available():
+        return False
+    settings = load_item_settings()
+    try:
+        with open(ITEM_SETTINGS_FILE, 'r', encoding='utf-8') as f:
+            current = _json_load(f)
+    except Exception:
+        current = None
+    if current == settings:
+        return False
+    save_item_settings(settings)
+    return True
 
 
 def save_item_settings(settings: Dict[str, Dict[str, Any]]):
     """品目設定を保存。Sheets 接続時は Sheets の設定列を更新。"""
     if _sheets_available():
-        current_sheets = _sc.load_master(force=True)
+        current_sheets = _master_rows_for_update()
         for row in current_sheets:
             item = (row.get("品目") or "").strip()
             if item in settings:
@@ -402,12 +713,11 @@ def save_item_settings(settings: Dict[str, Dict[str, Any]]):
                 row["単位"] = s.get("unit_type", "袋")
                 row["受信方法"] = "箱数" if s.get("receive_as_boxes") else "総数"
                 row["最小出荷単位"] = s.get("min_shipping_unit", 0)
-        _sc.save_master(current_sheets)
+        _write_master_rows(current_sheets)
         return
     # JSON フォールバック
-    ensure_config_dir()
-    with open(ITEM_SETTINGS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(settings, f, ensure_ascii=False, indent=2)
+    _atomic_write_json(ITEM_SETTINGS_FILE, settings)
+    invalidate_caches()
 
 
 def set_item_setting(item: str, default_unit: int, unit_type: str, receive_as_boxes: bool = None):
@@ -449,51 +759,54 @@ def remove_item_setting(item: str):
 # 品目設定の検索（get_item_setting）
 # ================================================================
 
-def get_item_setting(item: str, spec: Optional[str] = None) -> Dict[str, Any]:
-    """品目（と規格）に一致する設定を返す。"""
+def _build_spec_index(rows: List[Dict[str, Any]], keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Mapping[str, Any]]:
+    """(品目, 規格) -> 設定（読み取り専用）の索引。同じ組が複数あるときは先頭の行を採用する。"""
+    index: Dict[Tuple[str, str], Mapping[str, Any]] = {}
+    for key, r in zip(keys, rows):
+        if key not in index:
+            index[key] = MappingProxyType(_extract_setting(r))
+    return index
+
+
+def _spec_index() -> Dict[Tuple[str, str], Mapping[str, Any]]:
+    """キャッシュ済みマスタから作った (品目, 規格) 索引（マスタと同じ条件で作り直す）。"""
+    return _memoized_load("item_spec_index", ITEM_SPEC_MASTER_FILE, lambda: _build_spec_index(_spec_master_rows(), _spec_master_keys()))
+
+
+# マスタにも品目設定にもない品目の設定
+_EMPTY_ITEM_SETTING: Mapping[str, Any] = MappingProxyType(
+    {"default_unit": 0, "unit_type": "袋", "receive_as_boxes": False, "min_shipping_unit": 0}
+)
+
+
+def get_item_setting(item: str, spec: Optional[str] = None) -> Mapping[str, Any]:
+    """
+    品目（と規格）に一致する設定を返す。
+    キャッシュをそのまま返す読み取り専用のマッピングなので、書き換える場合は dict(...) で複製する。
+    """
     spec_s = (spec or "").strip()
     item_s = (item or "").strip()
-    rows = load_item_spec_master()
+    index = _spec_index()
 
     # 完全一致検索
-    for r in rows:
-        if (r.get("品目") or "").strip() != item_s:
-            continue
-        r_spec = (r.get("規格") or "").strip()
-        if r_spec == spec_s:
-            return _extract_setting(r)
+    hit = index.get((item_s, spec_s))
 
     # 品目+規格が分かれている場合: 複合名（胡瓜バラ等）の行を参照
-    if spec_s:
-        if item_s == "胡瓜" and spec_s in ("100本", "50本"):
-            composite_item = "胡瓜バラ(100本)" if spec_s == "100本" else "胡瓜バラ(50本)"
-            for r in rows:
-                if (r.get("品目") or "").strip() != composite_item:
-                    continue
-                if (r.get("規格") or "").strip() == "バラ":
-                    return _extract_setting(r)
-        composite_item = ITEM_SPEC_COMPOSITE_LOOKUP.get((item_s, spec_s))
-        if composite_item:
-            for r in rows:
-                if (r.get("品目") or "").strip() != composite_item:
-                    continue
-                r_spec = (r.get("規格") or "").strip()
-                if r_spec == spec_s:
-                    return _extract_setting(r)
-
-    # 規格なしの行にフォールバック
-    if spec_s != "":
-        for r in rows:
-            if (r.get("品目") or "").strip() == item_s and (r.get("規格") or "").strip() == "":
-                return _extract_setting(r)
-
-    settings = load_item_settings()
+    if hit is None and spec_s:
+        composite_key = ITEM_SPEC_COMPOSITE_LOOKUP.get((item_s, spec_s))
+        if composite_key:
+            hit = index.get(composite_key)
+        # 規格なしの行にフォールバック
+        if hit is None:
+            hit = index.get((item_s, ""))
+    if hit is not None:
+        return hit
+
+    # 全品目を複製する load_item_settings() ではなく、該当する 1 件だけを補完する
+    settings = _item_settings()
     if item in settings:
-        s = settings[item].copy()
-        s.setdefault("receive_as_boxes", False)
-        s.setdefault("min_shipping_unit", 0)
-        return s
-    return {"default_unit": 0, "unit_type": "袋", "receive_as_boxes": False, "min_shipping_unit": 0}
+        return MappingProxyType({"receive_as_boxes": False, "min_shipping_unit": 0, **settings[item]})
+    return _EMPTY_ITEM_SETTING
 
 
 def _extract_setting(r: Dict[str, Any]) -> Dict[str, Any]:
@@ -510,55 +823,126 @@ def _extract_setting(r: Dict[str, Any]) -> Dict[str, Any]:
 # 入数キャッシュ（JSON のまま）
 # ================================================================
 
+@lru_cache(maxsize=2048)
+def _norm_units_part(v: Optional[str]) -> str:
+    """入数キャッシュのキーの各部分（前後の空白と半角スペースを除く）。"""
+    return (v or "").strip().replace(" ", "")
+
+
 def _units_key(item: str, spec: str, store: str) -> str:
-    def n(v):
-        return (v or "").strip().replace(" ", "")
-    return f"{n(item)}|{n(spec)}|{n(store)}"
+    return f"{_norm_units_part(item)}|{_norm_units_part(spec)}|{_norm_units_part(store)}"
+
+
+# 入数キャッシュの保存をまとめるバッチ（スレッド＝セッションごと）
+_units_batch_state = threading.local()
+
+
+@contextmanager
+def units_batch():
+    """
+    ブロック内の入数キャッシュの保存（add_unit_if_new / set_unit / set_units_bulk など）を終了時の 1 回にまとめる。
+    途中の変更は lookup_unit / load_units にも見える。関数のデコレータとしても使える。
+    """
+    if getattr(_units_batch_state, "units", None) is not None:
+        yield
+        return
+    _units_batch_state.units = load_units()
+    _units_batch_state.dirty = False
+    try:
+        yield
+        if _units_batch_state.dirty:
+            _write_units(_units_batch_state.units)
+    finally:
+        _units_batch_state.units = None
 
 
 def load_units() -> Dict[str, int]:
+    return dict(_units())
+
+
+def _units() -> Dict[str, int]:
+    """キャッシュ済みの入数キャッシュ（読み取り専用。書き換える場合は load_units() を使う）。"""
+    pending = getattr(_units_batch_state, "units", None)
+    if pending is not None:
+        return pending
+    return _memoized_load("units", UNITS_FILE, _read_units, sheets=False)
+
+
+def _read_units() -> Dict[str, int]:
     ensure_config_dir()
-    if UNITS_FILE.exists():
-        try:
-            with open(UNITS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if isinstance(data, dict):
-                    return {k: int(v) for k, v in data.items() if v}
-                return {}
-        except Exception:
-            return {}
+    # exists() で確かめずに開く（ファイルが無ければ FileNotFoundError で空を返す）
+    try:
+        with open(UNITS_FILE, 'r', encoding='utf-8') as f:
+            data = _json_load(f)
+        if isinstance(data, dict):
+            return {k: int(v) for k, v in data.items() if v}
+    except Exception:
+        pass
     return {}
 
 
 def save_units(units: Dict[str, int]):
-    ensure_config_dir()
-    with open(UNITS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(units, f, ensure_ascii=False, indent=2)
+    if getattr(_units_batch_state, "units", None) is not None:
+        _units_batch_state.units = dict(units)
+        _units_batch_state.dirty = True
+        return
+    _write_units(units)
 
 
-def lookup_unit(item: str, spec: str, store: str) -> int:
+def _write_units(units: Dict[str, int]):
+    _atomic_write_json(UNITS_FILE, units)
+    _MASTER_CACHE.pop("units", None)
+
+
+def _put_unit(key: str, unit: int) -> None:
+    """入数を 1 件書き込む。units_batch() 内では保留中の辞書を直接更新し、全体のコピーを作らない。"""
+    pending = getattr(_units_batch_state, "units", None)
+    if pending is not None:
+        pending[key] = unit
+        _units_batch_state.dirty = True
+        return
     units = load_units()
-    return units.get(_units_key(item, spec, store), 0)
+    units[key] = unit
+    _write_units(units)
+
+
+def lookup_unit(item: str, spec: str, store: str) -> int:
+    return _units().get(_units_key(item, spec, store), 0)
 
 
 def add_unit_if_new(item: str, spec: str, store: str, unit: int) -> bool:
     if unit <= 0:
         return False
-    units = load_units()
     key = _units_key(item, spec, store)
-    if key in units:
+    if key in _units():
         return False
-    units[key] = unit
-    save_units(units)
+    _put_unit(key, unit)
     return True
 
 
 def set_unit(item: str, spec: str, store: str, unit: int) -> None:
     if unit <= 0:
         return
+    key = _units_key(item, spec, store)
+    if _units().get(key) == unit:
+        return  # 値が変わらなければファイル全体を書き直さない
+    _put_unit(key, unit)
+
+
+def set_units_bulk(updates: Iterable[Tuple[str, str, str, int]]) -> int:
+    """(品目, 規格, 店舗, 入数) をまとめて保存する。読み書きは 1 回だけで、値が変わらなければ書き込まない。"""
     units = load_units()
-    units[_units_key(item, spec, store)] = unit
-    save_units(units)
+    changed = 0
+    for item, spec, store, unit in updates:
+        if unit <= 0:
+            continue
+        key = _units_key(item, spec, store)
+        if units.get(key) != unit:
+            units[key] = unit
+            changed += 1
+    if changed:
+        save_units(units)
+    return changed
 
 
 def initialize_default_units():
@@ -587,18 +971,25 @@ def extract_unit_size_from_spec(spec_name: Optional[str]) -> int:
     """規格名に含まれる数値（入数）を正規表現で抽出する。"""
     if spec_name is None or not isinstance(spec_name, str):
         return 0
+    return _extract_unit_size(spec_name)
+
+
+@lru_cache(maxsize=1024)
+def _extract_unit_size(spec_name: str) -> int:
+    # 規格名だけで決まる（マスタに依存しない）ので、マスタ更新時にも破棄不要
     s = spec_name.strip()
     if not s:
         return 0
-    for pat in SPEC_UNIT_SIZE_PATTERNS:
-        m = pat.search(s)
-        if m:
-            try:
-                n = int(m.group(1))
-                return max(1, min(n, 9999))
-            except (ValueError, IndexError):
-                continue
-    return 0
+    # 優先順位の最も高いパターンの（その中で最も左の）一致を採用する
+    best = None
+    for m in _spec_unit_size_re().finditer(s):
+        if best is None or m.lastindex < best.lastindex:
+            best = m
+            if best.lastindex == 1:
+                break
+    if best is None:
+        return 0
+    return max(1, min(int(best.group(best.lastindex)), 9999))
 
 
 def get_effective_unit_size(item: str, spec: Optional[str] = None) -> int:
@@ -620,27 +1011,56 @@ def get_min_shipping_unit(item: str, spec: Optional[str] = None) -> int:
     return int(setting.get("min_shipping_unit", 0)) or 0
 
 
+_DEFAULT_SPEC_FOR_ITEM = {
+    "胡瓜": "3本", "胡瓜平箱": "平箱", "胡瓜バラ(100本)": "バラ", "胡瓜バラ(50本)": "バラ",
+    "長ネギ": "2本", "長ねぎ": "2本", "長ねぎバラ": "バラ", "長ネギバラ": "バラ",
+    "春菊": "1束", "青梗菜": "2~3株", "チンゲン菜": "2~3株",
+}
+
+
 def get_default_spec_for_item(item_name: str) -> str:
     """品目名に対する規格の既定表示値。"""
-    s = (item_name or "").strip()
-    _defaults = {
-        "胡瓜": "3本", "胡瓜平箱": "平箱", "胡瓜バラ(100本)": "バラ", "胡瓜バラ(50本)": "バラ",
-        "長ネギ": "2本", "長ねぎ": "2本", "長ねぎバラ": "バラ", "長ネギバラ": "バラ",
-        "春菊": "1束", "青梗菜": "2~3株", "チンゲン菜": "2~3株",
-    }
-    return _defaults.get(s, "")
+    return _DEFAULT_SPEC_FOR_ITEM.get((item_name or "").strip(), "")
+
+
+def _build_specs_by_item(keys: List[Tuple[str, str]]) -> Dict[str, List[str]]:
+    """品目 -> マスタ登録済み規格（マスタの行順）の索引。"""
+    index: Dict[str, List[str]] = {}
+    for item, spec in keys:
+        index.setdefault(item, []).append(spec)
+    return index
+
+
+def _specs_by_item() -> Dict[str, List[str]]:
+    return _memoized_load("specs_by_item", ITEM_SPEC_MASTER_FILE, lambda: _build_specs_by_item(_spec_master_keys()))
 
 
 def get_known_specs_for_item(item: str) -> List[str]:
     """品目に対するマスタ登録済み規格のリスト。"""
-    rows = load_item_spec_master()
-    return [(r.get("規格") or "").strip() for r in rows if (r.get("品目") or "").strip() == (item or "").strip()]
+    return list(_specs_by_item().get((item or "").strip(), ()))
 
 
 def is_spec_in_master(item: str, spec: str) -> bool:
     """AI解析結果の規格がマスタに登録されているか。"""
-    spec_s = (spec or "").strip()
-    known = get_known_specs_for_item(item)
-    if not known:
-        return False
-    return spec_s in known
+    return ((item or "").strip(), (spec or "").strip()) in _spec_index()
+
+
+# 表編集・検証ループ向けのメモ化版（同じ (品目, 規格) の繰り返し参照でマスタを走査し直さない）
+@lookup_cache
+def get_effective_unit_size_cached(item: str, spec: Optional[str] = None) -> int:
+    return get_effective_unit_size(item, spec)
+
+
+@lookup_cache
+def get_min_shipping_unit_cached(item: str, spec: Optional[str] = None) -> int:
+    return get_min_shipping_unit(item, spec)
+
+
+@lookup_cache
+def get_known_specs_for_item_cached(item: str) -> Tuple[str, ...]:
+    return tuple(get_known_specs_for_item(item))
+
+
+@lookup_cache
+def is_spec_in_master_cached(item: str, spec: str) -> bool:
+    return is_spec_in_master(item, spec)
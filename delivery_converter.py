@@ -3,32 +3,48 @@ v2 result to delivery rows converter.
 規格マスタ／規格名の入数（unit_size）を考慮した合計数量で J列・K列を計算する。
 """
 from __future__ import annotations
-from typing import List, Dict, Any, Optional, Tuple, Union
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
 from datetime import datetime
-import uuid
+from functools import lru_cache
+import csv
+import io
+import os
 import re
 
 try:
-    from config_manager import get_effective_unit_size
+    # 同じ (品目, 規格) が並ぶバッチでマスタ参照を繰り返さないよう、メモ化版を使う
+    from config_manager import get_effective_unit_size_cached as get_effective_unit_size
 except ImportError:
     def get_effective_unit_size(_item: str, _spec: Optional[str] = None) -> int:
         return 0
 
 from box_remainder_calc import total_to_boxes_remainder, boxes_remainder_to_total
 
+_NON_DIGIT_RE = re.compile(r"\D")
 _DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%Y%m%d")
 _OUTPUT_DATE_FMT = "%Y/%m/%d"
 
 def _normalize_date(date_str: str) -> str:
     if not date_str or not isinstance(date_str, str):
         return date_str or ""
-    s = date_str.strip()
-    for fmt in _DATE_FORMATS:
-        try:
-            return datetime.strptime(s, fmt).strftime(_OUTPUT_DATE_FMT)
-        except (ValueError, TypeError):
-            continue
-    return s
+    return _normalize_date_str(date_str.strip())
+
+@lru_cache(maxsize=256)
+def _normalize_date_str(s: str) -> str:
+    # 区切り文字で当てはまりうる形式は 1 つに決まるので、その形式だけを試す
+    fmt = _DATE_FORMATS[0] if "-" in s else _DATE_FORMATS[1] if "/" in s else _DATE_FORMATS[2]
+    try:
+        return datetime.strptime(s, fmt).strftime(_OUTPUT_DATE_FMT)
+    except ValueError:
+        return s
+
+def _new_delivery_ids(n: int) -> Iterator[str]:
+    """
+    納品ID（16 進 8 桁＝32 ビットの乱数）を n 個まとめて作る。
+    uuid4().hex[:8] と同じ長さ・乱数ビット数で、OS の乱数は 1 回だけ読む。
+    """
+    raw = os.urandom(4 * n).hex()
+    return (raw[i:i + 8] for i in range(0, 8 * n, 8))
 
 def _safe_int(v: Any, max_val: int = 999_999) -> int:
     if v is None:
@@ -39,7 +55,9 @@ def _safe_int(v: Any, max_val: int = 999_999) -> int:
         if v != v:
             return 0
         return max(0, min(int(v), max_val))
-    raw = re.sub(r"\D", "", str(v))
+    s = v if isinstance(v, str) else str(v)
+    # 数字だけの文字列（全角数字を含む）はそのまま int() に渡す。isdecimal() は \d と同じ文字集合
+    raw = s if s.isdecimal() else _NON_DIGIT_RE.sub("", s)
     if not raw:
         return 0
     try:
@@ -66,25 +84,61 @@ def _compute_quantity(item: str, spec: str, unit: int, boxes: int, remainder: in
     return boxes_remainder_to_total(unit, boxes, remainder)
 
 
-def _lookup_unit_price(item: str, spec: str, prices: Dict) -> float:
-    key_spec = (item, spec)
-    key_item = item
-    if key_spec in prices:
-        try:
-            return float(prices[key_spec])
-        except (TypeError, ValueError):
-            pass
-    if key_item in prices:
+def _iter_quantified_records(v2_result: List[Dict[str, Any]]) -> Iterator[Tuple[str, str, str, int]]:
+    """v2 形式の各行から (店舗, 品目, 規格, 合計数量) を取り出す。合計数量が 0 以下の行は飛ばす。"""
+    for rec in v2_result:
+        if not isinstance(rec, dict):
+            continue
+        item = (rec.get("item") or "").strip()
+        spec = (rec.get("spec") or "").strip()
+        quantity = _compute_quantity(
+            item, spec,
+            _safe_int(rec.get("unit", 0)), _safe_int(rec.get("boxes", 0)), _safe_int(rec.get("remainder", 0)),
+        )
+        if quantity <= 0:
+            continue
+        yield (rec.get("store") or "").strip(), item, spec, quantity
+
+
+def _price_tables(prices: Dict) -> Tuple[Dict[Any, float], List[Tuple[str, float]]]:
+    """
+    単価辞書を検索用に整える。数値に変換できない単価は除く。
+    Returns: (完全一致用 {キー: 単価}, 部分一致用 [(文字列キー, 単価), ...]（辞書の順）)
+    """
+    exact: Dict[Any, float] = {}
+    substring: List[Tuple[str, float]] = []
+    for k, val in prices.items():
         try:
-            return float(prices[key_item])
+            price = float(val)
         except (TypeError, ValueError):
-            pass
-    for k, val in prices.items():
-        if isinstance(k, str) and k and item and k in item:
-            try:
-                return float(val)
-            except (TypeError, ValueError):
-                continue
+            continue
+        exact[k] = price
+        if isinstance(k, str) and k:
+            substring.append((k, price))
+    return exact, substring
+
+
+def _lookup_unit_price(
+    item: str,
+    spec: str,
+    prices: Dict,
+    tables: Optional[Tuple[Dict[Any, float], List[Tuple[str, float]]]] = None,
+) -> float:
+    """
+    単価を (品目, 規格) → 品目 → 品目名に含まれるキー の順で探す。
+    tables は _price_tables(prices) の結果（複数行で使い回すときに渡す）。
+    """
+    exact, substring = tables if tables is not None else _price_tables(prices)
+    price = exact.get((item, spec))
+    if price is None:
+        price = exact.get(item)
+    if price is not None:
+        return price
+    if not item:
+        return 0.0
+    for k, val in substring:
+        if k in item:
+            return val
     return 0.0
 
 def v2_result_to_delivery_rows(
@@ -104,19 +158,12 @@ def v2_result_to_delivery_rows(
     tax_rate = (default_tax_rate or "8%").strip() if isinstance(default_tax_rate, str) else "8%"
     store_map = store_to_dest_billing if isinstance(store_to_dest_billing, dict) else {}
     prices = default_unit_prices if isinstance(default_unit_prices, dict) else {}
+    # 検索用の表は 1 回だけ作り、同じ (品目, 規格) の単価は使い回す
+    price_tables = _price_tables(prices)
+    price_memo: Dict[Tuple[str, str], float] = {}
+    ids = _new_delivery_ids(len(v2_result))
     rows: List[Dict[str, Any]] = []
-    for rec in v2_result:
-        if not isinstance(rec, dict):
-            continue
-        store = (rec.get("store") or "").strip()
-        item = (rec.get("item") or "").strip()
-        spec = (rec.get("spec") or "").strip()
-        unit = _safe_int(rec.get("unit", 0))
-        boxes = _safe_int(rec.get("boxes", 0))
-        remainder = _safe_int(rec.get("remainder", 0))
-        quantity = _compute_quantity(item, spec, unit, boxes, remainder)
-        if quantity <= 0:
-            continue
+    for store, item, spec, quantity in _iter_quantified_records(v2_result):
         if store in store_map:
             t = store_map[store]
             dest = (t[0] or store).strip() if isinstance(t, (tuple, list)) and len(t) >= 1 else store
@@ -124,10 +171,12 @@ def v2_result_to_delivery_rows(
         else:
             dest = store
             billing = store
-        unit_price = _lookup_unit_price(item, spec, prices)
+        unit_price = price_memo.get((item, spec))
+        if unit_price is None:
+            unit_price = price_memo[(item, spec)] = _lookup_unit_price(item, spec, prices, price_tables)
         amount = int(round(unit_price * quantity)) if unit_price else 0
         rows.append({
-            "納品ID": uuid.uuid4().hex[:8],
+            "納品ID": next(ids),
             "納品日付": delivery_date_str,
             "農家": farmer_s,
             "納品先": dest,
@@ -143,6 +192,11 @@ def v2_result_to_delivery_rows(
         })
     return rows
 
+def reissue_delivery_ids(delivery_rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """納品データ行をコピーして納品IDを振り直す（キャッシュした変換結果を使い回すときに、出力ごとに別の ID にする）。"""
+    ids = _new_delivery_ids(len(delivery_rows))
+    return [{**r, "納品ID": next(ids)} for r in delivery_rows]
+
 def v2_result_to_ledger_rows(
     v2_result: List[Dict[str, Any]],
     delivery_date: str,
@@ -156,19 +210,9 @@ def v2_result_to_ledger_rows(
         return []
     delivery_date_str = _normalize_date(delivery_date)
     farmer_s = (farmer or "").strip() if isinstance(farmer, str) else ""
+    ids = _new_delivery_ids(len(v2_result))
     rows: List[Dict[str, Any]] = []
-    for rec in v2_result:
-        if not isinstance(rec, dict):
-            continue
-        store = (rec.get("store") or "").strip()
-        item = (rec.get("item") or "").strip()
-        spec = (rec.get("spec") or "").strip()
-        unit = _safe_int(rec.get("unit", 0))
-        boxes = _safe_int(rec.get("boxes", 0))
-        remainder = _safe_int(rec.get("remainder", 0))
-        quantity = _compute_quantity(item, spec, unit, boxes, remainder)
-        if quantity <= 0:
-            continue
+    for store, item, spec, quantity in _iter_quantified_records(v2_result):
         rows.append({
             "納品日付": delivery_date_str,
             "納品先": store,
@@ -179,7 +223,7 @@ def v2_result_to_ledger_rows(
             "確定フラグ": "未確定",
             "確定日時": "",
             "チェック": "",
-            "納品ID": uuid.uuid4().hex[:8],
+            "納品ID": next(ids),
             "納品単価": 0,
             "納品金額": 0,
             "ステータス": "未確定",
@@ -187,6 +231,18 @@ def v2_result_to_ledger_rows(
     return rows
 
 
+def delivery_rows_to_csv_bytes(delivery_rows: List[Dict[str, Any]]) -> bytes:
+    """納品データ行を Excel 向けの CSV（UTF-8 BOM 付き）に変換する。列順は先頭行のキー順。"""
+    rows = [r for r in (delivery_rows or []) if isinstance(r, dict)]
+    if not rows:
+        return b""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=list(rows[0].keys()), extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rows)
+    return ("\ufeff" + buf.getvalue()).encode("utf-8")
+
+
 def delivery_rows_to_v2_format(delivery_rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     if not delivery_rows or not isinstance(delivery_rows, list):
         return []
@@ -3,8 +3,15 @@
 """
 from __future__ import annotations
 from typing import Any, List, Dict, Optional, Tuple
+from functools import lru_cache
+from operator import itemgetter
+import json
 import os
+import random
 import re
+import stat
+import threading
+import time
 
 DELIVERY_SHEET_COLUMNS = [
     "納品ID", "納品日付", "農家", "納品先", "請求先", "品目", "持込日付",
@@ -16,27 +23,82 @@ LEDGER_SHEET_COLUMNS = [
     "確定フラグ", "確定日時", "チェック", "納品ID",
     "納品単価", "納品金額", "ステータス",
 ]
-_APPEND_BATCH_SIZE = 500
+# 追記用の行を列順に取り出す（欠けている列は既定値で埋めた辞書から取る）
+_DELIVERY_ROW_GETTER = itemgetter(*DELIVERY_SHEET_COLUMNS)
+_DELIVERY_DEFAULTS = dict.fromkeys(DELIVERY_SHEET_COLUMNS, "")
+_LEDGER_ROW_GETTER = itemgetter(*LEDGER_SHEET_COLUMNS)
+_LEDGER_DEFAULTS = {**dict.fromkeys(LEDGER_SHEET_COLUMNS, ""), "ステータス": "未確定", "納品単価": 0, "納品金額": 0}
+# append_rows 1 回あたりの送信量の目安（推奨ペイロード 2MB に少し余裕を残す）と行数の下限・上限
+_APPEND_TARGET_BYTES = 1_800_000
+_APPEND_MIN_ROWS = 50
+_APPEND_MAX_ROWS = 5000
+# 1 回あたりの行数を固定したいときの環境変数
+_APPEND_BATCH_ROWS_ENV = "SHEETS_APPEND_BATCH_ROWS"
 _SPREADSHEET_ID_PATTERN = re.compile(r"^[a-zA-Z0-9_-]+$")
+# gspread のクライアント・ブック・シートのハンドルを使い回す秒数（認証・メタデータ取得の往復を省く）
+_HANDLE_TTL_SEC = 300.0
+# キー -> (取得時刻, 認証情報, ハンドル)。認証情報を保持して id() の再利用による取り違えを防ぐ
+_handle_cache: Dict[tuple, Tuple[float, Any, Any]] = {}
+_handle_cache_lock = threading.Lock()
+# API が 429（レート制限）や 5xx を返したときの再送回数と待ち時間（秒。指数的に増やし上限で打ち切る）
+_RETRY_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+_RETRY_MAX_ATTEMPTS = 6
+_RETRY_BASE_SEC = 1.0
+_RETRY_CAP_SEC = 32.0
+
+# そのまま書き込める型（サブクラスでない場合の早道。bool は int のサブクラスなので含めない）
+_CELL_PASSTHROUGH_TYPES = frozenset((str, int, float))
 
 def _normalize_cell_value(v: Any):
+    if type(v) in _CELL_PASSTHROUGH_TYPES:
+        return v
     if v is None:
         return ""
-    if isinstance(v, (str, int, float)):
-        return v
+    # bool は int のサブクラスなので、数値の判定より先に見る
     if isinstance(v, bool):
         return str(v).lower()
+    if isinstance(v, (str, int, float)):
+        return v
     return str(v)
 
+# 認証情報のキャッシュ。キー -> Credentials（トークンの更新は google-auth が内部で行う）
+_credentials_cache: Dict[tuple, Any] = {}
+
+
+def _cache_credentials(key: tuple, creds: Any) -> Any:
+    """
+    作成した認証情報をキャッシュに入れる。
+    google-auth が対応していれば、期限が近づいたトークンを裏のスレッドで先に更新させる（期限切れまでは手元のトークンで処理を続ける）。
+    """
+    enable = getattr(creds, "with_non_blocking_refresh", None)
+    if enable is not None:
+        enable()
+    _credentials_cache[key] = creds
+    return creds
+
+
 def _get_credentials(st_secrets: Any = None) -> Any:
+    """
+    サービスアカウントの認証情報を返す（環境変数の鍵ファイル → st_secrets["gcp"] の順）。
+    同じ鍵ファイル（パス・更新時刻・サイズ）や同じ secrets の内容なら、作成済みのものを使い回す。
+    """
     try:
         from google.oauth2.service_account import Credentials
     except ImportError:
         return None
     keyfile = os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
-    if keyfile and os.path.isfile(keyfile):
+    if keyfile:
         try:
-            return Credentials.from_service_account_file(keyfile, scopes=["https://www.googleapis.com/auth/spreadsheets"])
+            # isfile と stat を別々に呼ばず、1 回の stat で存在確認とキャッシュキーを兼ねる
+            st = os.stat(keyfile)
+            if stat.S_ISREG(st.st_mode):
+                key = ("file", keyfile, st.st_mtime_ns, st.st_size)
+                creds = _credentials_cache.get(key)
+                if creds is None:
+                    creds = _cache_credentials(
+                        key, Credentials.from_service_account_file(keyfile, scopes=["https://www.googleapis.com/auth/spreadsheets"])
+                    )
+                return creds
         except (OSError, ValueError):
             pass
     if st_secrets is not None:
@@ -45,11 +107,113 @@ def _get_credentials(st_secrets: Any = None) -> Any:
             if gcp is not None:
                 info = dict(gcp) if isinstance(gcp, dict) else dict(getattr(gcp, "_raw", gcp))
                 if info.get("private_key") and info.get("client_email"):
-                    return Credentials.from_service_account_info(info, scopes=["https://www.googleapis.com/auth/spreadsheets"])
+                    key = ("info", tuple(sorted((k, str(v)) for k, v in info.items())))
+                    creds = _credentials_cache.get(key)
+                    if creds is None:
+                        creds = _cache_credentials(
+                            key, Credentials.from_service_account_info(info, scopes=["https://www.googleapis.com/auth/spreadsheets"])
+                        )
+                    return creds
         except (TypeError, ValueError, KeyError):
             pass
     return None
 
+
+def _cached_handle(key: tuple, creds: Any, factory):
+    now = time.monotonic()
+    with _handle_cache_lock:
+        hit = _handle_cache.get(key)
+    if hit is not None and hit[1] is creds and now - hit[0] < _HANDLE_TTL_SEC:
+        return hit[2]
+    handle = factory()
+    with _handle_cache_lock:
+        # 期限切れのエントリも掃除する（認証情報を毎回作り直す呼び出し元でも溜まり続けないように）
+        for k in [k for k, v in _handle_cache.items() if now - v[0] >= _HANDLE_TTL_SEC]:
+            del _handle_cache[k]
+        _handle_cache[key] = (now, creds, handle)
+    return handle
+
+
+def _retry(fn, *args, _retry_server_errors: bool = True, **kwargs):
+    """
+    fn を呼び、API が 429 や 5xx を返したら min(上限, 基準 × 2^回数) + 0〜1 秒待って再送する。
+    _retry_server_errors=False なら 429 だけ再送する（5xx はサーバー側で反映済みのことがあり、追記を送り直すと行が重複するため）。
+    """
+    for attempt in range(_RETRY_MAX_ATTEMPTS):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            retryable = status == 429 or (_retry_server_errors and status in _RETRY_STATUS_CODES)
+            if not retryable or attempt == _RETRY_MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(min(_RETRY_CAP_SEC, _RETRY_BASE_SEC * 2 ** attempt) + random.uniform(0, 1))
+
+
+@lru_cache(maxsize=1)
+def _retrying_http_client():
+    """すべての API 呼び出しを _retry 経由で送る gspread の HTTP クライアントクラスを返す。"""
+    from gspread.http_client import HTTPClient
+
+    class _RetryingHTTPClient(HTTPClient):
+        def request(self, method, endpoint, *args, **kwargs):
+            return _retry(super().request, method, endpoint, *args, _retry_server_errors=":append" not in endpoint, **kwargs)
+
+    return _RetryingHTTPClient
+
+
+def _get_sheet(creds: Any, sid: str, sheet_name: str):
+    """
+    ワークシートを返す。authorize / open_by_key / worksheet の結果を認証情報ごとに
+    _HANDLE_TTL_SEC 秒キャッシュし、同じシートへの連続操作で API の往復を繰り返さない。
+    """
+    import gspread
+    cid = id(creds)
+    client = _cached_handle(("client", cid), creds, lambda: gspread.authorize(creds, http_client=_retrying_http_client()))
+    workbook = _cached_handle(("workbook", cid, sid), creds, lambda: client.open_by_key(sid))
+    return _cached_handle(("sheet", cid, sid, sheet_name), creds, lambda: workbook.worksheet(sheet_name))
+
+
+def _forget_sheet(creds: Any, sid: str, sheet_name: str) -> None:
+    """取得や読み書きに失敗したシートのハンドルを捨て、次回は取り直す。"""
+    cid = id(creds)
+    with _handle_cache_lock:
+        _handle_cache.pop(("workbook", cid, sid), None)
+        _handle_cache.pop(("sheet", cid, sid, sheet_name), None)
+
+
+def _project_row(row: Dict[str, Any], getter, defaults: Dict[str, Any]) -> List[Any]:
+    """行辞書を列順の値リストにする。変換関数が作る全列そろった行は既定値と合成せずに取り出す。"""
+    try:
+        values = getter(row)
+    except KeyError:
+        values = getter({**defaults, **row})
+    return list(map(_normalize_cell_value, values))
+
+
+def _append_batch_rows(data: List[List[Any]]) -> int:
+    """
+    append_rows 1 回あたりの行数を決める。環境変数 SHEETS_APPEND_BATCH_ROWS があればそれを使い、
+    なければ先頭数行の JSON サイズから 1 回の送信が _APPEND_TARGET_BYTES 前後になる行数を求める。
+    """
+    env = os.environ.get(_APPEND_BATCH_ROWS_ENV, "").strip()
+    if env.isdecimal() and int(env) > 0:
+        return int(env)
+    sample = data[:20]
+    row_bytes = max(1, len(json.dumps(sample, default=str)) // max(1, len(sample)))
+    return max(_APPEND_MIN_ROWS, min(_APPEND_MAX_ROWS, _APPEND_TARGET_BYTES // row_bytes))
+
+
+def _append_in_chunks(sheet, data: List[List[Any]], batch_rows: Optional[int] = None) -> None:
+    """
+    行を batch_rows 行ずつ（省略時は _append_batch_rows で決めた行数）順に追記する。
+    並列に送ると同じシートへの追記どうしで行の順序が崩れ、書き込み先が重なることもあるため、順番に送る。
+    """
+    n = batch_rows or _append_batch_rows(data)
+    for i in range(0, len(data), n):
+        sheet.append_rows(data[i : i + n], value_input_option="USER_ENTERED")
+
+
 def _validate_spreadsheet_id(sid: str) -> bool:
     s = (sid or "").strip()
     if len(s) < 20:
@@ -73,23 +237,21 @@ def append_delivery_rows(spreadsheet_id: str, rows: List[Dict[str, Any]], sheet_
     except ImportError:
         return False, "gspread がインストールされていません。pip install gspread google-auth を実行してください。"
     try:
-        client = gspread.authorize(creds)
-        workbook = client.open_by_key(sid)
-        sheet = workbook.worksheet(sheet_name_s)
+        sheet = _get_sheet(creds, sid, sheet_name_s)
     except Exception as e:
+        _forget_sheet(creds, sid, sheet_name_s)
         return False, f"スプレッドシートの取得に失敗しました: {str(e).strip() or '不明なエラー'}"
     data = []
     for row in rows:
         if not isinstance(row, dict):
             continue
-        data.append([_normalize_cell_value(row.get(col, "")) for col in DELIVERY_SHEET_COLUMNS])
+        data.append(_project_row(row, _DELIVERY_ROW_GETTER, _DELIVERY_DEFAULTS))
     if not data:
         return True, "追記する有効な行がありません。"
     try:
-        for i in range(0, len(data), _APPEND_BATCH_SIZE):
-            chunk = data[i : i + _APPEND_BATCH_SIZE]
-            sheet.append_rows(chunk, value_input_option="USER_ENTERED")
+        _append_in_chunks(sheet, data)
     except Exception as e:
+        _forget_sheet(creds, sid, sheet_name_s)
         return False, f"追記に失敗しました: {e}"
     return True, f"{len(data)} 行を追記しました。"
 
@@ -117,26 +279,23 @@ def append_ledger_rows(
     except ImportError:
         return False, "gspread がインストールされていません。pip install gspread google-auth を実行してください。"
     try:
-        client = gspread.authorize(creds)
-        workbook = client.open_by_key(sid)
-        sheet = workbook.worksheet(sheet_name_s)
+        sheet = _get_sheet(creds, sid, sheet_name_s)
     except Exception as e:
+        _forget_sheet(creds, sid, sheet_name_s)
         import traceback
         traceback.print_exc()
         return False, f"スプレッドシートの取得に失敗しました: {repr(e)}"
-    _defaults = {"ステータス": "未確定", "納品単価": 0, "納品金額": 0}
     data = []
     for row in rows:
         if not isinstance(row, dict):
             continue
-        data.append([_normalize_cell_value(row.get(col, _defaults.get(col, ""))) for col in LEDGER_SHEET_COLUMNS])
+        data.append(_project_row(row, _LEDGER_ROW_GETTER, _LEDGER_DEFAULTS))
     if not data:
         return True, "追記する有効な行がありません。"
     try:
-        for i in range(0, len(data), _APPEND_BATCH_SIZE):
-            chunk = data[i : i + _APPEND_BATCH_SIZE]
-            sheet.append_rows(chunk, value_input_option="USER_ENTERED")
+        _append_in_chunks(sheet, data)
     except Exception as e:
+        _forget_sheet(creds, sid, sheet_name_s)
         return False, f"追記に失敗しました: {e}"
     return True, f"{len(data)} 行を台帳に追記しました（未確定）。"
 
@@ -151,6 +310,30 @@ def _is_zero_or_empty_unit_price(val: Any) -> bool:
         return True
 
 
+def _read_ledger_columns(sheet, names: Tuple[str, ...]) -> Tuple[Dict[str, int], Dict[str, List[str]]]:
+    """
+    見出し行と names の列だけを読む（シート全体は読まない）。
+    各列は LEDGER_SHEET_COLUMNS の標準位置を 1 回の batch_get でまとめて取り、見出しで別の位置にあると分かった列だけ col_values で読み直す。
+    Returns: (見出し名 -> 0 始まりの列番号, 列名 -> 値のリスト（先頭は見出し。シートに無い列は含めない）)
+    """
+    from gspread.utils import rowcol_to_a1
+    std_cols = [LEDGER_SHEET_COLUMNS.index(n) + 1 for n in names]
+    ranges = ["1:1"] + [f"{letter}:{letter}" for letter in (rowcol_to_a1(1, c)[:-1] for c in std_cols)]
+    header_range, *columns = sheet.batch_get(ranges)
+    header = [str(h).strip() for h in (header_range[0] if header_range else [])]
+    col_name_to_idx = {h: i for i, h in enumerate(header)}
+    values: Dict[str, List[str]] = {}
+    for name, std_col, col in zip(names, std_cols, columns):
+        idx = col_name_to_idx.get(name)
+        if idx is None:
+            continue
+        if idx + 1 == std_col:
+            values[name] = [v[0] if v else "" for v in col]
+        else:
+            values[name] = [v or "" for v in sheet.col_values(idx + 1)]
+    return col_name_to_idx, values
+
+
 def fetch_ledger_rows(
     spreadsheet_id: str,
     sheet_name: str = "台帳データ",
@@ -184,40 +367,42 @@ def fetch_ledger_rows(
     except ImportError:
         return False, "gspread がインストールされていません。", []
     try:
-        client = gspread.authorize(creds)
-        workbook = client.open_by_key(sid)
-        sheet = workbook.worksheet(sheet_name_s)
+        sheet = _get_sheet(creds, sid, sheet_name_s)
         all_values = sheet.get_all_values()
     except Exception as e:
+        _forget_sheet(creds, sid, sheet_name_s)
         return False, f"スプレッドシートの取得に失敗しました: {str(e).strip() or '不明なエラー'}", []
     if not all_values or len(all_values) < 2:
         return True, "データがありません。", []
     header = [str(h).strip() for h in all_values[0]]
-    idx_confirmed = None
-    idx_delivery_date = None
-    has_status_col = "ステータス" in header
-    for i, h in enumerate(header):
-        if h == "確定フラグ":
-            idx_confirmed = i
-        if h == "納品日付":
-            idx_delivery_date = i
+    n_cols = len(header)
+    # 判定に使う列は位置で参照し、辞書は条件を満たした行だけ作る（同名列は後ろの列を採用する従来どおり）
+    col_idx = {h: i for i, h in enumerate(header)}
+    idx_confirmed = col_idx.get("確定フラグ")
+    idx_delivery_date = col_idx.get("納品日付")
+    idx_status = col_idx.get("ステータス")
+    idx_unit_price = col_idx.get("納品単価")
+    has_status_col = idx_status is not None
     def _norm_d(s: str) -> str:
         if not s:
             return ""
         return str(s).strip().replace("-", "/")
 
+    filter_dates = delivery_date_from is not None or delivery_date_to is not None
+    date_from = _norm_d(delivery_date_from) if delivery_date_from else ""
+    date_to = _norm_d(delivery_date_to) if delivery_date_to else ""
+    pad = [""] * n_cols
     rows_out: List[Dict[str, Any]] = []
     for r in all_values[1:]:
-        while len(r) < len(header):
-            r.append("")
-        row_dict = {header[i]: r[i] for i in range(len(header))}
-        status_val = (row_dict.get("ステータス") or "").strip()
+        if len(r) < n_cols:
+            r = r + pad[len(r):]
+        status_val = (r[idx_status] or "").strip() if has_status_col else ""
         if only_unconfirmed and not only_zero_unit_price:
             if has_status_col:
                 if status_val and status_val not in ("", "未確定"):
                     continue
             elif idx_confirmed is not None:
-                val = (row_dict.get("確定フラグ") or "").strip()
+                val = (r[idx_confirmed] or "").strip()
                 if val and val != "未確定":
                     continue
         if only_confirmed:
@@ -225,24 +410,24 @@ def fetch_ledger_rows(
                 if status_val not in ("確定", "請求済"):
                     continue
             elif idx_confirmed is not None:
-                val = (row_dict.get("確定フラグ") or "").strip()
+                val = (r[idx_confirmed] or "").strip()
                 if val != "確定":
                     continue
-        if delivery_date_from is not None or delivery_date_to is not None:
+        if filter_dates:
             if idx_delivery_date is None:
                 continue
-            d = _norm_d(row_dict.get("納品日付", ""))
-            if delivery_date_from and _norm_d(delivery_date_from) > d:
+            d = _norm_d(r[idx_delivery_date])
+            if date_from and date_from > d:
                 continue
-            if delivery_date_to and d > _norm_d(delivery_date_to):
+            if date_to and d > date_to:
                 continue
         if only_zero_unit_price:
-            unit_price_val = row_dict.get("納品単価", "")
+            unit_price_val = r[idx_unit_price] if idx_unit_price is not None else ""
             if not _is_zero_or_empty_unit_price(unit_price_val):
                 continue
             if has_status_col and status_val not in ("", "未確定"):
                 continue
-        rows_out.append(row_dict)
+        rows_out.append(dict(zip(header, r)))
     msg = f"{len(rows_out)} 件を取得しました。"
     if only_unconfirmed:
         msg = f"{len(rows_out)} 件の未確定行を取得しました。"
@@ -251,6 +436,42 @@ def fetch_ledger_rows(
     return True, msg, rows_out
 
 
+def _confirmed_dates_from_columns(sheet) -> Optional[set]:
+    """
+    見出し行と 納品日付・確定フラグ・ステータス の 3 列だけを 1 回の batch_get で読み、確定行の納品日付（YYYY/MM/DD）の集合を返す。
+    どれかの列が LEDGER_SHEET_COLUMNS の標準位置にない場合は None（呼び出し側で全行を読む）。
+    """
+    from gspread.utils import rowcol_to_a1
+    names = ("納品日付", "確定フラグ", "ステータス")
+    std_idx = [LEDGER_SHEET_COLUMNS.index(n) for n in names]
+    letters = [rowcol_to_a1(1, i + 1)[:-1] for i in std_idx]
+    header_range, *columns = sheet.batch_get(["1:1"] + [f"{c}:{c}" for c in letters])
+    header = [str(h).strip() for h in (header_range[0] if header_range else [])]
+    col_idx = {h: i for i, h in enumerate(header)}
+    if any(n in col_idx and col_idx[n] != i for n, i in zip(names, std_idx)):
+        return None
+    dates, flags, statuses = columns
+
+    def cell(col, r: int) -> str:
+        return str(col[r][0]).strip() if r < len(col) and col[r] else ""
+
+    has_status_col = "ステータス" in col_idx
+    has_flag_col = "確定フラグ" in col_idx
+    if "納品日付" not in col_idx:
+        return set()
+    seen: set = set()
+    for r in range(1, len(dates)):
+        if has_status_col:
+            if cell(statuses, r) not in ("確定", "請求済"):
+                continue
+        elif has_flag_col and cell(flags, r) != "確定":
+            continue
+        d = cell(dates, r).replace("-", "/")
+        if d:
+            seen.add(d)
+    return seen
+
+
 def fetch_ledger_confirmed_dates(
     spreadsheet_id: str,
     sheet_name: str = "台帳データ",
@@ -262,25 +483,39 @@ def fetch_ledger_confirmed_dates(
     返す日付は YYYY/MM/DD 形式で、新しい順（降順）にソート済み。
     Returns: (成功可否, メッセージ, 日付文字列のリスト)
     """
-    ok, msg, rows = fetch_ledger_rows(
-        spreadsheet_id,
-        sheet_name=sheet_name,
-        only_unconfirmed=False,
-        only_confirmed=True,
-        delivery_date_from=None,
-        delivery_date_to=None,
-        credentials=credentials,
-        st_secrets=st_secrets,
-    )
-    if not ok or not rows:
-        return ok, msg, []
-    seen: set = set()
-    for row in rows:
-        if not isinstance(row, dict):
-            continue
-        d = (row.get("納品日付") or "").strip().replace("-", "/")
-        if d:
-            seen.add(d)
+    sid = (spreadsheet_id or "").strip()
+    if not sid:
+        return False, "スプレッドシートIDが指定されていません。", []
+    if not _validate_spreadsheet_id(sid):
+        return False, "スプレッドシートIDの形式が正しくありません。", []
+    sheet_name_s = (sheet_name or "台帳データ").strip() or "台帳データ"
+    creds = credentials or _get_credentials(st_secrets)
+    if creds is None:
+        return False, "Google スプレッドシート用の認証が設定されていません。", []
+    try:
+        import gspread
+    except ImportError:
+        return False, "gspread がインストールされていません。", []
+    try:
+        sheet = _get_sheet(creds, sid, sheet_name_s)
+        seen = _confirmed_dates_from_columns(sheet)
+    except Exception as e:
+        _forget_sheet(creds, sid, sheet_name_s)
+        return False, f"スプレッドシートの取得に失敗しました: {str(e).strip() or '不明なエラー'}", []
+    if seen is None:
+        # 列の並びが標準と違う台帳は、全行を読んで絞り込む
+        ok, msg, rows = fetch_ledger_rows(
+            sid,
+            sheet_name=sheet_name_s,
+            only_unconfirmed=False,
+            only_confirmed=True,
+            delivery_date_from=None,
+            delivery_date_to=None,
+            credentials=creds,
+        )
+        if not ok or not rows:
+            return ok, msg, []
+        seen = {d for d in ((row.get("納品日付") or "").strip().replace("-", "/") for row in rows) if d}
     out = sorted(seen, reverse=True)
     return True, f"確定データの納品日付 {len(out)} 件（新しい順）", out
 
@@ -311,40 +546,37 @@ def update_ledger_row_by_id(
         return False, "Google スプレッドシート用の認証が設定されていません。"
     try:
         import gspread
+        from gspread.utils import rowcol_to_a1
     except ImportError:
         return False, "gspread がインストールされていません。"
     try:
-        client = gspread.authorize(creds)
-        workbook = client.open_by_key(sid)
-        sheet = workbook.worksheet(sheet_name_s)
-        all_values = sheet.get_all_values()
+        sheet = _get_sheet(creds, sid, sheet_name_s)
+        # 行の特定と納品金額の再計算に使う 2 列だけを読む
+        col_name_to_idx, columns = _read_ledger_columns(sheet, ("納品ID", "納品単価"))
     except Exception as e:
+        _forget_sheet(creds, sid, sheet_name_s)
         return False, f"スプレッドシートの取得に失敗しました: {str(e)}"
-    if not all_values or len(all_values) < 2:
+    if not col_name_to_idx:
         return False, "データがありません。"
-    header = [str(h).strip() for h in all_values[0]]
-    col_name_to_idx = {h: i for i, h in enumerate(header)}
-    id_col = "納品ID"
-    if id_col not in col_name_to_idx:
+    if "納品ID" not in columns:
         return False, "台帳に「納品ID」列がありません。"
-    id_idx = col_name_to_idx[id_col]
-    row_found = None  # 1-based row index for update_cell
-    for r in range(1, len(all_values)):
-        row = all_values[r]
-        if id_idx < len(row) and str(row[id_idx]).strip() == delivery_id_s:
+    ids = columns["納品ID"]
+    if len(ids) < 2:
+        return False, "データがありません。"
+    row_found = None  # 1-based row index
+    for r in range(1, len(ids)):
+        if str(ids[r]).strip() == delivery_id_s:
             row_found = r + 1  # gspread is 1-based
             break
     if row_found is None:
         return False, f"納品ID「{delivery_id_s}」の行が見つかりません。"
     # 数量を更新する場合は納品金額を再計算（納品金額＝納品単価×数量）
     if "数量" in updates:
-        row_data = all_values[row_found - 1]
+        prices = columns.get("納品単価", [])
         unit_price = 0.0
         try:
-            if "納品単価" in col_name_to_idx:
-                idx = col_name_to_idx["納品単価"]
-                if idx < len(row_data):
-                    unit_price = float(str(row_data[idx]).replace(",", "").strip() or 0)
+            if row_found - 1 < len(prices):
+                unit_price = float(str(prices[row_found - 1]).replace(",", "").strip() or 0)
         except (ValueError, TypeError):
             pass
         try:
@@ -356,17 +588,111 @@ def update_ledger_row_by_id(
         updates = dict(updates)
         if "納品金額" in col_name_to_idx:
             updates["納品金額"] = amount
-    for col_name, value in updates.items():
-        if col_name not in col_name_to_idx:
-            continue
-        col_idx = col_name_to_idx[col_name] + 1  # 1-based
-        try:
-            sheet.update_cell(row_found, col_idx, _normalize_cell_value(value))
-        except Exception as e:
-            return False, f"更新に失敗しました（{col_name}）: {e}"
+    # 列ごとの update_cell ではなく、1 回の values.batchUpdate でまとめて書き込む
+    data = [
+        {"range": rowcol_to_a1(row_found, col_name_to_idx[c] + 1), "values": [[_normalize_cell_value(v)]]}
+        for c, v in updates.items()
+        if c in col_name_to_idx
+    ]
+    if not data:
+        return True, "更新する項目がありません。"
+    try:
+        sheet.batch_update(data, value_input_option="USER_ENTERED")
+    except Exception as e:
+        return False, f"更新に失敗しました: {e}"
     return True, "1行を更新しました。"
 
 
+def batch_update_ledger_rows(
+    spreadsheet_id: str,
+    sheet_name: str,
+    diffs: List[Tuple[str, Dict[str, Any]]],
+    credentials=None,
+    st_secrets=None,
+) -> Tuple[bool, str, int]:
+    """
+    複数行の変更をまとめて書き込む（values.batchUpdate を1回だけ呼ぶ）。
+    diffs: [(納品ID, {列名: 値, ...}), ...]。数量を含む行は update_ledger_row_by_id と同様に納品金額を再計算する。
+    Returns: (成功可否, メッセージ, 更新行数)
+    """
+    diffs = [(str(did or "").strip(), u) for did, u in (diffs or []) if u and isinstance(u, dict)]
+    diffs = [(did, u) for did, u in diffs if did]
+    if not diffs:
+        return True, "更新する項目がありません。", 0
+    sid = (spreadsheet_id or "").strip()
+    if not sid or not _validate_spreadsheet_id(sid):
+        return False, "スプレッドシートIDが不正です。", 0
+    sheet_name_s = (sheet_name or "台帳データ").strip() or "台帳データ"
+    creds = credentials or _get_credentials(st_secrets)
+    if creds is None:
+        return False, "Google スプレッドシート用の認証が設定されていません。", 0
+    try:
+        import gspread
+        from gspread.utils import rowcol_to_a1
+    except ImportError:
+        return False, "gspread がインストールされていません。", 0
+    try:
+        sheet = _get_sheet(creds, sid, sheet_name_s)
+        col_name_to_idx, columns = _read_ledger_columns(sheet, ("納品ID", "納品単価"))
+    except Exception as e:
+        _forget_sheet(creds, sid, sheet_name_s)
+        return False, f"スプレッドシートの取得に失敗しました: {str(e)}", 0
+    if not col_name_to_idx:
+        return False, "データがありません。", 0
+    if "納品ID" not in columns:
+        return False, "台帳に「納品ID」列がありません。", 0
+    ids = columns["納品ID"]
+    if len(ids) < 2:
+        return False, "データがありません。", 0
+    id_to_row: Dict[str, int] = {}
+    for r in range(1, len(ids)):
+        if ids[r]:
+            id_to_row.setdefault(str(ids[r]).strip(), r + 1)  # 1-based
+    prices = columns.get("納品単価", [])
+    data: List[Dict[str, Any]] = []
+    missing: List[str] = []
+    updated_rows = 0
+    for did, updates in diffs:
+        row_1 = id_to_row.get(did)
+        if row_1 is None:
+            missing.append(did)
+            continue
+        if "数量" in updates and "納品金額" in col_name_to_idx:
+            unit_price = 0.0
+            try:
+                if row_1 - 1 < len(prices):
+                    unit_price = float(str(prices[row_1 - 1]).replace(",", "").strip() or 0)
+            except (ValueError, TypeError):
+                pass
+            try:
+                qty = int(float(str(updates["数量"]).replace(",", ""))) if updates.get("数量") is not None else 0
+            except (ValueError, TypeError):
+                qty = 0
+            updates = dict(updates)
+            updates["納品金額"] = max(0, int(round(unit_price * max(0, qty))))
+        cells = [
+            {"range": rowcol_to_a1(row_1, col_name_to_idx[c] + 1), "values": [[_normalize_cell_value(v)]]}
+            for c, v in updates.items()
+            if c in col_name_to_idx
+        ]
+        if cells:
+            data.extend(cells)
+            updated_rows += 1
+    if not data:
+        if missing:
+            return False, f"納品ID「{'」「'.join(missing)}」の行が見つかりません。", 0
+        return True, "更新する項目がありません。", 0
+    try:
+        resp = sheet.batch_update(data, value_input_option="USER_ENTERED")
+    except Exception as e:
+        return False, f"一括更新に失敗しました: {str(e)}", 0
+    total_cells = (resp or {}).get("totalUpdatedCells", len(data)) if isinstance(resp, dict) else len(data)
+    msg = f"{updated_rows}件の行を更新しました（{total_cells}セル）。"
+    if missing:
+        msg += f" 見つからなかった納品ID: {', '.join(missing)}"
+    return True, msg, updated_rows
+
+
 def update_ledger_rows_unit_price_bulk(
     spreadsheet_id: str,
     sheet_name: str,
@@ -408,25 +734,22 @@ def update_ledger_rows_unit_price_bulk(
         return False, "スプレッドシートIDが不正です。", 0
     sheet_name_s = (sheet_name or "台帳データ").strip() or "台帳データ"
     try:
-        client = gspread.authorize(creds)
-        workbook = client.open_by_key(sid)
-        sheet = workbook.worksheet(sheet_name_s)
-        all_values = sheet.get_all_values()
+        sheet = _get_sheet(creds, sid, sheet_name_s)
+        col_name_to_idx, columns = _read_ledger_columns(sheet, ("納品ID",))
     except Exception as e:
+        _forget_sheet(creds, sid, sheet_name_s)
         return False, f"スプレッドシートの取得に失敗しました: {str(e)}", 0
-    if not all_values or len(all_values) < 2:
+    if not col_name_to_idx:
         return False, "データがありません。", 0
-    header = [str(h).strip() for h in all_values[0]]
-    col_name_to_idx = {h: i for i, h in enumerate(header)}
-    id_col = "納品ID"
-    if id_col not in col_name_to_idx:
+    if "納品ID" not in columns:
         return False, "台帳に「納品ID」列がありません。", 0
-    id_idx = col_name_to_idx[id_col]
+    ids = columns["納品ID"]
+    if len(ids) < 2:
+        return False, "データがありません。", 0
     id_to_row: Dict[str, int] = {}
-    for r in range(1, len(all_values)):
-        row = all_values[r]
-        if id_idx < len(row) and str(row[id_idx]).strip() in ids_set:
-            id_to_row[str(row[id_idx]).strip()] = r + 1
+    for r in range(1, len(ids)):
+        if ids[r] and str(ids[r]).strip() in ids_set:
+            id_to_row[str(ids[r]).strip()] = r + 1
     cells: List[Cell] = []
     for col_key in ("納品単価", "納品金額"):
         if col_key not in col_name_to_idx:
@@ -474,11 +797,10 @@ def ensure_ledger_price_columns(
     except ImportError:
         return False, "gspread がインストールされていません。"
     try:
-        client = gspread.authorize(creds)
-        workbook = client.open_by_key(sid)
-        sheet = workbook.worksheet(sheet_name_s)
+        sheet = _get_sheet(creds, sid, sheet_name_s)
         all_values = sheet.get_all_values()
     except Exception as e:
+        _forget_sheet(creds, sid, sheet_name_s)
         return False, f"スプレッドシートの取得に失敗しました: {str(e)}"
     if not all_values:
         return False, "シートにデータがありません。"
@@ -487,10 +809,12 @@ def ensure_ledger_price_columns(
     if not missing:
         return True, "すでに「納品単価」「納品金額」列があります。"
     try:
+        from gspread.utils import rowcol_to_a1
         sheet.add_cols(len(missing))
-        for i, col_name in enumerate(missing):
-            # 1-based: 新しい列は len(header)+1 から
-            sheet.update_cell(1, len(header) + 1 + i, col_name)
+        # 1-based: 新しい列は len(header)+1 から。見出しは 1 回の update でまとめて書く
+        start = rowcol_to_a1(1, len(header) + 1)
+        end = rowcol_to_a1(1, len(header) + len(missing))
+        sheet.update(values=[missing], range_name=f"{start}:{end}", value_input_option="USER_ENTERED")
     except Exception as e:
         return False, f"列の追加に失敗しました: {str(e)}"
     return True, f"台帳に「{'」「'.join(missing)}」列を追加しました。"
@@ -505,7 +829,8 @@ def set_ledger_rows_confirmed(
 ) -> Tuple[bool, str]:
     """
     指定した納品IDの行を一括で「確定」にする（確定フラグ＝確定、確定日時＝現在時刻）。
-    シートを1回だけ読み、update_cells で一括書き込みするため 429（Read クォータ超過）を防ぐ。
+    シートを1回だけ読み、values.batchUpdate で一括書き込みするため 429（Read クォータ超過）を防ぐ。
+    連続する行はまとめて 1 つの範囲で送る（確定フラグと確定日時が隣り合う列なら 2 列まとめて送る）。
     """
     if not delivery_ids or not isinstance(delivery_ids, list):
         return True, "対象がありません。"
@@ -519,10 +844,7 @@ def set_ledger_rows_confirmed(
         return False, "Google スプレッドシート用の認証が設定されていません。"
     try:
         import gspread
-        try:
-            from gspread.cell import Cell
-        except ImportError:
-            from gspread.models import Cell  # gspread 5.x
+        from gspread.utils import rowcol_to_a1
     except ImportError:
         return False, "gspread がインストールされていません。"
     sid = (spreadsheet_id or "").strip()
@@ -530,39 +852,52 @@ def set_ledger_rows_confirmed(
         return False, "スプレッドシートIDが不正です。"
     sheet_name_s = (sheet_name or "台帳データ").strip() or "台帳データ"
     try:
-        client = gspread.authorize(creds)
-        workbook = client.open_by_key(sid)
-        sheet = workbook.worksheet(sheet_name_s)
-        all_values = sheet.get_all_values()
+        sheet = _get_sheet(creds, sid, sheet_name_s)
+        # シート全体ではなく、見出し行と納品ID列だけを読む
+        col_name_to_idx, columns = _read_ledger_columns(sheet, ("納品ID",))
     except Exception as e:
+        _forget_sheet(creds, sid, sheet_name_s)
         return False, f"スプレッドシートの取得に失敗しました: {str(e)}"
-    if not all_values or len(all_values) < 2:
+    if not col_name_to_idx:
         return False, "データがありません。"
-    header = [str(h).strip() for h in all_values[0]]
-    col_name_to_idx = {h: i for i, h in enumerate(header)}
     if "納品ID" not in col_name_to_idx or "確定フラグ" not in col_name_to_idx or "確定日時" not in col_name_to_idx:
         return False, "台帳に「納品ID」「確定フラグ」「確定日時」列が必要です。"
-    id_idx = col_name_to_idx["納品ID"]
+    ids = columns["納品ID"]
+    if len(ids) < 2:
+        return False, "データがありません。"
     col_flag = col_name_to_idx["確定フラグ"] + 1  # 1-based
     col_date = col_name_to_idx["確定日時"] + 1
     id_to_row: Dict[str, int] = {}
-    for r in range(1, len(all_values)):
-        row = all_values[r]
-        if id_idx < len(row):
-            did = str(row[id_idx]).strip()
+    for r in range(1, len(ids)):
+        if ids[r]:
+            did = str(ids[r]).strip()
             if did in ids_set:
                 id_to_row[did] = r + 1  # 1-based
     if not id_to_row:
         return False, "指定した納品IDの行が見つかりません。"
-    cells: List[Cell] = []
-    for did in ids_set:
-        row_1 = id_to_row.get(did)
-        if not row_1:
-            continue
-        cells.append(Cell(row=row_1, col=col_flag, value="確定"))
-        cells.append(Cell(row=row_1, col=col_date, value=confirmed_at))
+    # 対象行を連続する区間 [start, end] にまとめる
+    runs: List[Tuple[int, int]] = []
+    for row_1 in sorted(set(id_to_row.values())):
+        if runs and runs[-1][1] + 1 == row_1:
+            runs[-1] = (runs[-1][0], row_1)
+        else:
+            runs.append((row_1, row_1))
+    if abs(col_flag - col_date) == 1:
+        left = min(col_flag, col_date)
+        pair = ["確定", confirmed_at] if col_flag < col_date else [confirmed_at, "確定"]
+        data = [
+            {"range": f"{rowcol_to_a1(start, left)}:{rowcol_to_a1(end, left + 1)}", "values": [pair] * (end - start + 1)}
+            for start, end in runs
+        ]
+    else:
+        data = [
+            {"range": f"{rowcol_to_a1(start, col)}:{rowcol_to_a1(end, col)}", "values": [[value]] * (end - start + 1)}
+            for col, value in ((col_flag, "確定"), (col_date, confirmed_at))
+            for start, end in runs
+        ]
     try:
-        sheet.update_cells(cells)
+        # update_cells と同じく RAW（確定日時を日付値に変換させない）
+        sheet.batch_update(data, value_input_option="RAW")
     except Exception as e:
         return False, f"一括更新に失敗しました: {str(e)}"
     return True, f"{len(id_to_row)}件を確定しました。"
@@ -1,10 +1,17 @@
 """
 メール設定管理モジュール
 """
+import copy
 import json
 import os
+import threading
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Any, Optional, Dict, Tuple
+
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
 
 CONFIG_DIR = Path("config")
 EMAIL_CONFIG_FILE = CONFIG_DIR / "email_config.json"
@@ -23,14 +30,66 @@ def detect_imap_server(email_address: str) -> str:
     domain = email_address.split("@")[-1].lower() if "@" in email_address else ""
     if domain in IMAP_SERVER_MAP:
         return IMAP_SERVER_MAP[domain]
-    for key, server in IMAP_SERVER_MAP.items():
-        if key in domain:
+    # サブドメイン（mail.yahoo.co.jp など）はドットの区切りごとに親ドメインを引く
+    dot = domain.find(".")
+    while dot != -1:
+        server = IMAP_SERVER_MAP.get(domain[dot + 1:])
+        if server:
             return server
+        dot = domain.find(".", dot + 1)
     return "imap.gmail.com"
 
 def ensure_config_dir():
     CONFIG_DIR.mkdir(exist_ok=True)
 
+
+# パス -> ((st_mtime_ns, st_size), 読み込んだ内容)。ファイルが変わっていなければ読み直さない
+_json_cache: Dict[Path, Tuple[Tuple[int, int], Any]] = {}
+
+
+def _load_json_cached(path: Path) -> Any:
+    """JSON ファイルを読み込み、更新時刻とサイズが変わるまで結果を使い回す（読み取り専用）。ファイルがなければ None。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        _json_cache.pop(path, None)
+        return None
+    sig = (st.st_mtime_ns, st.st_size)
+    hit = _json_cache.get(path)
+    if hit is not None and hit[0] == sig:
+        return hit[1]
+    with open(path, 'rb') as f:
+        raw = f.read()
+    data = _orjson.loads(raw) if _orjson is not None else json.loads(raw.decode('utf-8'))
+    _json_cache[path] = (sig, data)
+    return data
+
+
+def _json_bytes(obj: Any) -> bytes:
+    """設定ファイル用の JSON（UTF-8・インデント 2）をバイト列で返す。orjson があればそちらを使う。"""
+    if _orjson is not None:
+        return _orjson.dumps(obj, option=_orjson.OPT_INDENT_2 | _orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def _atomic_write_json(path: Path, obj: Any) -> None:
+    """
+    一時ファイルに書いてから os.replace で置き換える（書き込み途中で落ちても元のファイルは壊れない）。
+    一時ファイル名はプロセス・スレッドごとに分ける。
+    """
+    ensure_config_dir()
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp_path.write_bytes(_json_bytes(obj))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
 def _get_secrets_password(st_secrets) -> str:
     """Secretsからパスワードを取得（ファイル保存とは独立）"""
     if st_secrets is None:
@@ -47,20 +106,18 @@ def load_email_config(st_secrets=None) -> Dict:
     ensure_config_dir()
     secrets_pw = _get_secrets_password(st_secrets)
 
-    if EMAIL_CONFIG_FILE.exists():
-        try:
-            with open(EMAIL_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                if config.get("email_address"):
-                    return {
-                        "imap_server": config.get("imap_server", ""),
-                        "email_address": config.get("email_address", ""),
-                        "email_password": secrets_pw,
-                        "sender_email": config.get("sender_email", ""),
-                        "days_back": config.get("days_back", 1),
-                    }
-        except Exception:
-            pass
+    try:
+        config = _load_json_cached(EMAIL_CONFIG_FILE)
+        if config and config.get("email_address"):
+            return {
+                "imap_server": config.get("imap_server", ""),
+                "email_address": config.get("email_address", ""),
+                "email_password": secrets_pw,
+                "sender_email": config.get("sender_email", ""),
+                "days_back": config.get("days_back", 1),
+            }
+    except Exception:
+        pass
     if st_secrets is not None:
         try:
             secrets = st_secrets.get("email", {})
@@ -81,32 +138,34 @@ def save_email_config(imap_server: str, email_address: str, sender_email: str, d
         return
     ensure_config_dir()
     config = {"imap_server": imap_server, "email_address": email_address, "sender_email": sender_email, "days_back": days_back}
-    with open(EMAIL_CONFIG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(config, f, ensure_ascii=False, indent=2)
+    _atomic_write_json(EMAIL_CONFIG_FILE, config)
+    _json_cache.pop(EMAIL_CONFIG_FILE, None)
 
 SENDER_RULES_FILE = CONFIG_DIR / "sender_rules.json"
 
 def load_sender_rules() -> Dict[str, Dict]:
+    return copy.deepcopy(_sender_rules())
+
+
+def _sender_rules() -> Dict[str, Dict]:
+    """キャッシュ済みの送信者ルール（読み取り専用。書き換える場合は load_sender_rules() を使う）。"""
     ensure_config_dir()
-    if SENDER_RULES_FILE.exists():
-        try:
-            with open(SENDER_RULES_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            pass
-    return {}
+    try:
+        return _load_json_cached(SENDER_RULES_FILE) or {}
+    except Exception:
+        return {}
 
 def save_sender_rules(rules: Dict[str, Dict]):
     ensure_config_dir()
-    with open(SENDER_RULES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(rules, f, ensure_ascii=False, indent=2)
+    _atomic_write_json(SENDER_RULES_FILE, rules)
+    _json_cache.pop(SENDER_RULES_FILE, None)
 
 def get_sender_rule(sender: str) -> Optional[Dict]:
-    rules = load_sender_rules()
     if not sender:
         return None
+    rules = _sender_rules()
     # Exact match first
     if sender in rules:
-        return rules[sender]
+        return copy.deepcopy(rules[sender])
     # Domain match? (Not implemented for now, maybe later)
     return None
@@ -9,7 +9,6 @@
 import json
 import re
 import time
-import google.generativeai as genai
 import streamlit as st # UIフィードバック用に一時的に維持
 from PIL import Image
 from typing import List, Dict, Optional, Any
@@ -18,10 +17,11 @@ from config_manager import (
     load_stores, auto_learn_store,
     load_items, auto_learn_item,
     load_item_settings, get_box_count_items,
-    lookup_unit, get_item_setting, add_unit_if_new,
-    get_effective_unit_size, extract_unit_size_from_spec,
+    lookup_unit, get_item_setting, add_unit_if_new, units_batch,
+    get_effective_unit_size_cached, extract_unit_size_from_spec,
     load_item_spec_master,
     get_default_spec_for_item,
+    lookup_cache,
 )
 from error_display_util import format_error_display
 from box_remainder_calc import total_to_boxes_remainder, calculate_inventory
@@ -298,6 +298,12 @@ def normalize_item_name(item_name, auto_learn=True):
         return auto_learn_item(item_name)
     return item_name
 
+@lookup_cache
+def normalize_item_name_cached(item_name):
+    """normalize_item_name（自動学習あり）のメモ化版。品目マスタの保存時に破棄される。"""
+    return normalize_item_name(item_name)
+
+
 def validate_store_name(store_name, auto_learn=True):
     if not store_name:
         return None
@@ -332,6 +338,7 @@ def _generate_content_with_retry(model, contents, max_retries=2):
     raise last_err
 
 def parse_order_image(image: Image.Image, api_key: str) -> list:
+    import google.generativeai as genai  # 読み込みが重いので解析時まで遅らせる
     genai.configure(api_key=api_key)
     # コスト優先: 2.5-flash-lite（最安）→ 2.5-flash → 1.5-pro → pro-vision
     try:
@@ -404,6 +411,7 @@ def parse_order_image(image: Image.Image, api_key: str) -> list:
 
 def parse_order_text(text: str, sender: str, subject: str, api_key: str) -> list:
     """メール本文（テキスト）を解析して注文データを抽出"""
+    import google.generativeai as genai  # 読み込みが重いので解析時まで遅らせる
     genai.configure(api_key=api_key)
     # コスト優先: 2.5-flash-lite → 2.5-flash → 1.5-pro → gemini-pro
     try:
@@ -465,6 +473,7 @@ def parse_order_text(text: str, sender: str, subject: str, api_key: str) -> list
         st.error(format_error_display(e, "テキスト解析"))
         return None
 
+@units_batch()  # 行ごとの add_unit_if_new を units.json への 1 回の書き込みにまとめる
 def validate_and_fix_order_data(order_data, auto_learn=True):
     if not order_data:
         return []
@@ -509,7 +518,7 @@ def validate_and_fix_order_data(order_data, auto_learn=True):
                 default_unit = item_setting.get("default_unit", 0)
                 if default_unit > 0:
                     unit = default_unit
-        effective_unit = get_effective_unit_size(normalized_item or item, spec_for_lookup)
+        effective_unit = get_effective_unit_size_cached(normalized_item or item, spec_for_lookup)
         item_setting_for_boxes = get_item_setting(normalized_item or item, spec_for_lookup)
         receive_as_boxes = bool(item_setting_for_boxes.get("receive_as_boxes", False))
         if effective_unit > 0 and unit > 0 and unit < effective_unit and boxes == 0 and remainder == 0:
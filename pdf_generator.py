@@ -9,7 +9,7 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.units import mm
 from reportlab.lib.colors import black, gray, white, HexColor
 from reportlab.platypus import Table, TableStyle
-from typing import List, Dict
+from typing import List, Dict, BinaryIO, Union
 import os
 
 
@@ -90,53 +90,27 @@ class LabelPDFGenerator:
         # Fallback to Regular IPAGothic to ensure characters are visible
         return 'IPAGothic' if self.font_available else 'Helvetica-Bold'
     
-    def _rearrange_labels_for_cut_and_stack(self, labels: List[Dict]) -> List[Dict]:
+    def _label_index_for_slot(self, page_idx: int, slot: int, total_pages: int) -> int:
         """
-        Cut and Stack形式用にラベルを再配置
-        
+        Cut and Stack形式で、ページ page_idx のスロット slot に置く元ラベルのインデックスを返す
+
         仕様: 各ページnにおいて、各スロットに以下のインデックスのデータを配置
         - 左上（スロット0）: n番目
         - 右上（スロット1）: n + P番目
         - 左2段目（スロット2）: n + 2P番目
         - 右2段目（スロット3）: n + 3P番目
         - ... (同様に右下まで計8スロット)
-        
-        変換式:
-        - 元のインデックスiに対して:
-          - slot = i // P (スロット番号: 0-7)
-          - page = i % P (ページ番号: 0から開始)
-        - 再配置後のインデックスj = page * 8 + slot
-        
-        Args:
-            labels: 元のラベルリスト
-            
-        Returns:
-            再配置されたラベルリスト（空のスロットは空の辞書で埋める）
+
+        変換式（P = 総ページ数）:
+        - 元のインデックスiは slot = i // P, page = i % P の位置に置かれる
+        - したがって i = slot * P + page。i が総ラベル数以上なら空きスロット
+
+        並べ替えたリストを丸ごと作らず、描画するページの分だけ参照する。
         """
-        total_labels = len(labels)
-        total_pages = (total_labels + self.LABELS_PER_PAGE - 1) // self.LABELS_PER_PAGE
-        
-        if total_pages == 0:
-            return []
-        
-        total_slots = total_pages * self.LABELS_PER_PAGE
-        
-        # 再配置後のリストを初期化（空の辞書で埋める）
-        rearranged = [{}] * total_slots
-        
-        # 元のインデックスiを、再配置後のインデックスjに変換
-        for i in range(total_labels):
-            slot = i // total_pages  # スロット番号 (0-7)
-            page = i % total_pages   # ページ番号 (0から開始)
-            # 再配置後のインデックス: ページpageのスロットslotの位置
-            j = page * self.LABELS_PER_PAGE + slot
-            if j < total_slots:
-                rearranged[j] = labels[i]
-        
-        return rearranged
+        return slot * total_pages + page_idx
     
     def generate_pdf(self, labels: List[Dict], summary_data: List[Dict], 
-                    shipment_date: str, output_path: str):
+                    shipment_date: str, output_path: Union[str, BinaryIO]):
         """
         PDFを生成（複数ページ対応 + 出荷一覧表）
         Cut and Stack形式: 裁断後に重ねるだけで順番が揃う
@@ -145,7 +119,7 @@ class LabelPDFGenerator:
             labels: ラベル情報のリスト（全ラベル）
             summary_data: 出荷一覧表用のデータ
             shipment_date: 出荷日（YYYY-MM-DD形式）
-            output_path: 出力PDFファイルパス
+            output_path: 出力PDFファイルパス、または書き込み可能なバイナリファイルオブジェクト（io.BytesIO など）
         """
         c = canvas.Canvas(output_path, pagesize=(self.A4_WIDTH, self.A4_HEIGHT))
         font_name = self._get_font_name()
@@ -161,8 +135,6 @@ class LabelPDFGenerator:
         # 出荷一覧表の後に改ページ（ラベルページと分離）
         c.showPage()
         
-        # Cut and Stack形式に再配置
-        rearranged_labels = self._rearrange_labels_for_cut_and_stack(labels)
         total_labels = len(labels)
         total_pages = (total_labels + self.LABELS_PER_PAGE - 1) // self.LABELS_PER_PAGE
         
@@ -188,11 +160,12 @@ class LabelPDFGenerator:
                 # 再配置後のインデックス: ページpage_idxのスロットslotの位置
                 rearranged_idx = page_idx * self.LABELS_PER_PAGE + slot
                 
-                # 空のスロットはスキップ（エラーを防ぐ）
-                if rearranged_idx >= len(rearranged_labels):
+                # Cut and Stack形式: このスロットに置く元ラベル（空のスロットはスキップ）
+                label_idx = self._label_index_for_slot(page_idx, slot, total_pages)
+                if label_idx >= total_labels:
                     continue
                 
-                label = rearranged_labels[rearranged_idx]
+                label = labels[label_idx]
                 
                 # 空の辞書の場合はスキップ
                 if not label or not label.get('store'):
@@ -37,6 +37,17 @@ def invalidate_cache() -> None:
     _cache["ts"] = 0.0
 
 
+def cache_timestamp() -> float:
+    """マスタキャッシュを最後にシートから取得（または保存）した時刻。未取得なら 0.0。"""
+    return _cache["ts"]
+
+
+def stage_master(rows: List[Dict[str, Any]]) -> None:
+    """シートには書かずにキャッシュだけを rows に置き換える（まとめて保存する前の途中状態を読ませるため）。"""
+    _cache["rows"] = rows
+    _cache["ts"] = time.time()
+
+
 def is_available() -> bool:
     """Sheets 接続が利用可能かどうか。"""
     return bool(_conn.get("credentials") and _conn.get("spreadsheet_id"))
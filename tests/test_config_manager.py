@@ -1,16 +1,52 @@
 """
 config_manager の規格入数抽出・有効入数ロジックの単体テスト
 """
+import json
+import os
+
 import pytest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
+import config_manager
 from config_manager import (
     extract_unit_size_from_spec,
     get_effective_unit_size,
     get_item_setting,
+    load_units,
+    lookup_unit,
+    add_unit_if_new,
+    units_batch,
+    _write_units,
+    set_units_bulk,
+    lookup_cache,
+    clear_lookup_caches,
+    load_item_spec_master,
+    invalidate_caches,
+    auto_learn_item,
+    save_items,
+    save_item_settings,
+    sheets_txn,
+    load_item_settings,
+    migrate_item_settings,
+    load_stores,
+    add_store,
+    remove_store,
+    auto_learn_store,
 )
 
 
+@pytest.fixture
+def config_tmp(tmp_path, monkeypatch):
+    """設定ファイルの置き場所をすべて tmp_path に向け、Sheets を使わない状態で前後のキャッシュを破棄する。"""
+    monkeypatch.setattr("config_manager.CONFIG_DIR", tmp_path)
+    for name in ("STORES_FILE", "ITEMS_FILE", "UNITS_FILE", "ITEM_SETTINGS_FILE", "ITEM_SPEC_MASTER_FILE"):
+        monkeypatch.setattr(f"config_manager.{name}", tmp_path / getattr(config_manager, name).name)
+    monkeypatch.setattr("config_manager._sheets_available", lambda: False)
+    invalidate_caches()
+    yield tmp_path
+    invalidate_caches()
+
+
 class TestExtractUnitSizeFromSpec:
     """規格名から入数を抽出する正規表現のテスト"""
 
@@ -79,3 +115,247 @@ class TestGetItemSettingKuwariBaraSpec:
         s = get_item_setting("胡瓜", "50本")
         assert s.get("receive_as_boxes") is True
         assert s.get("default_unit") == 50
+
+
+class TestSetUnitsBulk:
+    """入数キャッシュの一括保存: 1 回の読み書きで、値が変わらなければ書き込まない"""
+
+    @pytest.fixture
+    def units_file(self, config_tmp):
+        return config_tmp / "units.json"
+
+    def test_まとめて保存(self, units_file):
+        n = set_units_bulk([("胡瓜", "", "鎌ケ谷", 30), ("長ネギ", "2本", "五香", 50), ("春菊", "", "五香", 0)])
+        assert n == 2
+        units = load_units()
+        assert units == {"胡瓜||鎌ケ谷": 30, "長ネギ|2本|五香": 50}
+
+    def test_キーの正規化(self, units_file):
+        # 前後の空白と半角スペースだけを除く（内側の全角スペースは保存済みのキーと合わせるため残す）
+        set_units_bulk([(" 胡瓜 ", "2 本", "フレッシュ館\u3000駅前\t", 30)])
+        assert load_units() == {"胡瓜|2本|フレッシュ館\u3000駅前": 30}
+        assert lookup_unit("胡瓜", " 2本", "フレッシュ館\u3000駅 前") == 30
+
+    def test_変更なしは書き込まない(self, units_file):
+        set_units_bulk([("胡瓜", "", "鎌ケ谷", 30)])
+        with patch("config_manager.save_units") as mock_save:
+            assert set_units_bulk([("胡瓜", "", "鎌ケ谷", 30)]) == 0
+            mock_save.assert_not_called()
+
+    def test_参照はキャッシュから(self, units_file):
+        set_units_bulk([("胡瓜", "", "鎌ケ谷", 30)])
+        assert lookup_unit("胡瓜", "", "鎌ケ谷") == 30
+        with patch("config_manager._json_load") as mock_load:
+            assert lookup_unit("胡瓜", "", "鎌ケ谷") == 30
+            mock_load.assert_not_called()
+        load_units()["胡瓜||鎌ケ谷"] = 99  # 返り値を書き換えてもキャッシュは変わらない
+        assert lookup_unit("胡瓜", "", "鎌ケ谷") == 30
+
+    def test_バッチは終了時に1回だけ書き込む(self, units_file):
+        with patch("config_manager._write_units", wraps=_write_units) as mock_write:
+            with units_batch():
+                assert add_unit_if_new("胡瓜", "", "鎌ケ谷", 30)
+                assert not add_unit_if_new("胡瓜", "", "鎌ケ谷", 50)
+                assert add_unit_if_new("春菊", "", "五香", 20)
+                assert lookup_unit("春菊", "", "五香") == 20
+                mock_write.assert_not_called()
+            mock_write.assert_called_once()
+        assert load_units() == {"胡瓜||鎌ケ谷": 30, "春菊||五香": 20}
+
+
+class TestLookupCache:
+    """マスタ参照のメモ化: 同じ引数は 1 回だけ計算し、clear_lookup_caches() で破棄される"""
+
+    def test_メモ化と破棄(self):
+        calls = []
+
+        @lookup_cache
+        def f(item, spec=""):
+            calls.append((item, spec))
+            return len(calls)
+
+        assert f("胡瓜", "3本") == 1
+        assert f("胡瓜", "3本") == 1
+        assert calls == [("胡瓜", "3本")]
+        clear_lookup_caches()
+        assert f("胡瓜", "3本") == 2
+
+
+class TestMasterCache:
+    """マスタ読み込みキャッシュ: 更新がなければ再利用し、ファイルが書き換わったら読み直す"""
+
+    @pytest.fixture
+    def master_file(self, config_tmp):
+        path = config_tmp / "item_spec_master.json"
+        path.write_text(json.dumps([{"品目": "胡瓜", "規格": "3本", "default_unit": 30}], ensure_ascii=False), encoding="utf-8")
+        return path
+
+    def test_再利用とコピー(self, master_file):
+        rows = load_item_spec_master()
+        rows[0]["default_unit"] = 999
+        rows.append({"品目": "春菊"})
+        with patch("config_manager._json_load") as mock_load:
+            again = load_item_spec_master()
+            mock_load.assert_not_called()
+        assert again == [{"品目": "胡瓜", "規格": "3本", "default_unit": 30}]
+
+    def test_ファイル更新で読み直す(self, master_file):
+        load_item_spec_master()
+        master_file.write_text(json.dumps([{"品目": "春菊", "規格": "", "default_unit": 20}], ensure_ascii=False), encoding="utf-8")
+        st = master_file.stat()
+        os.utime(master_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        assert load_item_spec_master()[0]["品目"] == "春菊"
+
+
+class TestAutoLearnItem:
+    """auto_learn_item: 表記ゆれを含む品目のうちマスタで先にあるものを返し、未登録なら追加する"""
+
+    @pytest.fixture
+    def items_file(self, config_tmp):
+        path = config_tmp / "items.json"
+        items = {"ネギ": ["ネギ", "ねぎ"], "長ネギ": ["長ネギ", "長ねぎ"], "胡瓜": ["胡瓜", "きゅうり"]}
+        path.write_text(json.dumps(items, ensure_ascii=False), encoding="utf-8")
+        return path
+
+    def test_照合(self, items_file):
+        assert auto_learn_item(" きゅうり ") == "胡瓜"
+        assert auto_learn_item("胡瓜バラ") == "胡瓜"
+        # 「長ねぎ」は「ねぎ」も含むため、マスタで先にある「ネギ」になる（従来どおり）
+        assert auto_learn_item("長ねぎ") == "ネギ"
+
+    def test_未登録は追加(self, items_file):
+        assert auto_learn_item("ロマネスコ") == "ロマネスコ"
+        assert auto_learn_item("ロマネスコ") == "ロマネスコ"
+        assert json.loads(items_file.read_text(encoding="utf-8"))["ロマネスコ"] == ["ロマネスコ"]
+
+
+class TestSheetsTxn:
+    """sheets_txn: ブロック内の複数の保存を Sheets への 1 回の読み込み・1 回の書き込みにまとめる"""
+
+    def test_まとめて保存(self):
+        rows = [{"品目": "胡瓜", "規格": "", "別表記": "", "入数": 30, "単位": "本", "受信方法": "総数", "最小出荷単位": 0}]
+        sc = MagicMock()
+        sc.load_master.return_value = rows
+        sc.save_master.return_value = (True, "")
+        with patch("config_manager._sc", sc), patch("config_manager._sheets_available", return_value=True):
+            with sheets_txn():
+                save_items({"胡瓜": ["胡瓜", "きゅうり"]})
+                save_item_settings({"胡瓜": {"default_unit": 50, "unit_type": "本", "receive_as_boxes": True}})
+                sc.save_master.assert_not_called()
+        invalidate_caches()
+        sc.load_master.assert_called_once_with(force=True)
+        sc.save_master.assert_called_once()
+        saved = sc.save_master.call_args[0][0]
+        assert saved[0]["別表記"] == "きゅうり"
+        assert saved[0]["入数"] == 50 and saved[0]["受信方法"] == "箱数"
+
+
+    def test_書き換えがなければシートを読まない(self):
+        sc = MagicMock()
+        with patch("config_manager._sc", sc), patch("config_manager._sheets_available", return_value=True), \
+                patch("config_manager.invalidate_caches") as mock_invalidate:
+            with sheets_txn():
+                pass
+        sc.load_master.assert_not_called()
+        sc.save_master.assert_not_called()
+        mock_invalidate.assert_not_called()
+
+
+    def test_保存の失敗を返す(self):
+        sc = MagicMock()
+        sc.load_master.return_value = []
+        sc.save_master.return_value = (False, "保存に失敗しました: quota")
+        with patch("config_manager._sc", sc), patch("config_manager._sheets_available", return_value=True):
+            with sheets_txn() as txn:
+                save_items({"胡瓜": ["胡瓜"]})
+                with sheets_txn() as inner:
+                    assert inner is txn
+        invalidate_caches()
+        assert txn == {"ok": False, "msg": "保存に失敗しました: quota"}
+        sc.invalidate_cache.assert_called()
+
+
+class TestMigrateItemSettings:
+    """品目設定: 読み込みではファイルを書き換えず、migrate_item_settings() で補完・補正を書き戻す"""
+
+    @pytest.fixture
+    def settings_file(self, config_tmp):
+        path = config_tmp / "item_settings.json"
+        path.write_text(json.dumps({"長ネギ": {"default_unit": 1, "unit_type": "袋"}}, ensure_ascii=False), encoding="utf-8")
+        return path
+
+    def test_読み込みでは書き込まない(self, settings_file):
+        before = settings_file.read_text(encoding="utf-8")
+        assert load_item_settings()["長ネギ"]["default_unit"] == 30
+        assert settings_file.read_text(encoding="utf-8") == before
+
+    def test_移行で書き戻す(self, settings_file):
+        assert migrate_item_settings() is True
+        saved = json.loads(settings_file.read_text(encoding="utf-8"))
+        assert saved["長ネギ"] == {"default_unit": 30, "unit_type": "本", "receive_as_boxes": False}
+        assert "春菊" in saved
+        assert migrate_item_settings() is False
+
+
+class TestStores:
+    """店舗一覧: 集合で所属判定しつつ、ファイル上の順序を保つ"""
+
+    @pytest.fixture(autouse=True)
+    def stores_file(self, config_tmp):
+        path = config_tmp / "stores.json"
+        path.write_text(json.dumps({"stores": ["フレッシュ館", "本店"]}, ensure_ascii=False), encoding="utf-8")
+        return path
+
+    def test_追加と削除(self):
+        assert add_store("駅前店") is True
+        assert add_store("駅前店") is False
+        assert load_stores() == ["フレッシュ館", "本店", "駅前店"]
+        assert remove_store("本店") is True
+        assert remove_store("本店") is False
+        assert load_stores() == ["フレッシュ館", "駅前店"]
+
+    def test_自動学習は先頭の部分一致を優先(self):
+        assert auto_learn_store("  フレッシュ館 駅前  ") == "フレッシュ館"
+        assert auto_learn_store("本") == "本店"
+        assert auto_learn_store("新店") == "新店"
+        assert load_stores() == ["フレッシュ館", "本店", "新店"]
+
+
+def test_Sheetsマスタの更新でメモ化を破棄する(config_tmp, monkeypatch):
+    import sheets_config
+    from config_manager import get_effective_unit_size_cached
+
+    def sheets_rows(unit, ts):
+        monkeypatch.setitem(sheets_config._cache, "rows", [{"品目": "胡瓜", "規格": "平箱", "入数": unit, "単位": "本", "受信方法": "総数", "最小出荷単位": 0}])
+        monkeypatch.setitem(sheets_config._cache, "ts", ts)
+
+    monkeypatch.setitem(sheets_config._cache, "ttl", 10 ** 12)
+    monkeypatch.setattr("config_manager._sheets_available", lambda: True)
+    sheets_rows(30, 1.0)
+    assert get_effective_unit_size_cached("胡瓜", "平箱") == 30
+    sheets_rows(50, 2.0)  # 他のユーザーの編集を取り込んだ
+    assert get_effective_unit_size("胡瓜", "平箱") == 50
+    assert get_effective_unit_size_cached("胡瓜", "平箱") == 50
+
+
+def test_同時保存でも一時ファイルが衝突しない(config_tmp):
+    import threading
+    from config_manager import save_units
+
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(30):
+                save_units({f"胡瓜||店{n}": i})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert len(json.loads((config_tmp / "units.json").read_text(encoding="utf-8"))) == 1
+    assert not list(config_tmp.glob("*.tmp"))
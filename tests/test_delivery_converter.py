@@ -5,9 +5,12 @@ from delivery_converter import (
     v2_result_to_delivery_rows,
     v2_result_to_ledger_rows,
     ledger_rows_to_v2_format_with_units,
+    delivery_rows_to_csv_bytes,
+    reissue_delivery_ids,
     _safe_int,
     _normalize_date,
     _compute_quantity,
+    _lookup_unit_price,
 )
 
 def test_safe_int():
@@ -36,6 +39,14 @@ def test_v2_result_to_delivery_rows():
     assert row["規格"] == "Spec 1"
     assert row["数量"] == 25  # 10*2 + 5
 
+def test_lookup_unit_price():
+    prices = {("胡瓜", "3本"): 120, "胡瓜": "100", "bad": "x", "ネギ": 80, "長ネギ": 90}
+    assert _lookup_unit_price("胡瓜", "3本", prices) == 120.0
+    assert _lookup_unit_price("胡瓜", "5本", prices) == 100.0
+    assert _lookup_unit_price("長ネギバラ", "", prices) == 80.0  # 部分一致は辞書の順で最初のキー
+    assert _lookup_unit_price("bad品目", "", prices) == 0.0  # 数値にできない単価は飛ばす
+    assert _lookup_unit_price("", "", prices) == 0.0
+
 def test_v2_result_to_ledger_rows():
     v2_data = [
         {"store": "Store A", "item": "Item 1", "spec": "Spec 1", "unit": 10, "boxes": 2, "remainder": 5}
@@ -94,3 +105,22 @@ def test_compute_quantity_normal(mock_effective):
     """通常の unit*boxes+remainder（effective なし）"""
     mock_effective.return_value = 0
     assert _compute_quantity("Item", "Spec", 10, 2, 5) == 25
+
+
+def test_delivery_rows_to_csv_bytes():
+    """BOM 付き UTF-8・先頭行のキー順で出力する"""
+    rows = [{"品目": "胡瓜", "数量": 30, "備考": None}, {"品目": "ネギ", "数量": 5, "備考": "至急"}]
+    data = delivery_rows_to_csv_bytes(rows)
+    assert data.startswith(b"\xef\xbb\xbf")
+    assert data.decode("utf-8-sig").splitlines() == ["品目,数量,備考", "胡瓜,30,", "ネギ,5,至急"]
+    assert delivery_rows_to_csv_bytes([]) == b""
+
+
+def test_reissue_delivery_ids():
+    """行をコピーし、列順を保ったまま納品IDだけ新しくする"""
+    rows = [{"納品ID": "aaaaaaaa", "品目": "胡瓜"}, {"納品ID": "bbbbbbbb", "品目": "ネギ"}]
+    out = reissue_delivery_ids(rows)
+    assert [list(r) for r in out] == [["納品ID", "品目"]] * 2
+    assert [r["品目"] for r in out] == ["胡瓜", "ネギ"]
+    assert all(len(r["納品ID"]) == 8 for r in out) and out[0]["納品ID"] != out[1]["納品ID"]
+    assert rows[0]["納品ID"] == "aaaaaaaa"
@@ -0,0 +1,259 @@
+"""
+delivery_sheet_writer の台帳更新ロジックの単体テスト（gspread はモックで代替）
+"""
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import delivery_sheet_writer
+
+from delivery_sheet_writer import LEDGER_SHEET_COLUMNS, append_ledger_rows, batch_update_ledger_rows, fetch_ledger_confirmed_dates, set_ledger_rows_confirmed, update_ledger_row_by_id
+
+SID = "a" * 30
+
+
+def _ledger_values(rows):
+    return [list(LEDGER_SHEET_COLUMNS)] + [[str(r.get(c, "")) for c in LEDGER_SHEET_COLUMNS] for r in rows]
+
+
+def _column(values, col):
+    return [[r[col - 1]] if col - 1 < len(r) else [] for r in values]
+
+
+def _mock_sheet(rows):
+    values = _ledger_values(rows)
+    sheet = MagicMock()
+    sheet.get_all_values.return_value = values
+    sheet.batch_get.side_effect = lambda ranges, **kw: [
+        values[:1] if r == "1:1" else _column(values, ord(r.split(":")[0]) - ord("A") + 1) for r in ranges
+    ]
+    sheet.col_values.side_effect = lambda col: [c[0] if c else "" for c in _column(values, col)]
+    sheet.batch_update.side_effect = lambda data, **kw: {"totalUpdatedCells": len(data)}
+    client = MagicMock()
+    client.open_by_key.return_value.worksheet.return_value = sheet
+    return sheet, client
+
+
+class TestBatchUpdateLedgerRows:
+    def test_1回のbatch_updateで書き込む(self):
+        sheet, client = _mock_sheet([
+            {"納品ID": "id1", "数量": "10", "納品単価": "100"},
+            {"納品ID": "id2", "数量": "5", "納品単価": "0"},
+        ])
+        with patch("gspread.authorize", return_value=client):
+            ok, msg, n = batch_update_ledger_rows(
+                SID, "台帳データ",
+                [("id1", {"数量": 12}), ("id2", {"農家": "小島"})],
+                credentials=object(),
+            )
+        assert ok and n == 2
+        sheet.batch_update.assert_called_once()
+        data = sheet.batch_update.call_args[0][0]
+        by_range = {d["range"]: d["values"][0][0] for d in data}
+        qty_col = chr(ord("A") + LEDGER_SHEET_COLUMNS.index("数量"))
+        amount_col = chr(ord("A") + LEDGER_SHEET_COLUMNS.index("納品金額"))
+        farmer_col = chr(ord("A") + LEDGER_SHEET_COLUMNS.index("農家"))
+        assert by_range[f"{qty_col}2"] == 12
+        assert by_range[f"{amount_col}2"] == 1200  # 納品金額 = 単価 × 数量
+        assert by_range[f"{farmer_col}3"] == "小島"
+
+    def test_差分なしは書き込まない(self):
+        ok, msg, n = batch_update_ledger_rows(SID, "台帳データ", [("id1", {})], credentials=object())
+        assert ok and n == 0
+
+    def test_見つからないID(self):
+        sheet, client = _mock_sheet([{"納品ID": "id1", "数量": "1"}])
+        with patch("gspread.authorize", return_value=client):
+            ok, msg, n = batch_update_ledger_rows(SID, "台帳データ", [("nope", {"数量": 3})], credentials=object())
+        assert not ok and n == 0
+        sheet.batch_update.assert_not_called()
+
+
+class TestUpdateLedgerRowById:
+    def test_列ごとではなく1回で書き込む(self):
+        sheet, client = _mock_sheet([
+            {"納品ID": "id1", "数量": "10", "納品単価": "100"},
+            {"納品ID": "id2", "数量": "5", "納品単価": "50"},
+        ])
+        with patch("gspread.authorize", return_value=client):
+            ok, msg = update_ledger_row_by_id(
+                SID, "台帳データ", "id2", {"数量": 3, "確定フラグ": "確定", "不明な列": "x"}, credentials=object(),
+            )
+        assert ok
+        sheet.update_cell.assert_not_called()
+        sheet.batch_update.assert_called_once()
+        data = sheet.batch_update.call_args[0][0]
+        by_range = {d["range"]: d["values"][0][0] for d in data}
+        col = lambda name: chr(ord("A") + LEDGER_SHEET_COLUMNS.index(name))
+        assert by_range == {f"{col('数量')}3": 3, f"{col('確定フラグ')}3": "確定", f"{col('納品金額')}3": 150}
+
+
+class TestSheetHandleCache:
+    def test_同じ認証情報ならハンドルを使い回す(self):
+        sheet, client = _mock_sheet([{"納品ID": "id1", "数量": "1", "納品単価": "10"}])
+        creds = object()
+        with patch("gspread.authorize", return_value=client) as mock_auth:
+            assert update_ledger_row_by_id(SID, "台帳データ", "id1", {"数量": 2}, credentials=creds)[0]
+            assert update_ledger_row_by_id(SID, "台帳データ", "id1", {"数量": 3}, credentials=creds)[0]
+        mock_auth.assert_called_once()
+        client.open_by_key.assert_called_once()
+
+    def test_取得失敗でハンドルを捨てる(self):
+        sheet, client = _mock_sheet([{"納品ID": "id1", "数量": "1"}])
+        ok_batch_get = sheet.batch_get.side_effect
+        sheet.batch_get.side_effect = [RuntimeError("gone"), ok_batch_get(["1:1", "J:J", "K:K"])]
+        creds = object()
+        with patch("gspread.authorize", return_value=client):
+            assert not update_ledger_row_by_id(SID, "台帳データ", "id1", {"数量": 2}, credentials=creds)[0]
+            assert update_ledger_row_by_id(SID, "台帳データ", "id1", {"数量": 2}, credentials=creds)[0]
+        assert client.open_by_key.call_count == 2
+
+
+class TestAppendLedgerRows:
+    def test_列順と既定値(self):
+        sheet, client = _mock_sheet([])
+        with patch("gspread.authorize", return_value=client):
+            ok, msg = append_ledger_rows(SID, [{"品目": "胡瓜", "数量": 30, "チェック": None}], credentials=object())
+        assert ok
+        (values,), kw = sheet.append_rows.call_args
+        row = dict(zip(LEDGER_SHEET_COLUMNS, values[0]))
+        assert row["品目"] == "胡瓜" and row["数量"] == 30 and row["チェック"] == ""
+        assert row["ステータス"] == "未確定" and row["納品単価"] == 0 and row["納品日付"] == ""
+
+
+class TestSetLedgerRowsConfirmed:
+    def test_連続する行を1つの範囲にまとめる(self):
+        sheet, client = _mock_sheet([{"納品ID": f"id{i}"} for i in range(1, 6)])
+        with patch("gspread.authorize", return_value=client):
+            ok, msg = set_ledger_rows_confirmed(SID, "台帳データ", ["id1", "id2", "id3", "id5", "nope"], credentials=object())
+        assert ok and msg.startswith("4件")
+        sheet.batch_update.assert_called_once()
+        data = sheet.batch_update.call_args[0][0]
+        assert sheet.batch_update.call_args[1]["value_input_option"] == "RAW"
+        flag = chr(ord("A") + LEDGER_SHEET_COLUMNS.index("確定フラグ"))
+        date = chr(ord("A") + LEDGER_SHEET_COLUMNS.index("確定日時"))
+        assert [d["range"] for d in data] == [f"{flag}2:{date}4", f"{flag}6:{date}6"]
+        assert all(v[0] == "確定" for d in data for v in d["values"])
+        assert len(data[0]["values"]) == 3
+
+    def test_納品ID列が標準位置にない場合は列を読み直す(self):
+        header = ["納品ID", "確定フラグ", "確定日時"]
+        values = [header, ["id1", "", ""], ["id2", "", ""]]
+        sheet = MagicMock()
+        sheet.batch_get.return_value = [[header], [["確定日時"]]]  # 標準位置（J列）は別の列
+        sheet.col_values.return_value = ["納品ID", "id1", "id2"]
+        client = MagicMock()
+        client.open_by_key.return_value.worksheet.return_value = sheet
+        with patch("gspread.authorize", return_value=client):
+            ok, msg = set_ledger_rows_confirmed(SID, "台帳データ", ["id2"], credentials=object())
+        assert ok
+        sheet.col_values.assert_called_once_with(1)
+        sheet.get_all_values.assert_not_called()
+        assert [d["range"] for d in sheet.batch_update.call_args[0][0]] == ["B3:C3"]
+
+
+class TestGetCredentials:
+    def test_同じsecretsなら作り直さない(self, monkeypatch):
+        monkeypatch.delenv("GOOGLE_APPLICATION_CREDENTIALS", raising=False)
+        monkeypatch.setattr(delivery_sheet_writer, "_credentials_cache", {})
+        secrets = {"gcp": {"client_email": "a@example.com", "private_key": "k1"}}
+        with patch("google.oauth2.service_account.Credentials.from_service_account_info", side_effect=lambda info, scopes: object()) as mock_from:
+            first = delivery_sheet_writer._get_credentials(secrets)
+            assert delivery_sheet_writer._get_credentials({"gcp": dict(secrets["gcp"])}) is first
+            mock_from.assert_called_once()
+            rotated = delivery_sheet_writer._get_credentials({"gcp": {"client_email": "a@example.com", "private_key": "k2"}})
+        assert rotated is not first
+
+    def test_裏でのトークン更新を有効にする(self, monkeypatch):
+        monkeypatch.delenv("GOOGLE_APPLICATION_CREDENTIALS", raising=False)
+        monkeypatch.setattr(delivery_sheet_writer, "_credentials_cache", {})
+        creds = MagicMock()
+        with patch("google.oauth2.service_account.Credentials.from_service_account_info", return_value=creds):
+            assert delivery_sheet_writer._get_credentials({"gcp": {"client_email": "a@example.com", "private_key": "k"}}) is creds
+        creds.with_non_blocking_refresh.assert_called_once_with()
+
+    def test_鍵ファイルは更新されるまで読み直さない(self, monkeypatch, tmp_path):
+        keyfile = tmp_path / "key.json"
+        keyfile.write_text("{}")
+        monkeypatch.setenv("GOOGLE_APPLICATION_CREDENTIALS", str(keyfile))
+        monkeypatch.setattr(delivery_sheet_writer, "_credentials_cache", {})
+        with patch("google.oauth2.service_account.Credentials.from_service_account_file", side_effect=lambda path, scopes: object()) as mock_from:
+            first = delivery_sheet_writer._get_credentials()
+            assert delivery_sheet_writer._get_credentials() is first
+            keyfile.write_text('{"rotated": 1}')
+            assert delivery_sheet_writer._get_credentials() is not first
+            monkeypatch.setenv("GOOGLE_APPLICATION_CREDENTIALS", str(tmp_path))  # ディレクトリは鍵ファイルとみなさない
+            assert delivery_sheet_writer._get_credentials() is None
+        assert mock_from.call_count == 2
+
+
+class TestFetchLedgerConfirmedDates:
+    def test_3列だけ読む(self):
+        rows = [
+            {"納品日付": "2026-01-02", "ステータス": "確定"},
+            {"納品日付": "2026/01/03", "ステータス": "請求済"},
+            {"納品日付": "2026/01/02", "ステータス": "確定"},
+            {"納品日付": "2026/01/04", "ステータス": "未確定"},
+        ]
+        values = _ledger_values(rows)
+        sheet = MagicMock()
+        letters = {chr(ord("A") + LEDGER_SHEET_COLUMNS.index(n)): LEDGER_SHEET_COLUMNS.index(n) + 1 for n in ("納品日付", "確定フラグ", "ステータス")}
+        sheet.batch_get.side_effect = lambda ranges, **kw: [values[:1]] + [_column(values, letters[r.split(":")[0]]) for r in ranges[1:]]
+        client = MagicMock()
+        client.open_by_key.return_value.worksheet.return_value = sheet
+        with patch("gspread.authorize", return_value=client):
+            ok, msg, dates = fetch_ledger_confirmed_dates(SID, credentials=object())
+        assert ok and dates == ["2026/01/03", "2026/01/02"]
+        sheet.get_all_values.assert_not_called()
+
+
+def test_normalize_cell_value():
+    import numpy as np
+    norm = delivery_sheet_writer._normalize_cell_value
+    assert norm("a") == "a" and norm(3) == 3 and norm(1.5) == 1.5
+    assert norm(None) == ""
+    assert norm(True) == "true" and norm(False) == "false"
+    assert norm(np.float64(2.5)) == 2.5 and type(norm(np.float64(2.5))) is np.float64  # float のサブクラスはそのまま
+    assert norm(np.int64(7)) == "7"
+
+
+def test_append_batch_rows(monkeypatch):
+    monkeypatch.delenv("SHEETS_APPEND_BATCH_ROWS", raising=False)
+    rows = lambda width: [["胡瓜" * width] * 13] * 3
+    assert delivery_sheet_writer._append_batch_rows(rows(1)) == 5000  # 小さい行は上限で頭打ち
+    assert delivery_sheet_writer._append_batch_rows(rows(2000)) == 50  # 大きい行は下限
+    assert 50 < delivery_sheet_writer._append_batch_rows(rows(40)) < 5000
+    monkeypatch.setenv("SHEETS_APPEND_BATCH_ROWS", "300")
+    assert delivery_sheet_writer._append_batch_rows(rows(1)) == 300
+
+
+class TestRetry:
+    @staticmethod
+    def _error(status):
+        e = RuntimeError(f"HTTP {status}")
+        e.response = MagicMock(status_code=status)
+        return e
+
+    def test_429と5xxは待って再送する(self):
+        fn = MagicMock(side_effect=[self._error(429), self._error(503), "ok"])
+        with patch("delivery_sheet_writer.time.sleep") as mock_sleep:
+            assert delivery_sheet_writer._retry(fn, 1, a=2) == "ok"
+        assert fn.call_count == 3 and fn.call_args == ((1,), {"a": 2})
+        waits = [c[0][0] for c in mock_sleep.call_args_list]
+        assert 1 <= waits[0] < 2 and 2 <= waits[1] < 3
+
+    def test_再送しないエラー(self):
+        for fn, kw in (
+            (MagicMock(side_effect=self._error(403)), {}),
+            (MagicMock(side_effect=self._error(500)), {"_retry_server_errors": False}),  # 追記は 5xx で送り直さない
+        ):
+            with patch("delivery_sheet_writer.time.sleep") as mock_sleep, pytest.raises(RuntimeError):
+                delivery_sheet_writer._retry(fn, **kw)
+            fn.assert_called_once()
+            mock_sleep.assert_not_called()
+
+    def test_回数の上限で諦める(self):
+        fn = MagicMock(side_effect=self._error(429))
+        with patch("delivery_sheet_writer.time.sleep"), pytest.raises(RuntimeError):
+            delivery_sheet_writer._retry(fn)
+        assert fn.call_count == delivery_sheet_writer._RETRY_MAX_ATTEMPTS
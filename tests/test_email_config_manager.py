@@ -0,0 +1,27 @@
+"""
+email_config_manager の単体テスト
+"""
+import pytest
+
+import email_config_manager
+from email_config_manager import detect_imap_server, load_sender_rules, save_sender_rules
+
+
+def test_detect_imap_server():
+    assert detect_imap_server("a@Yahoo.co.jp") == "imap.mail.yahoo.com"
+    assert detect_imap_server("a@mail.yahoo.co.jp") == "imap.mail.yahoo.com"  # サブドメインは親ドメインで判定
+    assert detect_imap_server("a@x.y.icloud.com") == "imap.mail.me.com"
+    assert detect_imap_server("a@home.com") == "imap.gmail.com"  # me.com を部分一致で拾わない
+    assert detect_imap_server("a@example.jp") == "imap.gmail.com"
+    assert detect_imap_server("") == "imap.gmail.com" and detect_imap_server("no-at") == "imap.gmail.com"
+
+
+def test_送信者ルールの保存は置き換えで行う(tmp_path, monkeypatch):
+    monkeypatch.setattr(email_config_manager, "CONFIG_DIR", tmp_path)
+    monkeypatch.setattr(email_config_manager, "SENDER_RULES_FILE", tmp_path / "sender_rules.json")
+    save_sender_rules({"a@example.com": {"store": "本店"}})
+    monkeypatch.setattr(email_config_manager, "_json_bytes", lambda obj: 1 / 0)  # 書き込み途中の失敗
+    with pytest.raises(ZeroDivisionError):
+        save_sender_rules({})
+    assert load_sender_rules() == {"a@example.com": {"store": "本店"}}
+    assert [p.name for p in tmp_path.iterdir()] == ["sender_rules.json"]